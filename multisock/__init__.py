@@ -17,9 +17,17 @@
 
 from multisock.channel import Channel
 from multisock.crypter import Crypter
+from multisock.compression import Compressor
+from multisock.pacing import Pacer
+from multisock.asyncchannel import AsyncChannel
+from multisock.pipeline import DecodePipeline
+from multisock.sharding import ShardedChannel
+from multisock.state import StatePublisher, StateSubscriber
+from multisock.capture import Recorder, Replayer
 
 # The list of components implicitly imported by library
-__all__ = ['Channel', 'Crypter']
+__all__ = ['Channel', 'Crypter', 'Compressor', 'Pacer', 'AsyncChannel', 'DecodePipeline', 'ShardedChannel',
+           'StatePublisher', 'StateSubscriber', 'Recorder', 'Replayer']
 
 version = "1.1.0"
 version_info = (1, 1, 0, 0)
\ No newline at end of file
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: asyncchannel.py
+Implements an asyncio flavour of the multicast channel. The sockets are served by the
+running event loop (through loop.create_datagram_endpoint) so that a single thread can
+listen on many multicast groups at once.
+
+#### THE CONSUMER ####
+import multisock
+async with multisock.AsyncChannel('224.1.1.1', 1234) as udpchan:
+    async for (data, sender) in udpchan:
+        print("Received from %s: %s" % (sender, data))
+
+#### THE PRODUCER ####
+import multisock
+async with multisock.AsyncChannel('224.1.1.1', 1234) as udpchan:
+    await udpchan.send('Hello World')
+"""
+
+import asyncio
+from multisock.channel import Channel
+from multisock.exceptions import DecryptionException
+
+
+class _ReaderProtocol(asyncio.DatagramProtocol):
+    """
+    Pushes the datagrams received by the event loop into the channel queue.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def datagram_received(self, data, addr):
+        try:
+            self.channel._queue.put_nowait((data, addr))
+        except asyncio.QueueFull:
+            # Same semantic of a full socket buffer: the datagram is lost
+            self.channel.logger.debug('Dropping datagram from %s: queue full' % (addr,))
+
+    def error_received(self, exc):
+        self.channel.logger.warning('Error on %s: %s' % (self.channel, exc))
+
+    def connection_lost(self, exc):
+        self.channel._wakeup()
+
+
+class _WriterProtocol(asyncio.DatagramProtocol):
+    """
+    In dual socket mode the writer is a member of the group too: incoming data is simply discarded.
+    """
+    pass
+
+
+class AsyncChannel(Channel):
+    """
+    Creates a new udp multicast channel whose primitives are coroutines:
+    - await send/recv: by using buffers of data (bytes or more simply strings)
+    - await send_object/recv_object: by using picklable objects
+    - await send_many/send_objects_many/send_raw: by sending many datagrams at once
+    - async for (data, addr) in channel: iterates on received data
+
+    Encryption and serialization behave exactly as for the Channel (extra keyword
+    parameters are passed to the Channel constructor).
+    The additional parameter queue_size bounds the number of received datagrams
+    waiting to be consumed (0 means unbounded); exceeding datagrams are dropped.
+    The event loop reads the sockets, thus stats() does not report the kernel drops.
+    Coalescing, the reliable mode, the pacing, the background reception and the shared
+    sockets (the coalesce, reliable, pacer, background and shared parameters) are not
+    supported: the event loop owns the sockets.
+
+    The sockets are attached to the running event loop by open() that is
+    implicitly invoked on first usage or when entering the 'async with' block.
+    The blocking receive methods of the Channel (recv_many, recv_into, dispatch...)
+    raise NotImplementedError: they would steal the datagrams of the event loop.
+    """
+
+    def __init__(self, mcast_ip, mcast_port, bufsize=4096, iface_ip=None, crypto=None, queue_size=0, **kwargs):
+        if kwargs.get('coalesce') is not None:
+            raise ValueError('AsyncChannel does not support coalescing')
+        if kwargs.get('reliable'):
+            raise ValueError('AsyncChannel does not support the reliable mode')
+        if kwargs.get('pacer') is not None:
+            raise ValueError('AsyncChannel does not support pacing')
+        if kwargs.get('background'):
+            raise ValueError('AsyncChannel does not support the background reception')
+        if kwargs.get('shared'):
+            raise ValueError('AsyncChannel does not support shared sockets')
+        super().__init__(mcast_ip, mcast_port, bufsize, iface_ip, crypto, **kwargs)
+        self.reader.setblocking(0)
+        self.writer.setblocking(0)
+        self._queue = asyncio.Queue(queue_size)
+        self._loop = None
+        self._reader_transport = None
+        self._writer_transport = None
+        self._closed = False
+
+    def __repr__(self):
+        return 'AsyncMulticastCh<%s:%d>' % (self.mcast_ip, self.mcast_port)
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        msg = await self.recv()
+        if msg is None:
+            raise StopAsyncIteration
+        return msg
+
+    async def open(self):
+        """
+        Attaches the channel sockets to the running event loop.
+        """
+        if self._reader_transport is None and not self._closed:
+            loop = self._loop = asyncio.get_running_loop()
+            self._reader_transport, _ = await loop.create_datagram_endpoint(
+                lambda: _ReaderProtocol(self), sock=self.reader)
+            if self.writer is self.reader:
+                self._writer_transport = self._reader_transport
+            else:
+                self._writer_transport, _ = await loop.create_datagram_endpoint(
+                    _WriterProtocol, sock=self.writer)
+        return self
+
+    def set_read_blocking(self, blocking=True):
+        """
+        Not supported: asynchronous channels never block the event loop.
+        """
+        raise NotImplementedError('AsyncChannel sockets are always non blocking')
+
+    def recv_many(self, max_msgs=64, timeout=None):
+        """
+        Not supported: the event loop owns the reader (see recv).
+        """
+        raise NotImplementedError('AsyncChannel receives with await recv()')
+
+    def recv_objects_many(self, max_msgs=64, timeout=None):
+        """
+        Not supported: the event loop owns the reader (see recv_object).
+        """
+        raise NotImplementedError('AsyncChannel receives with await recv_object()')
+
+    def recv_into(self, buffer):
+        """
+        Not supported: the event loop owns the reader (see recv).
+        """
+        raise NotImplementedError('AsyncChannel receives with await recv()')
+
+    def recv_view(self):
+        """
+        Not supported: the event loop owns the reader (see recv).
+        """
+        raise NotImplementedError('AsyncChannel receives with await recv()')
+
+    def recv_with_meta(self):
+        """
+        Not supported: the event loop owns the reader (see recv).
+        """
+        raise NotImplementedError('AsyncChannel receives with await recv()')
+
+    def recv_object_with_meta(self):
+        """
+        Not supported: the event loop owns the reader (see recv_object).
+        """
+        raise NotImplementedError('AsyncChannel receives with await recv_object()')
+
+    def dispatch(self, max_msgs=64, timeout=None):
+        """
+        Not supported: the event loop owns the reader (see iter_objects).
+        """
+        raise NotImplementedError('AsyncChannel receives with await recv_object()')
+
+    def close(self):
+        """
+        Closes the connection to the multicast group.
+        Pending and future receivers are woken up with None.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._reader_transport is None:
+            super().close()
+            self._wakeup()
+            return
+        if self._fec_encoder is not None:
+            self._flush_parity()
+            self._fec_encoder.close()
+        try:
+            self._reader_transport.close()
+        finally:
+            if self._writer_transport is not self._reader_transport:
+                self._writer_transport.close()
+
+    async def _next_message(self):
+        await self.open()
+        while True:
+            if self._backlog:
+                return self._backlog.popleft()
+            if self._closed and self._queue.empty():
+                return None
+            datagram = await self._queue.get()
+            if datagram is None:
+                # Let any other waiting consumer know the channel is gone
+                self._wakeup()
+                return None
+            data, addr = datagram
+            message = self._accept(data, addr)
+            if message is not None:
+                return message, addr
+
+    async def _receive(self, decoder):
+        while True:
+            received = await self._next_message()
+            if received is None:
+                return None
+            message, addr = received
+            try:
+                return decoder(message), addr
+            except DecryptionException as ex:
+                self._reject(addr, ex)
+            except Exception:
+                self.metrics.decode_errors += 1
+                raise
+
+    def _transmit(self, data, dest=None):
+        metrics = self.metrics
+        metrics.messages_sent += 1
+        for datagram in self._protect(self._datagrams(data), dest):
+            self._writer_transport.sendto(datagram, dest or (self.mcast_ip, self.mcast_port))
+            metrics.datagrams_sent += 1
+            metrics.bytes_sent += len(datagram)
+        if self._next_report is not None:
+            self._report()
+
+    def _send_batch(self, datagrams, dest=None):
+        if self._writer_transport is None:
+            return super()._send_batch(datagrams, dest)
+        # the transport buffers what the socket cannot take yet, in order
+        for datagram in datagrams:
+            self._writer_transport.sendto(datagram, dest or (self.mcast_ip, self.mcast_port))
+        self.metrics.datagrams_sent += len(datagrams)
+        self.metrics.bytes_sent += sum(len(datagram) for datagram in datagrams)
+        if self._next_report is not None:
+            self._report()
+        return len(datagrams)
+
+    def _flush_parity(self):
+        if self._writer_transport is None:
+            return super()._flush_parity()
+        for (dest, parity) in self._fec_encoder.flush():
+            for datagram in parity:
+                self._writer_transport.sendto(datagram, dest or (self.mcast_ip, self.mcast_port))
+                self.metrics.datagrams_sent += 1
+                self.metrics.bytes_sent += len(datagram)
+
+    def _send_parity(self, parity, dest=None):
+        if self._writer_transport is None:
+            return super()._send_parity(parity, dest)
+        # invoked by the FEC thread: the transport belongs to the event loop
+        self._loop.call_soon_threadsafe(self._send_batch, parity, dest)
+
+    def _wakeup(self):
+        # The closing marker must not be lost even if the queue is full
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def send_object(self, obj, codec=None, topic=None):
+        """
+        Sends an object on the channel.
+        The optional codec overrides the channel codec for this object.
+        The optional topic travels in the frame header (see Channel.subscribe).
+        """
+        await self.open()
+        self._transmit(self._encode_object(obj, codec, topic))
+
+    async def recv_object(self):
+        """
+        Waits for an object from the channel and returns a couple
+            (data,addr)
+        where addr is the sender address.
+        Returns None once the channel has been closed.
+        """
+        return await self._receive(self._decode_object)
+
+    async def send(self, data, topic=None):
+        """
+        Sends data on the channel.
+        The optional topic travels in the frame header (see Channel.subscribe).
+        """
+        await self.open()
+        self._transmit(self._encode(data, topic))
+
+    async def recv(self):
+        """
+        Waits for data from the channel and returns a couple
+            (data,addr)
+        where addr is the sender address.
+        Returns None once the channel has been closed.
+        """
+        return await self._receive(self._decode)
+
+    async def send_many(self, iterable, topic=None):
+        """
+        Sends every element of iterable as a separate datagram on the channel.
+        Returns the number of datagrams sent.
+        """
+        await self.open()
+        return self._transmit_many([self._encode(data, topic) for data in iterable])
+
+    async def send_objects_many(self, iterable, codec=None, topic=None):
+        """
+        Sends every object of iterable as send_object does.
+        Returns the number of datagrams sent.
+        """
+        await self.open()
+        return self._transmit_many([self._encode_object(obj, codec, topic) for obj in iterable])
+
+    async def send_raw(self, datagrams):
+        """
+        Sends a list of datagrams already encoded as they are (see Channel.send_raw).
+        Returns the number of datagrams sent.
+        """
+        await self.open()
+        return self._send_batch(datagrams)
+
+    async def iter_objects(self):
+        """
+        Asynchronous generator of the (obj,addr) couples received until the channel is closed.
+        """
+        while True:
+            msg = await self.recv_object()
+            if msg is None:
+                return
+            yield msg
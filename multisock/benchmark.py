@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: benchmark.py
+The throughput and latency benchmark of the channels over loopback multicast.
+
+    python -m multisock.benchmark --output results.json
+
+For every combination of operation (send/recv, send_object/recv_object), crypter,
+payload size and number of concurrent senders, the sender processes blast their messages
+on the group while this process receives them: the run reports the messages and bytes
+received per second, the messages lost and the percentiles of the one-way latency
+(senders stamp their messages with the send time, see latency.py).
+Unpaced senders measure the max throughput, and their latency is mostly the time spent
+in the queues; --rate paces every sender to measure the latency below saturation.
+--loss drops that fraction of the datagrams on their arrival: with --reliable (see
+nack.py) the messages received per second are the goodput of the retransmissions.
+--pace paces every sender with a Pacer (see pacing.py) instead of the sleeps of --rate.
+By default the senders are send-only timestamped channels and the receiver reads a single
+socket; --legacy runs the channels as created by default instead (two sockets each, no
+binary frames unless the crypter needs them, no timestamps): the latency is then not
+measured, only the throughput.
+The Crypter alone (encryption and decryption, no sockets) is measured as well.
+
+Results are written as JSON (see run_suite for the layout) to compare releases.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import platform
+import random
+import socket
+import sys
+import time
+import multisock
+from multisock.channel import Channel, SOCKET_MODE_DUAL, SOCKET_MODE_SINGLE, SOCKET_MODE_SEND_ONLY
+from multisock.crypter import Crypter, MODE_CBC, MODE_GCM, MODE_CHACHA20
+from multisock.latency import LatencyHistogram, PERCENTILES
+from multisock.pacing import Pacer
+
+DEFAULT_GROUP = '224.1.1.1'
+DEFAULT_PORT = 1280
+DEFAULT_BUFSIZE = 4096
+DEFAULT_COUNT = 5000
+DEFAULT_SENDERS = (1, 2, 4)
+DEFAULT_CRYPTO = ('none', MODE_CBC)
+OPERATIONS = ('data', 'object')
+# room for the frame header, the extensions, the serialization and the encryption
+OVERHEAD = 128
+# growth of the payloads in the legacy format: two base64 passes (4/3 each)
+LEGACY_EXPANSION = (16, 9)
+IDLE_TIMEOUT = 1.0
+# How long reliable senders keep serving the NACKs once done
+REPAIR_LINGER = 0.5
+RCVBUF = 16 * 1024 * 1024
+KEY = 'benchmark'
+PASSPHRASE = 'passphrase'
+
+
+def default_sizes(bufsize, legacy=False):
+    # the legacy format encodes objects twice in base64 (pickle, base64, AES, base64)
+    largest = (bufsize * LEGACY_EXPANSION[1] // LEGACY_EXPANSION[0] if legacy else bufsize) - OVERHEAD
+    sizes = []
+    size = 16
+    while size < largest:
+        sizes.append(size)
+        size *= 4
+    sizes.append(largest)
+    return sizes
+
+
+def make_crypter(mode):
+    return None if mode == 'none' else Crypter(KEY, PASSPHRASE, mode=mode)
+
+
+class LossyChannel(Channel):
+    """
+    A channel dropping a random fraction (loss) of the datagrams it receives.
+    """
+
+    def __init__(self, *args, loss=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loss = loss
+        self.dropped = 0
+
+    def _accept(self, data, addr, arrival_ns=None):
+        if self.loss and random.random() < self.loss:
+            self.dropped += 1
+            return None
+        return super()._accept(data, addr, arrival_ns)
+
+
+def _sender(group, port, bufsize, operation, crypto_mode, size, count, rate, reliable, pace, legacy, start):
+    channel = Channel(group, port, bufsize, '0.0.0.0', make_crypter(crypto_mode),
+                      socket_mode=SOCKET_MODE_DUAL if legacy else SOCKET_MODE_SEND_ONLY, timestamped=not legacy,
+                      reliable=reliable, pacer=Pacer(packets_per_sec=pace) if pace else None)
+    payload = bytes(size)
+    send = channel.send_object if operation == 'object' else channel.send
+    start.wait()
+    if rate:
+        interval = 1.0 / rate
+        deadline = time.perf_counter()
+        for _ in range(count):
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            send(payload)
+            deadline += interval
+    else:
+        for _ in range(count):
+            send(payload)
+    if reliable:
+        # announces the tail of the burst, repaired while lingering
+        channel.flush()
+        time.sleep(REPAIR_LINGER)
+    channel.close()
+
+
+def run_channel(operation, crypto_mode, size, senders, count, rate=0, group=DEFAULT_GROUP, port=DEFAULT_PORT,
+                bufsize=DEFAULT_BUFSIZE, loss=0.0, reliable=False, pace=0, legacy=False):
+    """
+    Runs a single combination and returns its result (a dict). rate is the messages
+    per second of every sender (0: as fast as possible), loss the fraction of the
+    datagrams dropped by the receiver, reliable selects the reliable mode, pace is
+    the datagrams per second of the Pacer of every sender (0: none) and legacy runs
+    the channels in their default configuration (no latency measured).
+    """
+    receiver = LossyChannel(group, port, bufsize, '0.0.0.0', make_crypter(crypto_mode),
+                            socket_mode=SOCKET_MODE_DUAL if legacy else SOCKET_MODE_SINGLE, reliable=reliable,
+                            loss=loss)
+    try:
+        receiver.reader.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+    except OSError:
+        pass
+    receiver.reader.settimeout(IDLE_TIMEOUT)
+    recv = receiver.recv_object if operation == 'object' else receiver.recv
+    start = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=_sender,
+                                         args=(group, port, bufsize, operation, crypto_mode, size, count, rate,
+                                               reliable, pace, legacy, start))
+                 for _ in range(senders)]
+    for process in processes:
+        process.start()
+    # the senders are waiting: let their channels come up
+    time.sleep(0.2)
+    start.set()
+    expected = senders * count
+    received = 0
+    errors = 0
+    first = last = None
+    try:
+        while received < expected:
+            try:
+                message = recv()
+            except socket.timeout:
+                break
+            except Exception as ex:
+                # e.g. datagrams truncated to bufsize: counted as lost
+                errors += 1
+                receiver.logger.debug('Benchmark message not decoded: %s' % ex)
+                continue
+            if message is None:
+                break
+            last = time.perf_counter()
+            if first is None:
+                first = last
+            received += 1
+    finally:
+        for process in processes:
+            process.join()
+        stats = receiver.stats()
+        receiver.close()
+    latency = LatencyHistogram()
+    for histogram in receiver.latency.histograms.values():
+        latency.merge(histogram)
+    # the first message marks the start: it does not count for the rate
+    seconds = (last - first) if received > 1 else 0.0
+    throughput = (received - 1) / seconds if seconds > 0 else 0.0
+    return {
+        'operation': operation,
+        'crypto': crypto_mode,
+        'size': size,
+        'senders': senders,
+        'rate': rate,
+        'loss': loss,
+        'reliable': reliable,
+        'pace': pace,
+        'legacy': legacy,
+        'sent': expected,
+        'received': received,
+        'lost': expected - received,
+        'errors': errors,
+        'kernel_drops': stats['kernel_drops'],
+        'dropped': receiver.dropped,
+        'nacks_sent': stats['nack_sent'],
+        'repaired': stats['nack_repaired'],
+        'seconds': seconds,
+        'messages_per_sec': throughput,
+        'bytes_per_sec': throughput * size,
+        'latency_ns': latency.snapshot(),
+    }
+
+
+def run_crypter(crypto_mode, size, count):
+    """
+    Measures the encryption and decryption (as done by framed channels) of count payloads.
+    """
+    crypto = make_crypter(crypto_mode)
+    payload = bytes(size)
+    aad = bytes(10)
+    begin = time.perf_counter()
+    sealed = [crypto.encrypt_raw(payload, aad) for _ in range(count)]
+    encrypted = time.perf_counter()
+    for data in sealed:
+        crypto.decrypt_raw(data, aad)
+    decrypted = time.perf_counter()
+    return {
+        'crypto': crypto_mode,
+        'size': size,
+        'encrypt_per_sec': count / (encrypted - begin),
+        'decrypt_per_sec': count / (decrypted - encrypted),
+    }
+
+
+def run_suite(operations=OPERATIONS, crypto_modes=DEFAULT_CRYPTO, sizes=None, senders=DEFAULT_SENDERS,
+              count=DEFAULT_COUNT, rate=0, group=DEFAULT_GROUP, port=DEFAULT_PORT, bufsize=DEFAULT_BUFSIZE, log=None,
+              loss=0.0, reliable=False, pace=0, legacy=False):
+    """
+    Runs every combination and returns the report:
+        {'multisock': version, 'python': ..., 'platform': ..., 'date': ...,
+         'config': {...}, 'channel': [results of run_channel], 'crypter': [results of run_crypter]}
+    """
+    sizes = default_sizes(bufsize, legacy) if sizes is None else sizes
+    report = {
+        'multisock': multisock.version,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'config': {'operations': list(operations), 'crypto': list(crypto_modes), 'sizes': list(sizes),
+                   'senders': list(senders), 'count': count, 'rate': rate, 'bufsize': bufsize, 'loss': loss,
+                   'reliable': reliable, 'pace': pace, 'legacy': legacy},
+        'channel': [],
+        'crypter': [],
+    }
+    for operation in operations:
+        for crypto_mode in crypto_modes:
+            for size in sizes:
+                for concurrency in senders:
+                    result = run_channel(operation, crypto_mode, size, concurrency, count, rate, group, port,
+                                         bufsize, loss, reliable, pace, legacy)
+                    report['channel'].append(result)
+                    if log is not None:
+                        log(format_channel_result(result))
+    for crypto_mode in crypto_modes:
+        if crypto_mode == 'none':
+            continue
+        for size in sizes:
+            result = run_crypter(crypto_mode, size, count)
+            report['crypter'].append(result)
+            if log is not None:
+                log(format_crypter_result(result))
+    return report
+
+
+def _us(ns):
+    return '-' if ns is None else '%.1f' % (ns / 1000)
+
+
+def format_channel_result(result):
+    latency = result['latency_ns']
+    return ('%-6s %-18s %6d B %2d snd  %9.0f msg/s %8.2f MB/s  lost %6d  repaired %6d  p50 %s p99 %s p99.9 %s us' %
+            (result['operation'], result['crypto'], result['size'], result['senders'], result['messages_per_sec'],
+             result['bytes_per_sec'] / 1e6, result['lost'], result['repaired'], _us(latency['p50']),
+             _us(latency['p99']), _us(latency['p99.9'])))
+
+
+def format_crypter_result(result):
+    return ('crypter %-18s %6d B  encrypt %9.0f/s  decrypt %9.0f/s' %
+            (result['crypto'], result['size'], result['encrypt_per_sec'], result['decrypt_per_sec']))
+
+
+def _list(convert):
+    return lambda text: [convert(item) for item in text.split(',') if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m multisock.benchmark', description=__doc__.split('\n')[2])
+    parser.add_argument('--output', '-o', help='JSON file of the results (default: stdout only)')
+    parser.add_argument('--operations', type=_list(str), default=list(OPERATIONS),
+                        help='comma separated among: data, object')
+    parser.add_argument('--crypto', type=_list(str), default=list(DEFAULT_CRYPTO),
+                        help=f'comma separated among: none, {MODE_CBC}, {MODE_GCM}, {MODE_CHACHA20}')
+    parser.add_argument('--sizes', type=_list(int),
+                        help='comma separated payload sizes (default: 16 B to what fits bufsize)')
+    parser.add_argument('--senders', type=_list(int), default=list(DEFAULT_SENDERS),
+                        help='comma separated numbers of concurrent senders')
+    parser.add_argument('--count', type=int, default=DEFAULT_COUNT, help='messages per sender')
+    parser.add_argument('--rate', type=int, default=0, help='messages per second of every sender (default: unpaced)')
+    parser.add_argument('--loss', type=float, default=0.0, help='fraction of the datagrams dropped on arrival')
+    parser.add_argument('--reliable', action='store_true', help='retransmit the lost messages (NACKs)')
+    parser.add_argument('--pace', type=int, default=0, help='datagrams per second of the pacer of every sender')
+    parser.add_argument('--legacy', action='store_true',
+                        help='channels in their default configuration (no latency measured)')
+    parser.add_argument('--bufsize', type=int, default=DEFAULT_BUFSIZE)
+    parser.add_argument('--group', default=DEFAULT_GROUP)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.operations, args.crypto, args.sizes, args.senders, args.count, args.rate, args.group,
+                       args.port, args.bufsize, log=print, loss=args.loss, reliable=args.reliable, pace=args.pace,
+                       legacy=args.legacy)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f'Results written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: bufferpool.py
+A bounded pool of preallocated receive buffers. Channels read datagrams straight into
+them (socket.recvfrom_into) so that receiving does not allocate a new buffer per packet.
+"""
+
+import collections
+import threading
+from multisock.exceptions import BufferPoolExhaustedException
+
+DEFAULT_POOL_SIZE = 32
+
+
+class PooledBuffer:
+    """
+    A payload received into a buffer of a BufferPool.
+    The data is exposed (without copies) by the memoryview 'view': once done with it
+    call release() (or use the object as a context manager) to give the buffer back.
+    """
+
+    def __init__(self, pool, buffer, nbytes):
+        self._pool = pool
+        self._buffer = buffer
+        self.view = memoryview(buffer)[:nbytes]
+
+    def __len__(self):
+        return len(self.view)
+
+    def __bytes__(self):
+        return self.view.tobytes()
+
+    def __enter__(self):
+        return self.view
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def release(self):
+        """
+        Returns the buffer to the pool: the view can no longer be used.
+        """
+        if self._buffer is None:
+            return
+        self.view.release()
+        self._pool.release(self._buffer)
+        self._buffer = None
+
+
+class BufferPool:
+    """
+    Holds count bytearrays of bufsize bytes allocated once at creation.
+    acquire() raises BufferPoolExhaustedException when all of them are in use:
+    the pool never grows.
+    """
+
+    def __init__(self, bufsize, count=DEFAULT_POOL_SIZE):
+        if bufsize <= 0 or count <= 0:
+            raise ValueError('Invalid buffer pool size')
+        self.bufsize = bufsize
+        self.count = count
+        self._free = collections.deque(bytearray(bufsize) for i in range(count))
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        The number of buffers currently available.
+        """
+        return len(self._free)
+
+    def acquire(self):
+        with self._lock:
+            if not self._free:
+                raise BufferPoolExhaustedException(f'All the {self.count} buffers are in use')
+            return self._free.pop()
+
+    def release(self, buffer):
+        with self._lock:
+            self._free.append(buffer)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: capture.py
+Records the datagrams received by a channel into segment files, to read them back or
+replay them on a group (e.g. to reproduce an incident or to load test a receiver).
+
+#### THE RECORDER ####
+recorder = Recorder('/var/capture')
+udpchan.set_recorder(recorder)
+...
+recorder.close()
+
+#### THE REPLAYER ####
+Replayer(udpchan, speed=2.0).replay('/var/capture')
+
+The recorder appends the datagrams as they arrive (before their decryption) to a
+segment file of segment_size bytes, preallocated and memory mapped: recording a
+datagram is a copy into memory. A full segment is closed and a new one begins (the
+oldest segments are deleted beyond max_segments). Segments are named after the time of
+their creation, thus a directory lists them in order.
+
+A segment is a header (magic, version and the end of the records), the records (the
+arrival time in nanoseconds, the sender ip and port, the length and the datagram) and,
+once the segment is closed, a sparse time index: the arrival time and the offset of a
+record every index_interval bytes, so that readers seek a time without a full scan.
+Segments still open (or left by a crash) are read up to the last record written.
+"""
+
+import bisect
+import collections
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from multisock.exceptions import InvalidSegmentException
+
+SEGMENT_MAGIC = b'MSCP'
+SEGMENT_VERSION = 1
+SEGMENT_SUFFIX = '.seg'
+# magic, version, reserved, end of the records
+HEADER = struct.Struct('!4sHHQ')
+# arrival time (ns), sender ip, sender port, length
+RECORD = struct.Struct('!Q4sHH')
+# arrival time (ns), offset of the record
+INDEX_ENTRY = struct.Struct('!QQ')
+# offset of the index, entries, magic
+TRAILER = struct.Struct('!QI4s')
+INDEX_MAGIC = b'MSIX'
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_INDEX_INTERVAL = 64 * 1024
+# A segment holds at least a datagram of any size
+MIN_SEGMENT_SIZE = HEADER.size + RECORD.size + 0xFFFF
+# Datagrams sent at once by the replayer
+DEFAULT_REPLAY_BATCH = 64
+# How late a replayed datagram counts as late (seconds)
+LATE_THRESHOLD = 0.001
+
+Record = collections.namedtuple('Record', ['timestamp', 'addr', 'data'])
+
+
+def segment_paths(path):
+    """
+    Returns the segment files of a directory in the order of their creation (or the
+    given path if it is a file).
+    """
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+
+
+def read_records(path, start=None, end=None):
+    """
+    Iterates on the records of a segment file, or of all the segments of a directory,
+    arrived between start and end (nanoseconds since the epoch, None for no bound).
+    Segments are memory mapped one at a time: they are never loaded in memory at once.
+    """
+    for segment in segment_paths(path):
+        with SegmentReader(segment) as reader:
+            yield from reader.records(start, end)
+
+
+class Recorder:
+    """
+    Appends datagrams to the segment files of directory (see the module documentation);
+    channel.set_recorder(recorder) records the datagrams received by a channel.
+    - recorded: datagrams recorded
+    - bytes_recorded: bytes of the datagrams recorded
+    - segments: paths of the segments written and not deleted
+    """
+
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE, index_interval=DEFAULT_INDEX_INTERVAL,
+                 max_segments=None):
+        if segment_size < MIN_SEGMENT_SIZE:
+            raise ValueError(f'Invalid segment size: {segment_size}')
+        if max_segments is not None and max_segments <= 0:
+            raise ValueError(f'Invalid max segments: {max_segments}')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.max_segments = max_segments
+        self.recorded = 0
+        self.bytes_recorded = 0
+        self.segments = []
+        self.closed = False
+        self._file = None
+        self._map = None
+        self._end = 0
+        self._index = []
+        self._indexed = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'Recorder<%s>' % self.directory
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, data, addr, timestamp_ns=None):
+        """
+        Appends the datagram data (a bytes-like object) received from addr at
+        timestamp_ns (by default now).
+        """
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        nbytes = len(data)
+        with self._lock:
+            if self.closed:
+                raise ValueError('Recorder closed')
+            if self._map is None or self._end + RECORD.size + nbytes > self.segment_size:
+                self._rotate()
+            offset = self._end
+            if offset - self._indexed >= self.index_interval or not self._index:
+                self._index.append((timestamp_ns, offset))
+                self._indexed = offset
+            RECORD.pack_into(self._map, offset, timestamp_ns, socket.inet_aton(addr[0]), addr[1], nbytes)
+            offset += RECORD.size
+            self._map[offset:offset + nbytes] = data
+            self._end = offset + nbytes
+            HEADER.pack_into(self._map, 0, SEGMENT_MAGIC, SEGMENT_VERSION, 0, self._end)
+            self.recorded += 1
+            self.bytes_recorded += nbytes
+
+    def flush(self):
+        """
+        Writes the records of the open segment to its file.
+        """
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self):
+        """
+        Closes the open segment, appending its index.
+        """
+        with self._lock:
+            if not self.closed:
+                self.closed = True
+                self._finish()
+
+    def _rotate(self):
+        # invoked holding the lock
+        self._finish()
+        timestamp = time.time_ns()
+        while True:
+            path = os.path.join(self.directory, '%020d%s' % (timestamp, SEGMENT_SUFFIX))
+            try:
+                self._file = open(path, 'x+b')
+                break
+            except FileExistsError:
+                timestamp += 1
+        self._file.truncate(self.segment_size)
+        self._map = mmap.mmap(self._file.fileno(), self.segment_size)
+        self._end = HEADER.size
+        HEADER.pack_into(self._map, 0, SEGMENT_MAGIC, SEGMENT_VERSION, 0, self._end)
+        self._index = []
+        self._indexed = 0
+        self.segments.append(path)
+        if self.max_segments is not None and len(self.segments) > self.max_segments:
+            os.remove(self.segments.pop(0))
+
+    def _finish(self):
+        # invoked holding the lock: truncates the segment to its records and appends the index
+        if self._map is None:
+            return
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(self._end)
+        self._file.seek(self._end)
+        self._file.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in self._index) +
+                         TRAILER.pack(self._end, len(self._index), INDEX_MAGIC))
+        self._file.close()
+        self._file = None
+
+
+class SegmentReader:
+    """
+    Reads the records of a segment file through a read-only memory map: the pages of
+    the file are loaded as the records are read.
+    - end: offset of the end of the records
+    - index: the sparse time index, as a list of (timestamp,offset), empty if the
+      segment was not closed
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < HEADER.size:
+                raise InvalidSegmentException(f'Invalid segment {path}: {size} bytes')
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+        magic, version, _, self.end = HEADER.unpack_from(self._map)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION or not HEADER.size <= self.end <= size:
+            self.close()
+            raise InvalidSegmentException(f'Invalid segment {path}')
+        self.index = []
+        if size >= self.end + TRAILER.size:
+            offset, count, magic = TRAILER.unpack_from(self._map, size - TRAILER.size)
+            if magic == INDEX_MAGIC and offset == self.end and \
+                    size == self.end + count * INDEX_ENTRY.size + TRAILER.size:
+                self.index = list(INDEX_ENTRY.iter_unpack(self._map[self.end:size - TRAILER.size]))
+        self._timestamps = [timestamp for (timestamp, offset) in self.index]
+
+    def __repr__(self):
+        return 'SegmentReader<%s>' % self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self, start=None, end=None):
+        """
+        Iterates on the records arrived between start and end (nanoseconds since the
+        epoch, None for no bound), seeking start through the index.
+        """
+        offset = HEADER.size
+        if start is not None:
+            # the last entry before start: the records preceding it are older
+            position = bisect.bisect_left(self._timestamps, start) - 1
+            if position >= 0:
+                offset = self.index[position][1]
+        while offset + RECORD.size <= self.end:
+            timestamp, ip, port, length = RECORD.unpack_from(self._map, offset)
+            offset += RECORD.size
+            if offset + length > self.end:
+                raise InvalidSegmentException(f'Truncated record in {self.path} at {offset}')
+            if end is not None and timestamp > end:
+                return
+            if start is None or timestamp >= start:
+                yield Record(timestamp, (socket.inet_ntoa(ip), port), self._map[offset:offset + length])
+            offset += length
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class Replayer:
+    """
+    Sends recorded datagrams again on channel, as they were recorded (neither framed
+    nor encrypted again: receivers need the crypto of the original senders).
+    The datagrams leave at speed times their original pace (e.g. 2.0 replays twice as
+    fast), or as fast as possible if speed is None, in batches of at most batch.
+    - sent: datagrams sent
+    - late: datagrams sent after their time (the replay did not keep up)
+    """
+
+    def __init__(self, channel, speed=1.0, batch=DEFAULT_REPLAY_BATCH):
+        if speed is not None and speed <= 0:
+            raise ValueError(f'Invalid replay speed: {speed}')
+        self.channel = channel
+        self.speed = speed
+        self.batch = batch
+        self.sent = 0
+        self.late = 0
+
+    def replay(self, source, start=None, end=None):
+        """
+        Replays the records of source (a segment file, a directory of segments or an
+        iterable of Records) arrived between start and end (see read_records). Returns
+        the number of datagrams sent.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            source = read_records(source, start, end)
+        sent = self.sent
+        pending = []
+        origin = None
+        for record in source:
+            if self.speed is not None:
+                if origin is None:
+                    origin = (record.timestamp, time.monotonic())
+                due = origin[1] + (record.timestamp - origin[0]) / 1e9 / self.speed
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._send(pending)
+                    wait = due - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                elif wait < -LATE_THRESHOLD:
+                    self.late += 1
+            pending.append(record.data)
+            if len(pending) >= self.batch:
+                self._send(pending)
+        self._send(pending)
+        return self.sent - sent
+
+    def _send(self, pending):
+        if pending:
+            self.sent += self.channel.send_raw(pending)
+            pending.clear()
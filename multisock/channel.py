@@ -25,10 +25,74 @@ print "Received from %s: %s" % (sender, data)
 
 import socket
 import struct
+import select
 import logging
 import pickle
 import base64
-from multisock.crypter import Crypter
+import collections
+import ctypes
+import itertools
+import queue
+import random
+import threading
+import time
+from multisock import mmsg
+from multisock import frame
+from multisock import serialization
+from multisock.topics import TopicIndex
+from multisock.metrics import ChannelMetrics
+from multisock.latency import LatencyTracker, MessageMeta
+from multisock.coalesce import Coalescer, DEFAULT_COALESCE_SIZE
+from multisock.compression import Compressor
+from multisock.pacing import Pacer
+from multisock.fec import FecEncoder, FecDecoder, DEFAULT_FEC_TIMEOUT, DEFAULT_FEC_MEMORY, DEFAULT_FEC_DELAY
+from multisock import fec as fec_codec
+from multisock.nack import (NackTracker, History, Repairer, encode_nack, decode_nack, encode_announcement,
+                            decode_announcement, DEFAULT_HISTORY_SIZE, DEFAULT_NACK_DELAY, DEFAULT_NACK_INTERVAL,
+                            DEFAULT_NACK_RETRIES)
+from multisock.dedup import DuplicateFilter, DEFAULT_DEDUP_WINDOW
+from multisock.ring import RingBuffer, BackgroundReader, DEFAULT_RING_SIZE, OVERFLOW_DROP_OLDEST
+from multisock.shared import open_reader as open_shared_reader
+from multisock.fragment import Fragmenter, Reassembler, DEFAULT_REASSEMBLY_TIMEOUT, DEFAULT_REASSEMBLY_MEMORY
+from multisock.bufferpool import BufferPool, PooledBuffer
+from multisock.crypter import Crypter, ENCODING
+from multisock.exceptions import DecryptionException, InvalidFrameException, CompressionException
+
+def decode_data(message, crypto=None):
+    """
+    Decodes a message as recv does: message is a datagram (binary frame or legacy
+    format) or a parsed frame. Stateless, so it can run on any thread or process.
+    """
+    if not isinstance(message, frame.Frame):
+        if not frame.is_frame(message, validate=True):
+            if crypto is not None:
+                message = crypto.decrypt(message)
+            return message
+        message = frame.Frame.parse(message)
+    payload = message.open(crypto)
+    if message.codec == frame.CODEC_TEXT:
+        return str(payload, ENCODING)
+    return bytes(payload)
+
+
+def decode_object(message, crypto=None):
+    """
+    Decodes a message as recv_object does (see decode_data).
+    """
+    if not isinstance(message, frame.Frame):
+        if not frame.is_frame(message, validate=True):
+            return pickle.loads(base64.b64decode(decode_data(message, crypto)))
+        message = frame.Frame.parse(message)
+    return serialization.get_codec(message.codec).decode(message.open(crypto))
+
+# How the channel uses its sockets (see Channel)
+SOCKET_MODE_DUAL = 'dual'
+SOCKET_MODE_SINGLE = 'single'
+SOCKET_MODE_SEND_ONLY = 'send-only'
+SOCKET_MODES = (SOCKET_MODE_DUAL, SOCKET_MODE_SINGLE, SOCKET_MODE_SEND_ONLY)
+DEFAULT_MULTICAST_TTL = 32
+DEFAULT_STATS_INTERVAL = 10.0
+
 
 class Channel:
     """
@@ -38,6 +102,12 @@ class Channel:
     All components connected to this group will be able to exchange
     messages through the following primitives:
     - send/recv: by using buffers of data (bytes or more simply strings)
+    - send_object/recv_object: by using picklable objects
+    - send_many/send_objects_many: by sending many datagrams at once
+    - recv_many/recv_objects_many: by draining many datagrams at once
+    - recv_into/recv_view: by reading into preallocated buffers
+    - subscribe/dispatch: by receiving only the messages of some topics
+    - recv_with_meta/recv_object_with_meta: by receiving the timing of the messages too
 
     The channels can be closed (disconnected) with channel.close() method.
 
@@ -47,18 +117,174 @@ class Channel:
     The optional parameter iface_ip allows to bind socket to a specific interface given
     its ip (e.g. localhost/0.0.0.0....)
 
+    The optional parameter buffer_pool is the BufferPool used by recv_view (by default
+    a pool of bufsize buffers is created on first usage).
+
+    The optional parameter framed selects the compact binary format (see frame.py) for
+    the outgoing messages. Receivers always accept both the binary and the legacy
+    base64 format, so framed senders and legacy senders can share a group.
+
+    The optional parameter mtu enables the fragmentation of the messages larger than mtu
+    bytes (see fragment.py); receivers always reassemble fragmented messages keeping at
+    most reassembly_memory bytes of partial messages for at most reassembly_timeout seconds.
+
+    The optional parameter socket_mode selects the sockets of the channel:
+    - SOCKET_MODE_DUAL (default): a reader and a writer socket, both members of the group
+      and bound to its port. The kernel copies every datagram into the writer buffer too,
+      where it is never read.
+    - SOCKET_MODE_SINGLE: one socket sends and receives (set_read_blocking affects sends too)
+    - SOCKET_MODE_SEND_ONLY: the writer is neither bound nor a member of the group, thus
+      messages leave from an ephemeral port
+    The optional parameters multicast_loop (deliver own messages to the local host),
+    multicast_ttl and multicast_if (the ip of the outgoing interface) set the homonym
+    IP_MULTICAST_* options of the sending socket; None keeps the system default.
+
+    The optional parameter sequenced numbers the outgoing messages, so that receivers
+    count the messages lost or reordered (see stats()).
+    The optional parameter timestamped stamps the outgoing messages with their send time,
+    so that receivers keep the histograms of the one-way latency of every sender (see
+    stats() and latency.py).
+
+    The optional parameter coalesce (seconds, e.g. 0.001) packs the messages sent within
+    that delay into a single datagram of at most coalesce_size bytes (by default the mtu,
+    or 1472 bytes), encrypted once (see coalesce.py). Receivers always split the batches
+    back into the original messages. flush() sends the queued messages right away.
+
+    The optional parameter compressor (a Compressor) compresses the outgoing payloads
+    above its size threshold before their encryption (see compression.py). Receivers
+    always decompress the payloads whose dictionary is registered.
+
+    The optional parameter fec=(N, K) follows every group of N datagrams with K parity
+    datagrams, so that receivers rebuild up to K lost datagrams of a group without any
+    round trip (see fec.py). Receivers always decode FEC, keeping the groups for at most
+    fec_timeout seconds and fec_memory bytes. Groups are closed when full, at the end of
+    every send_many/send_objects_many, by flush() and at most fec_delay seconds (never
+    more than fec_timeout) after their first datagram.
+
+    The optional parameter reliable numbers the outgoing messages and keeps the last
+    history_size of them, retransmitting the ones receivers report lost (see nack.py).
+    Reliable receivers multicast a NACK at most nack_delay seconds after detecting a gap
+    (unless another receiver already did), repeat it every nack_interval seconds up to
+    nack_retries times and deliver every message once. Senders announce their highest
+    sequence number on flush(), on close() and once idle for nack_interval seconds, so
+    that the lost tail of a burst is repaired too. Senders and receivers of a reliable
+    transfer must all be reliable: other receivers may get the repairs twice.
+
+    The optional parameter dedup numbers the outgoing messages and drops the incoming
+    messages already received from the same origin (copies relayed by redundant senders
+    or received from many interfaces) right after the parsing of their header, keeping
+    a window of dedup_window sequence numbers for every origin (see dedup.py).
+    The optional parameter origin (32 bits, random by default) identifies the sender in
+    the sequence numbers: redundant senders relaying the same stream share their origin,
+    so that receivers take their copies for duplicates.
+
+    The optional parameter pacer (a Pacer) spaces the outgoing datagrams at its rate,
+    leaving to the kernel the wait when it can (see pacing.py).
+
+    The optional parameter background starts a thread draining the reader socket into a
+    ring of ring_size preallocated datagrams, applying the overflow policy when it is full
+    (see ring.py): the receive methods consume the ring, get_nowait/get_object_nowait poll
+    it. The optional parameter rcvbuf sets the size of the kernel receive buffer (SO_RCVBUF).
+
+    The optional parameter shared reads the group from the socket shared by the shared
+    channels of the process on the same group, port and interface, instead of sockets of
+    its own: the kernel copies every datagram once, then a thread copies it into the ring
+    of every channel (as background, see shared.py). Shared channels send from a socket
+    neither bound nor member of the group, whatever socket_mode; the shared socket closes
+    with the last channel reading it.
+
+    set_recorder(recorder) records the datagrams received into segment files, which
+    send_raw sends again as they are (see capture.py).
+
     Note: the instantiation of a channel implicitly connects to the multicast group.
     """
 
-    def __init__(self, mcast_ip, mcast_port, bufsize=4096, iface_ip=None, crypto=None):
+    def __init__(self, mcast_ip, mcast_port, bufsize=4096, iface_ip=None, crypto=None, buffer_pool=None,
+                 framed=False, codec=None, mtu=None, reassembly_timeout=DEFAULT_REASSEMBLY_TIMEOUT,
+                 reassembly_memory=DEFAULT_REASSEMBLY_MEMORY, socket_mode=SOCKET_MODE_DUAL,
+                 multicast_loop=None, multicast_ttl=DEFAULT_MULTICAST_TTL, multicast_if=None, sequenced=False,
+                 timestamped=False, coalesce=None, coalesce_size=None, compressor=None, fec=None,
+                 fec_timeout=DEFAULT_FEC_TIMEOUT, fec_memory=DEFAULT_FEC_MEMORY, fec_delay=DEFAULT_FEC_DELAY,
+                 reliable=False, history_size=DEFAULT_HISTORY_SIZE, nack_delay=DEFAULT_NACK_DELAY,
+                 nack_interval=DEFAULT_NACK_INTERVAL, nack_retries=DEFAULT_NACK_RETRIES, dedup=False,
+                 dedup_window=DEFAULT_DEDUP_WINDOW, pacer=None, background=False, ring_size=DEFAULT_RING_SIZE,
+                 overflow=OVERFLOW_DROP_OLDEST, rcvbuf=None, shared=False, origin=None):
+        if socket_mode not in SOCKET_MODES:
+            raise ValueError(f'Invalid socket mode: {socket_mode}')
+        if origin is not None and not 0 <= origin < 1 << 32:
+            raise ValueError(f'Invalid origin: {origin}')
+        self.socket_mode = socket_mode
+        self.shared = shared
+        self.multicast_loop = multicast_loop
+        self.multicast_ttl = multicast_ttl
+        self.multicast_if = multicast_if
         self.mcast_ip = mcast_ip
         self.mcast_port = mcast_port
         self.bufsize = bufsize
         self.writer = None
         self.reader = None
+        self._mmsg = None
+        self._gso = mmsg.HAVE_UDP_GSO
+        if buffer_pool is not None and buffer_pool.bufsize < bufsize:
+            raise ValueError('Buffer pool buffers are smaller than bufsize')
+        self.buffer_pool = buffer_pool
         if crypto is not None and not isinstance(crypto, Crypter):
             raise ValueError('Invalid crypto parameter. DataCrypto instance expected')
         self.crypto = crypto
+        if compressor is not None and not isinstance(compressor, Compressor):
+            raise ValueError('Invalid compressor parameter. Compressor instance expected')
+        self.compressor = compressor
+        if pacer is not None and not isinstance(pacer, Pacer):
+            raise ValueError('Invalid pacer parameter. Pacer instance expected')
+        self.pacer = pacer
+        self.codec = serialization.get_codec('pickle' if codec is None else codec)
+        # reliable channels retransmit and dedup channels filter by sequence number
+        sequenced = sequenced or reliable or dedup
+        # codecs other than pickle, fragments, sequence numbers, timestamps, batches, compression, FEC and AEAD
+        # can only travel in binary frames
+        self.framed = (framed or self.codec.codec_id != frame.CODEC_PICKLE or mtu is not None or sequenced
+                       or timestamped or coalesce is not None or compressor is not None or fec is not None
+                       or (crypto is not None and crypto.aead))
+        self.sequenced = sequenced
+        self.timestamped = timestamped
+        self.latency = LatencyTracker()
+        self._kernel_timestamps = None
+        self.origin = random.getrandbits(32) if origin is None else origin
+        self._sequence = itertools.count()
+        self.metrics = ChannelMetrics()
+        self._drop_counter = False
+        self._stats_hook = None
+        self._stats_interval = DEFAULT_STATS_INTERVAL
+        self._next_report = None
+        self._recorder = None
+        # the parity of a group must arrive before the receivers forget it
+        self._fec_encoder = (FecEncoder(*fec, min(fec_delay, fec_timeout), self._send_parity)
+                             if fec is not None else None)
+        self._fec_decoder = FecDecoder(fec_timeout, fec_memory)
+        self.reliable = reliable
+        self._history = History(history_size, nack_delay) if reliable else None
+        self._repairer = None
+        self._nacks = NackTracker(self._send_nack, nack_delay, nack_interval, nack_retries) if reliable else None
+        self._dedup = DuplicateFilter(dedup_window) if dedup else None
+        # the sequence numbers are tracked by the receive methods, or by the workers of a
+        # DecodePipeline once they authenticated the messages (deferred)
+        self._sequences_lock = threading.Lock()
+        self._deferred = False
+        # room for the FEC frame around the datagrams
+        datagram_size = mtu - fec_codec.OVERHEAD if fec is not None and mtu is not None else mtu
+        self._fragmenter = Fragmenter(datagram_size) if mtu is not None else None
+        self._reassembler = Reassembler(reassembly_timeout, reassembly_memory)
+        self._subscriptions = TopicIndex()
+        # messages of a received batch not yet returned
+        self._backlog = collections.deque()
+        self._backlog_times = (None, None)
+        self._coalescer = None
+        if coalesce is not None:
+            if coalesce_size is None:
+                coalesce_size = datagram_size if mtu is not None else min(bufsize, DEFAULT_COALESCE_SIZE)
+                if fec is not None and mtu is None:
+                    coalesce_size -= fec_codec.OVERHEAD
+            self._coalescer = Coalescer(self._send_coalesced, self._batch_capacity(coalesce_size), coalesce)
         if iface_ip is not None and len(iface_ip.strip()) > 0:
             self.iface_ip = iface_ip.strip()
         else:
@@ -66,31 +292,155 @@ class Channel:
 
         self.logger = logging.getLogger()
         self.__init_protocol__()
+        if self.pacer is not None:
+            self.pacer.attach(self.writer)
+        if rcvbuf is not None:
+            self.reader.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self._ring = None
+        self._background = None
+        if background or shared:
+            self._ring = RingBuffer(ring_size, bufsize, overflow)
+            if shared:
+                self.reader.attach(self._ring, self._update_drops)
+            else:
+                self._background = BackgroundReader(self.reader, self._ring, self._drop_counter, self._update_drops)
 
         self.logger.info('Creating UDP Channel on %s:%d' % (self.mcast_ip, self.mcast_port))
 
     def __init_protocol__(self):
+        if self.shared:
+            # a send-only writer and a handle on the shared socket of the group
+            self.writer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            self.__init_sender__(self.writer)
+            self.reader = open_shared_reader(self.mcast_ip, self.mcast_port, self.iface_ip)
+            return
         # UDP socket writer
-        self.writer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        self.writer.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 32)
-        self.writer.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        _mreq = struct.pack("4sI", socket.inet_aton(self.mcast_ip), socket.INADDR_ANY)
-        self.writer.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _mreq)
-        self.writer.bind((self.iface_ip, self.mcast_port))
+        if self.socket_mode == SOCKET_MODE_DUAL:
+            self.writer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            self.__init_sender__(self.writer)
+            self.writer.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            _mreq = struct.pack("4sI", socket.inet_aton(self.mcast_ip), socket.INADDR_ANY)
+            self.writer.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _mreq)
+            self.writer.bind((self.iface_ip, self.mcast_port))
+        elif self.socket_mode == SOCKET_MODE_SEND_ONLY:
+            # neither bound nor member: the kernel never queues incoming datagrams here
+            self.writer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            self.__init_sender__(self.writer)
 
         # UDP socket reader
         self.reader = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         self.reader.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._drop_counter = self.__init_drop_counter__(self.reader)
         _mreq = struct.pack("4sI", socket.inet_aton(self.mcast_ip), socket.INADDR_ANY)
         self.reader.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _mreq)
         # setblocking(0) is equiv to settimeout(0.0) which means we poll the socket.
         # But this will raise an error if recv() or send() can't immediately find or send data.
         self.reader.setblocking(1)
         self.reader.bind((self.iface_ip, self.mcast_port))
+        if self.socket_mode == SOCKET_MODE_SINGLE:
+            self.__init_sender__(self.reader)
+            self.writer = self.reader
+
+    def __init_sender__(self, sock):
+        if self.multicast_ttl is not None:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.multicast_ttl)
+        if self.multicast_loop is not None:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1 if self.multicast_loop else 0)
+        if self.multicast_if is not None:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.multicast_if))
+
+    def __init_drop_counter__(self, sock):
+        # Linux attaches the count of the datagrams dropped on a full receive queue
+        if mmsg.SO_RXQ_OVFL is None or mmsg.DROPS_CONTROL_SIZE == 0:
+            return False
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, mmsg.SO_RXQ_OVFL, 1)
+            return sock.getsockopt(socket.SOL_SOCKET, mmsg.SO_RXQ_OVFL) == 1
+        except OSError:
+            return False
+
+    def __init_timestamps__(self, sock):
+        # Linux attaches the arrival time of every datagram
+        if mmsg.SO_TIMESTAMPNS is None or mmsg.TIMESTAMP_CONTROL_SIZE == 0:
+            return False
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, mmsg.SO_TIMESTAMPNS, 1)
+            return True
+        except OSError:
+            return False
+
+    def _control_size(self):
+        # once enabled by recv_with_meta, the arrival times precede the drop counter
+        if self._kernel_timestamps:
+            return mmsg.TIMESTAMP_CONTROL_SIZE + mmsg.DROPS_CONTROL_SIZE
+        return mmsg.DROPS_CONTROL_SIZE
 
     def __repr__(self):
         return 'MulticastCh<%s:%d>' % (self.mcast_ip, self.mcast_port)
 
+    def stats(self):
+        """
+        Returns a snapshot (dict) of the channel counters (see metrics.py), including
+        the ones of the reassembly of fragmented messages, of the FEC, of the
+        retransmissions, of the duplicate suppression, of the pacing and of the ring of
+        background channels.
+        """
+        stats = self.metrics.snapshot()
+        stats['reassembly_pending'] = len(self._reassembler)
+        stats['reassembly_expired'] = self._reassembler.expired
+        stats['reassembly_evicted'] = self._reassembler.evicted
+        stats['fec_pending'] = len(self._fec_decoder)
+        stats['fec_recovered'] = self._fec_decoder.recovered
+        stats['fec_unrecoverable'] = self._fec_decoder.unrecoverable
+        stats['fec_parity_sent'] = self._fec_encoder.parity_sent if self._fec_encoder is not None else 0
+        stats['fec_overhead_bytes'] = self._fec_encoder.overhead_bytes if self._fec_encoder is not None else 0
+        for name in ('sent', 'suppressed', 'repaired', 'unrecovered', 'duplicates'):
+            stats['nack_' + name] = getattr(self._nacks, name) if self._nacks is not None else 0
+        stats['nack_retransmitted'] = self._history.retransmitted if self._history is not None else 0
+        stats['nack_expired'] = self._history.expired if self._history is not None else 0
+        stats['nack_announcements'] = self._repairer.announcements if self._repairer is not None else 0
+        for name in ('dropped', 'stale', 'evicted'):
+            stats['dedup_' + name] = getattr(self._dedup, name) if self._dedup is not None else 0
+        stats['dedup_origins'] = len(self._dedup) if self._dedup is not None else 0
+        stats['pacing_delayed'] = self.pacer.delayed if self.pacer is not None else 0
+        stats['pacing_waited'] = self.pacer.waited if self.pacer is not None else 0.0
+        stats['ring_pending'] = len(self._ring) if self._ring is not None else 0
+        stats['ring_high_water'] = self._ring.high_water if self._ring is not None else 0
+        stats['ring_overflows'] = self._ring.overflows if self._ring is not None else 0
+        stats['latency'] = self.latency.snapshot()
+        return stats
+
+    def set_stats_hook(self, hook, interval=DEFAULT_STATS_INTERVAL):
+        """
+        Invokes hook(stats) with the stats() snapshot at most every interval seconds
+        (e.g. to export them to a monitoring system). The hook runs in the thread
+        sending or receiving on the channel, as soon as the interval has elapsed.
+        None removes the hook.
+        """
+        self._stats_hook = hook
+        self._stats_interval = interval
+        self._next_report = time.monotonic() + interval if hook is not None else None
+
+    def set_recorder(self, recorder):
+        """
+        Records every datagram received from now on, as it arrives, with recorder
+        (a Recorder, see capture.py). None stops the recording.
+        """
+        self._recorder = recorder
+
+    def _report(self):
+        if self._next_report is not None and time.monotonic() >= self._next_report:
+            self._next_report = time.monotonic() + self._stats_interval
+            self._stats_hook(self.stats())
+
+    def _next_timestamp(self):
+        return time.time_ns() if self.timestamped else None
+
+    def _next_sequence(self):
+        if not self.sequenced:
+            return None
+        return self.origin, next(self._sequence) & 0xFFFFFFFF
+
     def set_read_blocking(self, blocking=True):
         """
         By default a channel is considered blocking in read, that means that
@@ -104,26 +454,522 @@ class Channel:
         else:
             self.reader.setblocking(0)
 
+    def flush(self):
+        """
+        Sends the messages queued by a coalescing channel right away, and the parity of
+        the open FEC groups. Reliable senders announce their highest sequence number.
+        """
+        if self._coalescer is not None:
+            self._coalescer.flush()
+        if self._fec_encoder is not None:
+            self._flush_parity()
+        if self._repairer is not None:
+            self._repairer.announce()
+
+    def _flush_parity(self):
+        for (dest, parity) in self._fec_encoder.flush():
+            self._send_batch(parity, dest)
+
+    def _send_parity(self, parity, dest=None):
+        """
+        Sends the parity of a FEC group closed on its deadline (invoked by the FEC thread).
+        """
+        self._send_batch(parity, dest)
+
     def close(self):
         """
-        Closes the connection to the multicast group.
+        Closes the connection to the multicast group (sending the queued messages first).
         """
         raised_exception = None
         try:
+            if self._coalescer is not None:
+                self._coalescer.close()
+            if self._fec_encoder is not None:
+                self._flush_parity()
+                self._fec_encoder.close()
+            if self._repairer is not None:
+                self._repairer.announce()
+            if self._nacks is not None:
+                self._nacks.close()
+            if self._repairer is not None:
+                self._repairer.close()
+            if self._background is not None:
+                self._background.close()
             self.reader.close()
         finally:
-            self.writer.close()
+            if self.writer is not self.reader:
+                self.writer.close()
 
-    def send_object(self, obj):
+    def _encode(self, data, topic=None):
         """
-        Sends data on the channel. What else?
+        Applies the channel encryption (if any) to outgoing data.
         """
-        data_b64 = base64.b64encode(pickle.dumps(obj))
-        # Enncrypt if needed
+        if self.framed or topic is not None:
+            if isinstance(data, str):
+                return self._frame(frame.CODEC_TEXT, data.encode(ENCODING), topic)
+            return self._frame(frame.CODEC_RAW, bytes(data), topic)
         if self.crypto is not None:
-            data_b64 = self.crypto.encrypt(data_b64)
+            data = self.crypto.encrypt(data)
+        return data
 
-        self.writer.sendto(data_b64, (self.mcast_ip, self.mcast_port))
+    def _decode(self, data):
+        """
+        Reverts the channel encryption (if any) on incoming data
+        (a datagram or a frame returned by _accept).
+        """
+        return decode_data(data, self.crypto)
+
+    def _encode_object(self, obj, codec=None, topic=None):
+        """
+        Serializes an object in the format exchanged by send_object/recv_object.
+        """
+        codec = self.codec if codec is None else serialization.get_codec(codec)
+        if self.framed or codec.codec_id != frame.CODEC_PICKLE or topic is not None:
+            return self._frame(codec.codec_id, codec.encode(obj), topic)
+        return self._encode(base64.b64encode(pickle.dumps(obj)))
+
+    def _frame(self, codec_id, payload, topic=None):
+        sequence = self._next_sequence()
+        if self._coalescer is not None:
+            # coalesced messages are compressed and encrypted all together, in their batch
+            data = frame.encode(codec_id, payload, topic=topic, sequence=sequence, timestamp=self._next_timestamp())
+        else:
+            data = frame.encode(codec_id, payload, self.crypto, topic=topic, sequence=sequence,
+                                timestamp=self._next_timestamp(), compressor=self.compressor)
+        if self._history is not None:
+            if self._repairer is None:
+                self._repairer = Repairer(self._open_repair_socket(), self.origin, self._history, self._retransmit,
+                                          self.crypto, announce=self._announce, idle=self._nacks.interval)
+            self._history.store(sequence[1], data)
+        return data
+
+    def _decode_object(self, data):
+        """
+        Deserializes an object received from the channel
+        (a datagram or a frame returned by _accept).
+        """
+        return decode_object(data, self.crypto)
+
+    def _accept(self, data, addr, arrival_ns=None):
+        """
+        Parses a received datagram. Returns the frame (or the legacy data) of the
+        message it carries, or None when it is just a fragment of a larger message.
+        The optional arrival_ns is the arrival time of the datagram (by default now).
+        """
+        metrics = self.metrics
+        metrics.datagrams_received += 1
+        metrics.bytes_received += len(data)
+        if self._next_report is not None:
+            self._report()
+        if self._recorder is not None:
+            self._recorder.record(data, addr, arrival_ns)
+        return self._unwrap(data, addr, arrival_ns)
+
+    def _unwrap(self, data, addr, arrival_ns=None):
+        metrics = self.metrics
+        if not frame.is_frame(data, not self.framed):
+            # legacy messages have no topic
+            if len(self._subscriptions) > 0:
+                metrics.filtered += 1
+                return None
+            metrics.messages_received += 1
+            return data
+        try:
+            received = frame.Frame.parse(data)
+            if received.nack or received.announce:
+                self._overhear(received, addr)
+                return None
+            recovered = self._fec_decoder.add(addr, received) if received.fec is not None else None
+            if received.fragment is not None:
+                whole = self._reassembler.add(addr, received)
+                if whole is None:
+                    return None
+                received = frame.Frame.parse(whole)
+        except InvalidFrameException:
+            metrics.invalid_frames += 1
+            raise
+        if recovered is not None:
+            return self._unprotect(recovered, addr, arrival_ns)
+        if received.batch:
+            return self._unbatch(received, addr, arrival_ns)
+        return received if self._admit(received, addr, arrival_ns) else None
+
+    def _unbatch(self, received, addr, arrival_ns=None):
+        """
+        Splits a batch frame: returns its first admitted message and queues the others
+        in the backlog, which the receive methods empty before reading the socket.
+        """
+        try:
+            payload = received.open(self.crypto)
+        except DecryptionException as ex:
+            self._reject(addr, ex)
+            return None
+        except CompressionException:
+            self.metrics.decode_errors += 1
+            raise
+        try:
+            # the messages must outlive the receive buffer (see recv_into)
+            messages = frame.split_batch(bytes(payload) if isinstance(payload, memoryview) else payload)
+        except InvalidFrameException:
+            self.metrics.invalid_frames += 1
+            raise
+        admitted = [message for message in messages if self._admit(message, addr, arrival_ns)]
+        if not admitted:
+            return None
+        self._backlog.extend((message, addr) for message in admitted[1:])
+        return admitted[0]
+
+    def _admit(self, received, addr, arrival_ns=None):
+        """
+        Accounts for a whole message: False if it is a duplicate or the topic
+        subscriptions discard it.
+        """
+        metrics = self.metrics
+        sequence = received.sequence
+        # the copies (e.g. repairs requested by other receivers) and the messages of other
+        # topics are dropped before any crypto work
+        if sequence is not None and self._duplicate(sequence):
+            return False
+        filtered = len(self._subscriptions) > 0 and not self._subscribed(received.topic)
+        if sequence is not None:
+            if filtered and self._nacks is None:
+                # only the statistics (lost, reordered) count the messages discarded
+                with self._sequences_lock:
+                    metrics.sequences.track(*sequence)
+            elif filtered or not self._deferred:
+                # tracked once authenticated (reliable channels track the messages discarded
+                # too, lest they ask for them again)
+                if not self._authentic(received, addr) or not self._track(sequence):
+                    return False
+        if filtered:
+            metrics.filtered += 1
+            return False
+        if received.timestamp is not None:
+            self.latency.record(addr, (arrival_ns or time.time_ns()) - received.timestamp)
+        metrics.messages_received += 1
+        return True
+
+    def _duplicate(self, sequence):
+        with self._sequences_lock:
+            return ((self._dedup is not None and self._dedup.check(*sequence)) or
+                    (self._nacks is not None and self._nacks.delivered(*sequence)))
+
+    def _track(self, sequence):
+        """
+        Tracks the sequence number of an authenticated message: False if a copy of the
+        message was already delivered.
+        """
+        with self._sequences_lock:
+            if self._dedup is not None:
+                if self._dedup.check(*sequence):
+                    # admitted meanwhile (see DecodePipeline)
+                    return False
+                self._dedup.add(*sequence)
+            self.metrics.sequences.track(*sequence)
+            return self._nacks is None or self._nacks.receive(*sequence)
+
+    def _authentic(self, received, addr):
+        """
+        Authenticates an encrypted frame ahead of its decoding (which reuses the
+        decrypted payload): False if it was tampered with.
+        """
+        if not received.encrypted:
+            return True
+        try:
+            received.authenticate(self.crypto)
+        except DecryptionException as ex:
+            self._reject(addr, ex)
+            return False
+        except InvalidFrameException:
+            self.metrics.invalid_frames += 1
+            raise
+        return True
+
+    def _subscribed(self, topic):
+        return topic is not None and len(self._subscriptions.match(topic)) > 0
+
+    def subscribe(self, pattern, callback=None):
+        """
+        Subscribes the channel to the topics matching pattern ('+' and '#' wildcards
+        are supported, see topics.py).
+        Once subscribed to at least a pattern the channel receives only the messages
+        of the matching topics: the others are discarded right after the parsing of
+        their header, before any decryption or deserialization (but on reliable
+        channels, where they are authenticated first so that their numbers are tracked
+        safely).
+        The optional callback(obj, addr, topic) is invoked by dispatch() for every
+        message matching the pattern.
+        """
+        self._subscriptions.add(pattern, callback)
+
+    def unsubscribe(self, pattern, callback=None):
+        """
+        Removes a subscription made with subscribe(pattern, callback).
+        """
+        self._subscriptions.remove(pattern, callback)
+
+    def dispatch(self, max_msgs=64, timeout=None):
+        """
+        Receives (as recv_objects_many) the pending messages and hands them to the
+        callbacks of the matching subscriptions. Returns the number of received messages.
+        """
+        batch = self._recv_batch(max_msgs, timeout)
+        for (message, addr) in batch:
+            topic = message.topic if isinstance(message, frame.Frame) else None
+            callbacks = [callback for callback in self._subscriptions.match(topic or '') if callback is not None]
+            if not callbacks:
+                continue
+            try:
+                obj = self._decode_object(message)
+            except DecryptionException as ex:
+                self._reject(addr, ex)
+                continue
+            except Exception:
+                self.metrics.decode_errors += 1
+                raise
+            for callback in callbacks:
+                callback(obj, addr, topic)
+        return len(batch)
+
+    def _receive(self, decoder, blocking=True):
+        """
+        Receives the next message and decodes it with decoder: messages failing the
+        authentication (tampered or encrypted with another key) are discarded.
+        """
+        while True:
+            received = self._recv_message(blocking)
+            if received is None:
+                return None
+            message, addr = received
+            try:
+                return decoder(message), addr
+            except DecryptionException as ex:
+                self._reject(addr, ex)
+            except Exception:
+                self.metrics.decode_errors += 1
+                raise
+
+    def _decode_batch(self, batch, decoder):
+        decoded = []
+        for (message, addr) in batch:
+            try:
+                decoded.append((decoder(message), addr))
+            except DecryptionException as ex:
+                self._reject(addr, ex)
+            except Exception:
+                self.metrics.decode_errors += 1
+                raise
+        return decoded
+
+    def _unprotect(self, datagrams, addr, arrival_ns=None):
+        """
+        Processes the datagrams delivered by the FEC decoder (the one received and those
+        recovered): returns the first message and queues the others in the backlog.
+        """
+        first = None
+        for datagram in datagrams:
+            if not frame.is_frame(datagram):
+                self.metrics.invalid_frames += 1
+                continue
+            message = self._unwrap(datagram, addr, arrival_ns)
+            if message is None:
+                continue
+            if first is None:
+                first = message
+            else:
+                self._backlog.append((message, addr))
+        return first
+
+    def _overhear(self, received, addr):
+        """
+        Processes a NACK frame sent by a receiver or an announcement frame sent by a
+        sender: reliable receivers hold back their NACKs of the same messages, or NACK
+        the messages up to the one announced.
+        """
+        if self._nacks is None:
+            return
+        try:
+            payload = received.open(self.crypto)
+        except DecryptionException as ex:
+            self._reject(addr, ex)
+            return
+        if received.announce:
+            self._nacks.announced(*decode_announcement(payload))
+            return
+        origin, requester, sequences = decode_nack(payload)
+        if requester != self.origin:
+            self._nacks.overheard(origin, sequences)
+
+    def _send_nack(self, origin, sequences):
+        for payload in encode_nack(origin, self.origin, sequences):
+            self.writer.sendto(frame.encode(frame.CODEC_RAW, payload, self.crypto, frame.FLAG_NACK),
+                               (self.mcast_ip, self.mcast_port))
+
+    def _announce(self, sequence):
+        self.writer.sendto(frame.encode(frame.CODEC_RAW, encode_announcement(self.origin, sequence), self.crypto,
+                                        frame.FLAG_ANNOUNCE), (self.mcast_ip, self.mcast_port))
+
+    def _open_repair_socket(self):
+        # the NACKs are multicast on the group: the repair thread reads them on a socket of its own,
+        # filtered by the kernel where possible (see Repairer)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        _mreq = struct.pack("4sI", socket.inet_aton(self.mcast_ip), socket.INADDR_ANY)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _mreq)
+        sock.bind((self.iface_ip, self.mcast_port))
+        return sock
+
+    def _retransmit(self, messages):
+        """
+        Sends again the messages requested by a NACK (invoked by the repair thread).
+        """
+        for data in messages:
+            if self._coalescer is not None:
+                self._send_coalesced([data])
+            else:
+                self._send_datagrams(self._datagrams(data))
+
+    def _reject(self, addr, ex):
+        self.metrics.decrypt_errors += 1
+        self.logger.debug('Discarding message from %s: %s' % (addr, ex))
+
+    def _datagrams(self, data):
+        """
+        Splits an encoded message in the datagrams to send.
+        """
+        if self._fragmenter is None:
+            return [data]
+        return self._fragmenter.split(data)
+
+    def _batch_capacity(self, size):
+        """
+        The bytes of messages fitting a batch datagram of the given size.
+        """
+        capacity = size - frame.HEADER_SIZE
+        if self.crypto is not None:
+            while capacity > 0 and self.crypto.sealed_size(capacity) > size - frame.HEADER_SIZE:
+                capacity -= 1
+        return capacity
+
+    def _send_coalesced(self, messages, dest=None):
+        """
+        Sends the messages queued by the coalescer as a single batch frame.
+        """
+        if len(messages) == 1 and self.crypto is None and self.compressor is None:
+            batch = messages[0]
+        else:
+            batch = frame.encode_batch(messages, self.crypto, self.compressor)
+        self._send_datagrams(self._datagrams(batch), dest)
+
+    def _transmit(self, data, dest=None):
+        self.metrics.messages_sent += 1
+        if self._coalescer is not None:
+            self._coalescer.add(data, dest)
+        else:
+            self._send_datagrams(self._datagrams(data), dest)
+
+    def _protect(self, datagrams, dest=None, close=False):
+        """
+        Wraps the datagrams in FEC frames, adding the parity of the groups completed.
+        """
+        if self._fec_encoder is None:
+            return datagrams
+        return self._fec_encoder.protect(datagrams, dest, close)
+
+    def _send_datagrams(self, datagrams, dest=None):
+        datagrams = self._protect(datagrams, dest)
+        if len(datagrams) == 1 and self.pacer is None:
+            self.writer.sendto(datagrams[0], dest or (self.mcast_ip, self.mcast_port))
+            self.metrics.datagrams_sent += 1
+            self.metrics.bytes_sent += len(datagrams[0])
+            if self._next_report is not None:
+                self._report()
+        else:
+            self._send_batch(datagrams, dest)
+
+    def _transmit_many(self, messages, dest=None):
+        """
+        Sends a list of encoded messages as a single batch (see _send_batch), or queues
+        them on coalescing channels (returning their number).
+        """
+        self.metrics.messages_sent += len(messages)
+        if self._coalescer is not None:
+            for data in messages:
+                self._coalescer.add(data, dest)
+            return len(messages)
+        return self._send_batch(self._protect([datagram for data in messages for datagram in self._datagrams(data)],
+                                              dest, close=True), dest)
+
+    def _recv_message(self, blocking=True):
+        """
+        Reads datagrams until a whole message is received: returns a couple
+            (message,addr)
+        to be decoded by _decode/_decode_object (None on empty data).
+        """
+        if self._backlog:
+            return self._backlog.popleft()
+        while True:
+            arrival_ns = None
+            if self._ring is not None:
+                received = self._ring_get(blocking)
+                if received is None:
+                    return None
+                data, addr, arrival_ns = received
+            elif self._drop_counter:
+                data, ancdata, _, addr = self.reader.recvmsg(self.bufsize, self._control_size())
+                if ancdata:
+                    self._update_drops(mmsg.parse_drops(ancdata))
+            else:
+                data, addr = self.reader.recvfrom(self.bufsize)
+            if (data is None or len(data) == 0):
+                return None
+            message = self._accept(data, addr, arrival_ns)
+            if message is not None:
+                return message, addr
+
+    def _ring_get(self, blocking=True):
+        """
+        Takes the next datagram from the ring of a background channel, waiting as set
+        on the reader (set_read_blocking, settimeout). Returns a triple
+            (data,addr,arrival_ns)
+        or None once the channel is closed (or when not blocking and the ring is empty).
+        """
+        timeout = self.reader.gettimeout() if blocking else 0
+        received = self._ring.get(timeout)
+        if received is None and blocking and not self._ring.closed:
+            if timeout == 0:
+                raise BlockingIOError('No datagram received')
+            raise socket.timeout('timed out')
+        return received
+
+    def get_nowait(self):
+        """
+        Returns the next message already in the ring of a background channel (as recv),
+        or raises queue.Empty.
+        """
+        return self._get_nowait(self._decode)
+
+    def get_object_nowait(self):
+        """
+        Same as get_nowait, but returns the next object as recv_object does.
+        """
+        return self._get_nowait(self._decode_object)
+
+    def _get_nowait(self, decoder):
+        if self._ring is None:
+            raise ValueError('Not a background channel')
+        received = self._receive(decoder, blocking=False)
+        if received is None:
+            raise queue.Empty
+        return received
+
+    def send_object(self, obj, codec=None, topic=None):
+        """
+        Sends data on the channel. What else?
+        The optional codec overrides the channel codec for this object.
+        The optional topic (e.g. /lights/kitchen) travels in the frame header.
+        """
+        self._transmit(self._encode_object(obj, codec, topic))
 
     def recv_object(self):
         """
@@ -131,26 +977,85 @@ class Channel:
             (data,addr)
         where addr is the sender address.
         """
-        data, addr = self.reader.recvfrom(self.bufsize)
-        if (data is None or len(data) == 0):
-            return None
+        return self._receive(self._decode_object)
 
-        if self.crypto is not None:
-            decrypted_bytes = self.crypto.decrypt(data)
-        else:
-            decrypted_bytes = data
+    def _receive_with_meta(self, decoder):
+        """
+        Receives the next message by means of recvmsg to collect the kernel arrival
+        time, and decodes it with decoder (see _receive).
+        """
+        if self._kernel_timestamps is None:
+            # the reader thread of a ring takes the arrival times (and may share the socket)
+            self._kernel_timestamps = self._ring is None and self.__init_timestamps__(self.reader)
+        control = mmsg.TIMESTAMP_CONTROL_SIZE + mmsg.DROPS_CONTROL_SIZE
+        while True:
+            kernel_ns = None
+            if self._backlog:
+                # the rest of a batch, arrived along with its first message
+                message, addr = self._backlog.popleft()
+                kernel_ns, received_ns = self._backlog_times
+            else:
+                if self._ring is not None:
+                    # the reader thread took the time of the arrival
+                    received = self._ring_get()
+                    if received is None:
+                        return None
+                    data, addr, received_ns = received
+                else:
+                    if control:
+                        data, ancdata, _, addr = self.reader.recvmsg(self.bufsize, control)
+                        if ancdata:
+                            kernel_ns = mmsg.parse_timestamp(ancdata)
+                            self._update_drops(mmsg.parse_drops(ancdata))
+                    else:
+                        data, addr = self.reader.recvfrom(self.bufsize)
+                    received_ns = time.time_ns()
+                if (data is None or len(data) == 0):
+                    return None
+                message = self._accept(data, addr, kernel_ns or received_ns)
+                if message is None:
+                    continue
+                self._backlog_times = (kernel_ns, received_ns)
+            try:
+                decoded = decoder(message)
+            except DecryptionException as ex:
+                self._reject(addr, ex)
+                continue
+            except Exception:
+                self.metrics.decode_errors += 1
+                raise
+            meta = MessageMeta(kernel_ns=kernel_ns, received_ns=received_ns, decoded_ns=time.time_ns())
+            if isinstance(message, frame.Frame):
+                meta.sent_ns = message.timestamp
+                meta.topic = message.topic
+                meta.sequence = message.sequence
+            return decoded, addr, meta
 
-        decrypted_b64 = base64.b64decode(decrypted_bytes)
-        data = pickle.loads(decrypted_b64)
-        return data, addr
+    def recv_with_meta(self):
+        """
+        Waits for data from the channel and returns a triple
+            (data,addr,meta)
+        where meta is the MessageMeta with the send time (timestamped senders), the
+        kernel arrival time (Linux), the read and decode times of the message.
+        The kernel timestamps are enabled by the first call: datagrams already queued
+        carry the time they are read. Background and shared channels report the time the
+        reader thread received the datagrams instead.
+        """
+        return self._receive_with_meta(self._decode)
 
-    def send(self, data):
+    def recv_object_with_meta(self):
+        """
+        Waits for an object from the channel and returns a triple (obj,addr,meta)
+        (see recv_with_meta).
+        """
+        return self._receive_with_meta(self._decode_object)
+
+    def send(self, data, topic=None):
         """
         Sends data on the channel. What else?
+        The optional topic (e.g. /lights/kitchen) travels in the frame header.
         """
-        if self.crypto is not None:
-            data = self.crypto.encrypt(data)
-        self.writer.sendto(data, (self.mcast_ip, self.mcast_port))
+        self._transmit(self._encode(data, topic))
 
     def recv(self):
         """
@@ -158,9 +1063,298 @@ class Channel:
             (data,addr)
         where addr is the sender address.
         """
-        data, addr = self.reader.recvfrom(self.bufsize)
-        if (data is None or len(data) == 0):
+        return self._receive(self._decode)
+
+    def _recv_batch(self, max_msgs, timeout):
+        """
+        Waits up to timeout seconds for the reader to become readable and drains
+        up to max_msgs raw datagrams (recvmmsg on Linux, a recvfrom loop elsewhere).
+        """
+        if self._backlog:
+            return [self._backlog.popleft() for _ in range(min(max_msgs, len(self._backlog)))]
+        if timeout is None and self.reader.gettimeout() == 0.0:
+            # non blocking channels just poll
+            timeout = 0
+        if self._ring is not None:
+            messages = []
+            for (data, addr, arrival_ns) in self._ring.get_many(max_msgs, timeout):
+                message = self._accept_batched(data, addr, arrival_ns)
+                if message is not None:
+                    messages.append((message, addr))
+                    if self._backlog:
+                        messages.extend(self._backlog)
+                        self._backlog.clear()
+            return self._keep_backlog(messages, max_msgs)
+        ready, _, _ = select.select([self.reader], [], [], timeout)
+        if not ready:
+            return []
+        if mmsg.HAVE_RECVMMSG:
+            if self._mmsg is None or self._mmsg.max_msgs < max_msgs or self._mmsg.bufsize != self.bufsize or \
+                    self._mmsg.timestamps != bool(self._kernel_timestamps):
+                self._mmsg = mmsg.MmsgReceiver(max_msgs, self.bufsize, self._drop_counter,
+                                               bool(self._kernel_timestamps))
+            batch = self._mmsg.recv(self.reader, max_msgs)
+            self._update_drops(self._mmsg.dropped)
+        else:
+            batch = self._drain(max_msgs)
+        messages = []
+        for (data, addr) in batch:
+            if len(data) > 0:
+                message = self._accept_batched(data, addr)
+                if message is not None:
+                    messages.append((message, addr))
+                    if self._backlog:
+                        messages.extend(self._backlog)
+                        self._backlog.clear()
+        return self._keep_backlog(messages, max_msgs)
+
+    def _keep_backlog(self, messages, max_msgs):
+        # the messages of the batches beyond max_msgs wait in the backlog for the next call
+        if len(messages) > max_msgs:
+            self._backlog.extendleft(reversed(messages[max_msgs:]))
+            del messages[max_msgs:]
+        return messages
+
+    def _accept_batched(self, data, addr, arrival_ns=None):
+        """
+        Same as _accept for a datagram of a batch: an invalid datagram (already counted
+        by the metrics) is discarded instead of losing the rest of the batch.
+        """
+        try:
+            return self._accept(data, addr, arrival_ns)
+        except (InvalidFrameException, CompressionException) as ex:
+            self.logger.debug('Discarding datagram from %s: %s' % (addr, ex))
             return None
+
+    def _update_drops(self, dropped):
+        if dropped is not None and dropped > self.metrics.kernel_drops:
+            self.metrics.kernel_drops = dropped
+
+    def _drain(self, max_msgs):
+        batch = []
+        previous_timeout = self.reader.gettimeout()
+        self.reader.setblocking(0)
+        try:
+            while len(batch) < max_msgs:
+                try:
+                    batch.append(self.reader.recvfrom(self.bufsize))
+                except BlockingIOError:
+                    break
+        finally:
+            self.reader.settimeout(previous_timeout)
+        return batch
+
+    def recv_many(self, max_msgs=64, timeout=None):
+        """
+        Receives up to max_msgs datagrams with as few syscalls as possible and
+        returns a list of couples
+            (data,addr)
+        The call waits at most timeout seconds (None: as set by set_read_blocking)
+        for the first datagram, then returns whatever is already queued.
+        An empty list means that no (whole) message arrived in time.
+        """
+        return self._decode_batch(self._recv_batch(max_msgs, timeout), self._decode)
+
+    def recv_objects_many(self, max_msgs=64, timeout=None):
+        """
+        Same as recv_many, but returns the received objects as recv_object does.
+        """
+        return self._decode_batch(self._recv_batch(max_msgs, timeout), self._decode_object)
+
+    def _send_batch(self, datagrams, dest=None):
+        """
+        Sends a list of encoded datagrams with as few syscalls as possible:
+        UDP GSO when their sizes allow it, then sendmmsg, then a loop of sendto.
+        Returns the number of datagrams queued.
+        """
+        dest = dest or (self.mcast_ip, self.mcast_port)
+        if self.pacer is not None:
+            return self._send_paced(datagrams, dest)
+        sent = 0
+        if self._gso and mmsg.is_uniform(datagrams):
+            try:
+                sent = mmsg.send_segmented(self.writer, datagrams, dest)
+            except OSError as ex:
+                self.logger.debug('UDP GSO not available on %s (%s): disabled' % (self, ex))
+                self._gso = False
+        if sent < len(datagrams) and mmsg.HAVE_SENDMMSG:
+            sent += mmsg.sendmmsg(self.writer, datagrams[sent:], dest)
+        else:
+            for data in datagrams[sent:]:
+                self.writer.sendto(data, dest)
+                sent += 1
+        self.metrics.datagrams_sent += sent
+        self.metrics.bytes_sent += sum(len(data) for data in datagrams[:sent])
+        if self._next_report is not None:
+            self._report()
+        return sent
+
+    def _send_paced(self, datagrams, dest):
+        """
+        Sends the datagrams one by one at the pace of the pacer: with PACING_TXTIME
+        every datagram carries its departure time.
+        """
+        for data in datagrams:
+            departure = self.pacer.schedule(len(data))
+            if departure is None:
+                self.writer.sendto(data, dest)
+            else:
+                self.writer.sendmsg([data], [(socket.SOL_SOCKET, mmsg.SCM_TXTIME, mmsg.TXTIME.pack(departure))], 0,
+                                    dest)
+            self.metrics.datagrams_sent += 1
+            self.metrics.bytes_sent += len(data)
+        if self._next_report is not None:
+            self._report()
+        return len(datagrams)
+
+    def send_raw(self, datagrams):
+        """
+        Sends a list of datagrams already encoded (e.g. recorded, see capture.py) as
+        they are: neither framed, encrypted, fragmented nor protected by FEC.
+        Returns the number of datagrams actually queued by the kernel.
+        """
+        return self._send_batch(datagrams)
+
+    def send_many(self, iterable, topic=None):
+        """
+        Sends every element of iterable as a separate datagram on the channel.
+        Returns the number of datagrams actually queued by the kernel.
+        """
+        return self._transmit_many([self._encode(data, topic) for data in iterable])
+
+    def send_objects_many(self, iterable, codec=None, topic=None):
+        """
+        Sends every object of iterable as send_object does.
+        Returns the number of datagrams actually queued by the kernel.
+        """
+        return self._transmit_many([self._encode_object(obj, codec, topic) for obj in iterable])
+
+    def recv_into(self, buffer):
+        """
+        Receives data from the channel straight into buffer (a writable bytes-like
+        object) and returns a couple
+            (nbytes,addr)
+        where buffer[:nbytes] is the received data.
+        Encrypted data is decrypted in place (as bytes), hence without encryption
+        the call does not allocate any buffer.
+        Reassembled messages larger than buffer raise ValueError.
+        """
+        metrics = self.metrics
+        while True:
+            if self._backlog:
+                message, addr = self._backlog.popleft()
+                # messages of a batch, or whole frames recovered by the FEC
+                try:
+                    return self._fill(buffer, message.open(self.crypto), addr)
+                except DecryptionException as ex:
+                    self._reject(addr, ex)
+                    continue
+            arrival_ns = None
+            if self._ring is not None:
+                received = self._ring_get()
+                if received is None:
+                    return None
+                nbytes, addr = self._fill(buffer, received[0], received[1])
+                arrival_ns = received[2]
+            elif self._drop_counter:
+                nbytes, ancdata, _, addr = self.reader.recvmsg_into([buffer], self._control_size())
+                if ancdata:
+                    self._update_drops(mmsg.parse_drops(ancdata))
+            else:
+                nbytes, addr = self.reader.recvfrom_into(buffer)
+            if nbytes == 0:
+                return None
+            metrics.datagrams_received += 1
+            metrics.bytes_received += nbytes
+            if self._next_report is not None:
+                self._report()
+            if self._recorder is not None:
+                self._recorder.record(memoryview(buffer)[:nbytes], addr, arrival_ns)
+            view = memoryview(buffer)[:nbytes]
+            if not frame.is_frame(view, not self.framed):
+                view.release()
+                if len(self._subscriptions) > 0:
+                    metrics.filtered += 1
+                    continue
+                metrics.messages_received += 1
+                break
+            try:
+                try:
+                    received = frame.Frame.parse(view)
+                    if received.nack or received.announce:
+                        self._overhear(received, addr)
+                        continue
+                    recovered = self._fec_decoder.add(addr, received) if received.fec is not None else None
+                    reassembled = received.fragment is not None
+                    if reassembled:
+                        whole = self._reassembler.add(addr, received)
+                        if whole is None:
+                            continue
+                        received = frame.Frame.parse(whole)
+                except InvalidFrameException:
+                    metrics.invalid_frames += 1
+                    raise
+                if recovered is not None:
+                    received = self._unprotect(recovered, addr)
+                    if received is None:
+                        continue
+                    data = received.open(self.crypto)
+                elif received.batch:
+                    received = self._unbatch(received, addr)
+                    if received is None:
+                        continue
+                    data = received.payload
+                elif not self._admit(received, addr):
+                    continue
+                elif received.encrypted or received.compressed or reassembled:
+                    data = received.open(self.crypto)
+                else:
+                    # move the payload over the header without any copy
+                    nbytes = len(received.payload)
+                    source = (ctypes.c_char * nbytes).from_buffer(received.payload)
+                    ctypes.memmove(ctypes.addressof((ctypes.c_char * nbytes).from_buffer(view)),
+                                   ctypes.addressof(source), nbytes)
+                    del source
+                    return nbytes, addr
+            except DecryptionException as ex:
+                self._reject(addr, ex)
+                continue
+            finally:
+                view.release()
+            return self._fill(buffer, data, addr)
         if self.crypto is not None:
-            data = self.crypto.decrypt(data)
-        return data, addr
+            data = self.crypto.decrypt(bytes(memoryview(buffer)[:nbytes]))
+            if isinstance(data, str):
+                data = data.encode(ENCODING)
+            nbytes = len(data)
+            buffer[:nbytes] = data
+        return nbytes, addr
+
+    def _fill(self, buffer, data, addr):
+        if len(data) > len(buffer):
+            raise ValueError(f'Message of {len(data)} bytes does not fit the buffer')
+        nbytes = len(data)
+        buffer[:nbytes] = data
+        return nbytes, addr
+
+    def recv_view(self):
+        """
+        Receives data from the channel into a buffer of the channel pool and returns
+        a couple
+            (payload,addr)
+        where payload is a PooledBuffer: its memoryview payload.view exposes the data
+        until payload.release() gives the buffer back to the pool.
+        """
+        if self.buffer_pool is None:
+            self.buffer_pool = BufferPool(self.bufsize)
+        buffer = self.buffer_pool.acquire()
+        try:
+            received = self.recv_into(buffer)
+        except BaseException:
+            self.buffer_pool.release(buffer)
+            raise
+        if received is None:
+            self.buffer_pool.release(buffer)
+            return None
+        nbytes, addr = received
+        return PooledBuffer(self.buffer_pool, buffer, nbytes), addr
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: coalesce.py
+Packs many small outgoing messages into a single datagram.
+
+Channels created with coalesce=<delay> do not send their messages right away: the
+messages (plain binary frames) are queued and sent together as the payload of a batch
+frame (FLAG_BATCH) as soon as the next one would not fit the datagram, or the first one
+has waited delay seconds. The batch is encrypted once and receivers split it back into
+the original messages: a burst of tiny updates costs one datagram, one encryption and
+one system call on both sides.
+"""
+
+import logging
+import threading
+import time
+
+DEFAULT_COALESCE_DELAY = 0.001
+# The Ethernet MTU minus the IPv4 and UDP headers: batches are not fragmented by IP
+DEFAULT_COALESCE_SIZE = 1472
+
+
+class Coalescer:
+    """
+    Queues the messages of every destination and hands them over to flush(messages, dest)
+    in batches of at most capacity bytes, at most delay seconds after the first message
+    of the batch (a background thread flushes the expired batches).
+    Messages larger than capacity are flushed alone.
+    """
+
+    def __init__(self, flush, capacity, delay=DEFAULT_COALESCE_DELAY):
+        if capacity <= 0:
+            raise ValueError(f'Invalid batch capacity: {capacity}')
+        self.capacity = capacity
+        self.delay = delay
+        self.batches = 0
+        self._flush = flush
+        self._condition = threading.Condition()
+        # destination -> [messages, size, deadline]
+        self._pending = {}
+        self._thread = None
+        self._closed = False
+
+    def __len__(self):
+        return sum(len(pending[0]) for pending in self._pending.values())
+
+    def add(self, message, dest=None):
+        """
+        Queues an encoded message for dest.
+        """
+        with self._condition:
+            if self._closed:
+                raise ValueError('Coalescer closed')
+            pending = self._pending.get(dest)
+            if pending is not None and pending[1] + len(message) > self.capacity:
+                self._send(dest)
+                pending = None
+            if pending is None:
+                pending = self._pending[dest] = [[], 0, time.monotonic() + self.delay]
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='multisock-coalesce', daemon=True)
+                    self._thread.start()
+                self._condition.notify()
+            pending[0].append(message)
+            pending[1] += len(message)
+            if pending[1] >= self.capacity:
+                self._send(dest)
+
+    def flush(self):
+        """
+        Sends all the queued messages right away.
+        """
+        with self._condition:
+            for dest in list(self._pending):
+                self._send(dest)
+
+    def close(self):
+        """
+        Sends the queued messages and stops the background thread.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            try:
+                for dest in list(self._pending):
+                    self._send(dest)
+            finally:
+                self._closed = True
+                self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _send(self, dest):
+        # invoked holding the lock: batches leave in the order they were filled
+        messages = self._pending.pop(dest)[0]
+        self.batches += 1
+        self._flush(messages, dest)
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                deadline = min(pending[2] for pending in self._pending.values())
+                if deadline > now:
+                    self._condition.wait(deadline - now)
+                    continue
+                for dest in [dest for (dest, pending) in self._pending.items() if pending[2] <= now]:
+                    try:
+                        self._send(dest)
+                    except OSError as ex:
+                        logging.getLogger().warning('Cannot send batch to %s: %s' % (dest, ex))
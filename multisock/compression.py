@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: compression.py
+The compression of the message payloads, applied before the encryption.
+
+Payloads of at least threshold bytes are compressed with zlib (raw deflate) when this
+makes them smaller; the frame flags them with the FLAG_COMPRESSED extension, which also
+carries the id of the preset dictionary used (0: none). Small messages repeating the same
+keys and class paths compress poorly alone: a dictionary trained on sample traffic
+primes zlib with them.
+
+    dictionary = train_dictionary(samples)     # shipped to all the nodes
+    udpchan = multisock.Channel('224.1.1.1', 1234, compressor=Compressor(dictionary=dictionary))
+
+The dictionary registry is process wide: receivers decompress the payloads of any
+registered dictionary (Compressor registers its own).
+"""
+
+import collections
+import hashlib
+import zlib
+from multisock.exceptions import CompressionException
+
+DEFAULT_THRESHOLD = 128
+DEFAULT_LEVEL = 6
+# zlib looks back at most 32k: a larger dictionary is useless
+MAX_DICTIONARY_SIZE = 32 * 1024
+DEFAULT_DICTIONARY_SIZE = 4096
+DEFAULT_SEGMENT_SIZE = 8
+# Bound to the decompressed payloads (protects receivers against compression bombs)
+MAX_DECOMPRESSED_SIZE = 16 * 1024 * 1024
+# raw deflate: no zlib header and checksum, the frame already tells the algorithm
+WBITS = -15
+
+_dictionaries = {}
+
+
+def dictionary_id(dictionary):
+    """
+    The id (a non zero 32 bit integer) of a dictionary.
+    """
+    return int.from_bytes(hashlib.blake2b(dictionary, digest_size=4).digest(), 'big') or 1
+
+
+def register_dictionary(dictionary):
+    """
+    Registers a preset dictionary (bytes) and returns its id.
+    """
+    dictionary = bytes(dictionary)
+    if not 0 < len(dictionary) <= MAX_DICTIONARY_SIZE:
+        raise CompressionException(f'Invalid dictionary size: {len(dictionary)}')
+    dict_id = dictionary_id(dictionary)
+    existing = _dictionaries.get(dict_id)
+    if existing is not None and existing != dictionary:
+        raise CompressionException(f'Dictionary id collision: {dict_id}')
+    _dictionaries[dict_id] = dictionary
+    return dict_id
+
+
+def unregister_dictionary(dict_id):
+    _dictionaries.pop(dict_id, None)
+
+
+def get_dictionary(dict_id):
+    dictionary = _dictionaries.get(dict_id)
+    if dictionary is None:
+        raise CompressionException(f'Unknown compression dictionary {dict_id}')
+    return dictionary
+
+
+def train_dictionary(samples, size=DEFAULT_DICTIONARY_SIZE, segment=DEFAULT_SEGMENT_SIZE):
+    """
+    Builds a preset dictionary of at most size bytes from sample payloads (e.g. the
+    encoded objects of a capture of the traffic). The dictionary is made of the
+    segments found in most samples; the most common ones come last, where zlib reaches
+    them with the shortest distances.
+    """
+    if not 0 < size <= MAX_DICTIONARY_SIZE:
+        raise CompressionException(f'Invalid dictionary size: {size}')
+    counts = collections.Counter()
+    for sample in samples:
+        sample = bytes(sample)
+        # every segment counts once per sample
+        counts.update({sample[i:i + segment] for i in range(max(len(sample) - segment + 1, 0))})
+    pieces = []
+    length = 0
+    for (data, count) in counts.most_common():
+        if count < 2 or length >= size:
+            break
+        if any(data in piece for piece in pieces):
+            continue
+        for (index, piece) in enumerate(pieces):
+            # a shifted segment of a longer repeated string: chain them
+            if piece.endswith(data[:-1]):
+                pieces[index] = piece + data[-1:]
+                break
+            if piece.startswith(data[1:]):
+                pieces[index] = data[:1] + piece
+                break
+        else:
+            pieces.append(data)
+            length += len(data) - 1
+        length += 1
+    if not pieces:
+        raise CompressionException('No segment repeated among the samples')
+    return b''.join(reversed(pieces))[-size:]
+
+
+def decompress(payload, dict_id=0):
+    """
+    Decompresses a payload compressed with the dictionary dict_id (0: none).
+    """
+    if dict_id:
+        decompressor = zlib.decompressobj(WBITS, zdict=get_dictionary(dict_id))
+    else:
+        decompressor = zlib.decompressobj(WBITS)
+    try:
+        data = decompressor.decompress(payload, MAX_DECOMPRESSED_SIZE)
+    except zlib.error as ex:
+        raise CompressionException(f'Invalid compressed payload: {ex}')
+    if decompressor.unconsumed_tail:
+        raise CompressionException('Decompressed payload too large')
+    if not decompressor.eof:
+        raise CompressionException('Truncated compressed payload')
+    return data
+
+
+class Compressor:
+    """
+    Compresses the payloads of at least threshold bytes with zlib at the given level,
+    priming it with the optional preset dictionary (registered on creation).
+    Payloads not getting smaller travel as they are.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, level=DEFAULT_LEVEL, dictionary=None):
+        self.threshold = threshold
+        self.level = level
+        if dictionary is not None:
+            self.dictionary_id = register_dictionary(dictionary)
+            # copies of a primed compressor skip the processing of the dictionary
+            self._template = zlib.compressobj(level, zlib.DEFLATED, WBITS, zdict=bytes(dictionary))
+        else:
+            self.dictionary_id = 0
+            self._template = zlib.compressobj(level, zlib.DEFLATED, WBITS)
+
+    def __repr__(self):
+        return 'Compressor<level=%d threshold=%d dictionary=%08x>' % (self.level, self.threshold, self.dictionary_id)
+
+    def compress(self, payload):
+        """
+        Returns the compressed payload, or None if it is not worth it.
+        """
+        if len(payload) < self.threshold:
+            return None
+        compressor = self._template.copy()
+        data = compressor.compress(payload) + compressor.flush()
+        return data if len(data) < len(payload) else None
@@ -3,13 +3,36 @@
 
 """
 Allows encryption of exchanged data.
+
+Two families of modes are available:
+- MODE_CBC (default): AES-CBC with the static iv derived from the passphrase, as in the
+  first releases (compatible with older peers).
+- MODE_GCM/MODE_CHACHA20: authenticated encryption (AES-GCM or ChaCha20-Poly1305) with a
+  key derived once from key and passphrase and a fresh nonce for every message. Tampered
+  or foreign messages are rejected by the tag check before being deserialized.
+  The nonces are a random prefix and a counter: forked processes draw a new prefix, so
+  that parent and child never reuse a nonce.
+  Only the binary frames (see frame.py) can carry these modes.
+  When the 'cryptography' package is installed its AEAD objects are used: they cache the
+  key schedule, which makes every message considerably cheaper.
 """
 
 import base64
+import hashlib
+import itertools
+import os
 import random
 import string
-from Crypto.Cipher import AES
-from multisock.exceptions import InvalidParameterException, InvalidKeyLenghtException, EncryptionInvalidParameterException
+import struct
+import weakref
+from Crypto.Cipher import AES, ChaCha20_Poly1305
+try:
+    # Optional: OpenSSL based AEAD objects keep the expanded key between messages
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+except ImportError:
+    AESGCM = None
+from multisock.exceptions import InvalidParameterException, InvalidKeyLenghtException, EncryptionInvalidParameterException, DecryptionException
 
 def get_random_string(length):
     letters = string.ascii_lowercase
@@ -20,21 +43,107 @@ MAX_KEY_LENGTH = 32
 ENCODING = 'utf-8'
 BS = 16
 
+MODE_CBC = 'cbc'
+MODE_GCM = 'gcm'
+MODE_CHACHA20 = 'chacha20-poly1305'
+AEAD_MODES = (MODE_GCM, MODE_CHACHA20)
+NONCE_SIZE = 12
+TAG_SIZE = 16
+KDF_ITERATIONS = 10000
+
+# The AEAD crypters of the process: a forked child draws new nonce prefixes for them
+_aead_crypters = weakref.WeakSet()
+
+
+def _reset_nonces():
+    for crypter in list(_aead_crypters):
+        crypter._reset_nonce()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_nonces)
+
 def is_empty_string(s):
     if s is None or not isinstance(s, str) or len(s.strip()) == 0:
         return True
     return False
 
 class Crypter:
-    def __init__(self, key, iv):
+    def __init__(self, key, iv, mode=MODE_CBC):
         if is_empty_string(key):
             raise InvalidParameterException('Invalid or empty parameter [key]')
         if len(key) > MAX_KEY_LENGTH:
             raise InvalidKeyLenghtException(f'Not supported key having length greater than {MAX_KEY_LENGTH} bytes')
         if is_empty_string(iv):
             raise InvalidParameterException('Invalid or empty parameter [iv]')
+        if mode != MODE_CBC and mode not in AEAD_MODES:
+            raise InvalidParameterException(f'Unsupported encryption mode [{mode}]')
         self.key = self.pad_key(key)
         self.iv = self.pad(iv)
+        self.mode = mode
+        self._args = (key, iv, mode)
+        if self.aead:
+            # derived once: every message only pays for the cipher initialization
+            self.aead_key = hashlib.pbkdf2_hmac('sha256', bytes(key, ENCODING), bytes(iv, ENCODING), KDF_ITERATIONS)
+            # nonce = random prefix of this instance (and process) + message counter: never reused
+            self._reset_nonce()
+            _aead_crypters.add(self)
+            self._cached_aead = None
+            if AESGCM is not None:
+                self._cached_aead = AESGCM(self.aead_key) if mode == MODE_GCM else ChaCha20Poly1305(self.aead_key)
+
+    def __reduce__(self):
+        # rebuilt from the original parameters (e.g. to be sent to worker processes)
+        return (Crypter, self._args)
+
+    def _reset_nonce(self):
+        self._nonce_prefix = os.urandom(4)
+        self._nonce_counter = itertools.count()
+
+    @property
+    def aead(self):
+        return self.mode in AEAD_MODES
+
+    def _aead_cipher(self, nonce):
+        if self.mode == MODE_GCM:
+            return AES.new(self.aead_key, AES.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+        return ChaCha20_Poly1305.new(key=self.aead_key, nonce=nonce)
+
+    def seal(self, raw, aad=None):
+        """
+        AEAD encryption: returns nonce + ciphertext + tag. The optional aad (e.g. the
+        frame header) is authenticated but not encrypted.
+        """
+        nonce = self._nonce_prefix + struct.pack('!Q', next(self._nonce_counter))
+        if self._cached_aead is not None:
+            return nonce + self._cached_aead.encrypt(nonce, bytes(raw), None if aad is None else bytes(aad))
+        cipher = self._aead_cipher(nonce)
+        if aad is not None:
+            cipher.update(aad)
+        ciphertext, tag = cipher.encrypt_and_digest(raw)
+        return nonce + ciphertext + tag
+
+    def unseal(self, enc, aad=None):
+        """
+        AEAD decryption of the output of seal. Raises DecryptionException if the
+        message (or the aad) has been tampered or was encrypted with another key.
+        """
+        if len(enc) < NONCE_SIZE + TAG_SIZE:
+            raise DecryptionException('Invalid ciphertext length')
+        enc = memoryview(enc)
+        if self._cached_aead is not None:
+            try:
+                return self._cached_aead.decrypt(bytes(enc[:NONCE_SIZE]), bytes(enc[NONCE_SIZE:]),
+                                                 None if aad is None else bytes(aad))
+            except InvalidTag:
+                raise DecryptionException('Message authentication failed')
+        cipher = self._aead_cipher(bytes(enc[:NONCE_SIZE]))
+        if aad is not None:
+            cipher.update(aad)
+        try:
+            return cipher.decrypt_and_verify(enc[NONCE_SIZE:-TAG_SIZE], enc[-TAG_SIZE:])
+        except ValueError:
+            raise DecryptionException('Message authentication failed')
 
     def unpad(self, s):
         return s[0:-ord(s[-1:])]
@@ -56,6 +165,12 @@ class Crypter:
     def encrypt(self, raw):
         if raw is None:
             raise InvalidParameterException('Invalid or empty parameter')
+        if self.aead:
+            if isinstance(raw, str):
+                raw = bytes(raw, ENCODING)
+            elif not isinstance(raw, (bytes, bytearray)):
+                raise EncryptionInvalidParameterException(f'Cannot manage objects of type: {type(raw)}')
+            return base64.encodebytes(self.seal(raw))
         raw = self.pad(raw)
         cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
         return base64.encodebytes(cipher.encrypt(raw))
@@ -64,8 +179,54 @@ class Crypter:
         if enc is None:
             raise InvalidParameterException('Invalid or empty parameter')
         enc = base64.decodebytes(enc)
+        if self.aead:
+            plain = self.unseal(enc)
+            try:
+                return plain.decode(ENCODING)
+            except UnicodeDecodeError:
+                return plain
         cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
+        plain = self.unpad(cipher.decrypt(enc))
         try:
-            return self.unpad(cipher.decrypt(enc)).decode(ENCODING)
-        except:
-            return self.unpad(cipher.decrypt(enc)[16:])
+            return plain.decode(ENCODING)
+        except UnicodeDecodeError:
+            # bytearrays are encrypted with a random 16 bytes prefix
+            return plain[16:]
+
+    def sealed_size(self, size):
+        """
+        The size of the output of encrypt_raw for an input of the given size.
+        """
+        if self.aead:
+            return NONCE_SIZE + size + TAG_SIZE
+        return (size // BS + 1) * BS
+
+    def encrypt_raw(self, raw, aad=None):
+        """
+        Encrypts bytes into raw ciphertext: PKCS#7 padding, no base64 (used by the binary frames).
+        In the AEAD modes no padding is needed and the optional aad is authenticated.
+        """
+        if raw is None:
+            raise InvalidParameterException('Invalid or empty parameter')
+        if self.aead:
+            return self.seal(raw, aad)
+        padding = BS - len(raw) % BS
+        cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
+        return cipher.encrypt(bytes(raw) + bytes((padding,)) * padding)
+
+    def decrypt_raw(self, enc, aad=None):
+        """
+        Decrypts the raw ciphertext produced by encrypt_raw.
+        """
+        if enc is None:
+            raise InvalidParameterException('Invalid or empty parameter')
+        if self.aead:
+            return self.unseal(enc, aad)
+        if len(enc) == 0 or len(enc) % BS != 0:
+            raise DecryptionException('Invalid ciphertext length')
+        cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
+        plain = cipher.decrypt(enc)
+        padding = plain[-1]
+        if padding == 0 or padding > BS:
+            raise DecryptionException('Invalid padding')
+        return plain[:-padding]
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: dedup.py
+The suppression of the copies of the same message (redundant senders relaying the same
+frames, hosts receiving the group from many interfaces).
+
+Channels created with dedup=True number their messages (as sequenced=True) and drop the
+messages whose (origin id, sequence number) they already received, right after the
+parsing of the header: the copies are neither decrypted nor deserialized. A message is
+tracked only once authenticated, so that a tampered copy arriving first (or a forged
+number far ahead) cannot shadow the genuine message.
+For every origin the filter keeps a sliding window of window bits (a bitmap of the
+numbers received up to the highest one); messages older than the window are dropped as
+well (stale). At most max_origins origins are tracked: the origin idle for the longest
+time is forgotten first.
+"""
+
+import collections
+from multisock.metrics import SEQUENCE_MASK, HALF_RANGE, MAX_SENDERS
+
+DEFAULT_DEDUP_WINDOW = 1024
+
+
+class DuplicateFilter:
+    """
+    Tells the messages already received by their (origin id, sequence number):
+    - duplicates: copies of messages already received
+    - stale: messages older than the window of their origin
+    - evicted: origins forgotten to track newer ones
+    """
+
+    def __init__(self, window=DEFAULT_DEDUP_WINDOW, max_origins=MAX_SENDERS):
+        if window <= 0:
+            raise ValueError(f'Invalid dedup window: {window}')
+        self.window = window
+        self.max_origins = max_origins
+        self.duplicates = 0
+        self.stale = 0
+        self.evicted = 0
+        self._mask = (1 << window) - 1
+        # origin id -> [highest sequence number, bitmap], the least recently seen first
+        self._windows = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._windows)
+
+    @property
+    def dropped(self):
+        return self.duplicates + self.stale
+
+    def seen(self, origin, sequence):
+        """
+        Tracks a message: returns True if it must be dropped (already received or stale).
+        """
+        if self.check(origin, sequence):
+            return True
+        self.add(origin, sequence)
+        return False
+
+    def check(self, origin, sequence):
+        """
+        Returns True if a message must be dropped (already received or stale), without
+        tracking it (see add).
+        """
+        window = self._windows.get(origin)
+        if window is None:
+            return False
+        self._windows.move_to_end(origin)
+        distance = (sequence - window[0]) & SEQUENCE_MASK
+        if distance == 0:
+            self.duplicates += 1
+            return True
+        if distance < HALF_RANGE:
+            return False
+        age = (window[0] - sequence) & SEQUENCE_MASK
+        if age >= self.window:
+            self.stale += 1
+            return True
+        if window[1] & (1 << age):
+            self.duplicates += 1
+            return True
+        return False
+
+    def add(self, origin, sequence):
+        """
+        Tracks a message that passed check().
+        """
+        window = self._windows.get(origin)
+        if window is None:
+            if len(self._windows) >= self.max_origins:
+                self._windows.popitem(last=False)
+                self.evicted += 1
+            self._windows[origin] = [sequence, 1]
+            return
+        self._windows.move_to_end(origin)
+        distance = (sequence - window[0]) & SEQUENCE_MASK
+        if distance < HALF_RANGE:
+            # newer than the highest: slide the window
+            window[1] = ((window[1] << distance) | 1) & self._mask if distance < self.window else 1
+            window[0] = sequence
+        else:
+            age = (window[0] - sequence) & SEQUENCE_MASK
+            if age < self.window:
+                window[1] |= 1 << age
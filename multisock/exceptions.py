@@ -4,3 +4,9 @@
 class InvalidParameterException(Exception): pass
 class InvalidKeyLenghtException(Exception): pass
 class EncryptionInvalidParameterException(Exception): pass
+class BufferPoolExhaustedException(Exception): pass
+class DecryptionException(Exception): pass
+class InvalidFrameException(Exception): pass
+class CodecException(Exception): pass
+class CompressionException(Exception): pass
+class InvalidSegmentException(Exception): pass
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: fec.py
+Forward error correction: receivers recover lost datagrams without a round trip.
+
+Senders created with fec=(N, K) wrap every datagram in a frame with the FLAG_FEC
+extension (group id, index, data count, parity count) and follow every group of N data
+datagrams with K parity datagrams: a receiver getting any N datagrams of a group
+rebuilds the missing data ones. K = 1 is a plain XOR parity; larger K use a systematic
+Reed-Solomon code over GF(256) (Cauchy matrix), whose byte arithmetic runs through
+bytes.translate tables and big integer XORs.
+
+Parity is computed on symbols made of the datagram length (2 bytes) and the datagram,
+zero padded to the longest datagram of the group. Groups are closed when full, at the
+end of every send_many, by flush() and at most delay seconds after their first datagram
+(a deadline shorter than the receivers' timeout, so that the parity of a partly filled
+group arrives while they still keep it): the parity frames carry the actual data count.
+
+Receivers keep the groups for at most timeout seconds and max_memory bytes: the data
+datagrams are delivered right away, the recovered ones as soon as enough parity arrives.
+"""
+
+import collections
+import functools
+import logging
+import random
+import struct
+import threading
+import time
+from multisock import frame
+from multisock.exceptions import InvalidFrameException
+
+DEFAULT_FEC_TIMEOUT = 1.0
+DEFAULT_FEC_DELAY = 0.01
+DEFAULT_FEC_MEMORY = 4 * 1024 * 1024
+MAX_GROUP_SIZE = 255
+LENGTH = struct.Struct('!H')
+# Bytes added to the largest datagram: frame header, FEC extension, symbol length
+OVERHEAD = frame.HEADER_SIZE + frame.FEC.size + LENGTH.size
+
+# GF(256) with the polynomial x^8 + x^4 + x^3 + x^2 + 1 and generator 2
+_EXP = [0] * 512
+_LOG = [0] * 256
+_value = 1
+for _power in range(255):
+    _EXP[_power] = _value
+    _LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11d
+for _power in range(255, 512):
+    _EXP[_power] = _EXP[_power - 255]
+
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def gf_inv(a):
+    if a == 0:
+        raise ZeroDivisionError('0 has no inverse in GF(256)')
+    return _EXP[255 - _LOG[a]]
+
+
+# bytes.translate tables multiplying every byte by a constant
+_MUL = [bytes(gf_mul(c, x) for x in range(256)) for c in range(256)]
+
+
+@functools.lru_cache(maxsize=64)
+def coefficients(data_count, parity_count):
+    """
+    The rows of the parity coefficients of a group: all ones (XOR) for a single parity,
+    the Cauchy matrix 1 / (x_j + y_i) with y_i = i and x_j = data_count + j otherwise
+    (every square submatrix is invertible: any data_count symbols rebuild the group).
+    """
+    if parity_count == 1:
+        return ((1,) * data_count,)
+    return tuple(tuple(gf_inv((data_count + j) ^ i) for i in range(data_count)) for j in range(parity_count))
+
+
+def _combine(symbols, factors, size):
+    """
+    Returns sum(factor * symbol) over GF(256) of equally sized symbols.
+    """
+    total = 0
+    for (symbol, factor) in zip(symbols, factors):
+        if factor == 0:
+            continue
+        if factor != 1:
+            symbol = symbol.translate(_MUL[factor])
+        total ^= int.from_bytes(symbol, 'little')
+    return total.to_bytes(size, 'little')
+
+
+def _invert(matrix):
+    """
+    Inverts a square matrix over GF(256) (Gauss-Jordan elimination).
+    """
+    size = len(matrix)
+    rows = [list(row) + [1 if i == j else 0 for j in range(size)] for (i, row) in enumerate(matrix)]
+    for column in range(size):
+        pivot = next(r for r in range(column, size) if rows[r][column])
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        scale = gf_inv(rows[column][column])
+        rows[column] = [gf_mul(scale, value) for value in rows[column]]
+        for r in range(size):
+            factor = rows[r][column]
+            if r != column and factor:
+                rows[r] = [value ^ gf_mul(factor, pivot_value) for (value, pivot_value) in zip(rows[r], rows[column])]
+    return [row[size:] for row in rows]
+
+
+def _symbols(datagrams):
+    size = max(len(datagram) for datagram in datagrams) + LENGTH.size
+    return [(LENGTH.pack(len(datagram)) + datagram).ljust(size, b'\0') for datagram in datagrams], size
+
+
+def encode_parity(datagrams, parity_count):
+    """
+    Returns the parity_count parity symbols of a group of datagrams.
+    """
+    symbols, size = _symbols(datagrams)
+    return [_combine(symbols, row, size) for row in coefficients(len(datagrams), parity_count)]
+
+
+class FecEncoder:
+    """
+    Wraps the outgoing datagrams in FEC frames and adds the parity ones, grouping the
+    datagrams of every destination by data_count. If delay is not None the groups still
+    open delay seconds after their first datagram are closed by a background thread,
+    which hands their parity over to send(parity, dest).
+    """
+
+    def __init__(self, data_count, parity_count, delay=None, send=None):
+        if data_count < 1 or parity_count < 1 or data_count + parity_count > MAX_GROUP_SIZE:
+            raise ValueError(f'Invalid FEC group: {data_count} data + {parity_count} parity')
+        self.data_count = data_count
+        self.parity_count = parity_count
+        self.delay = delay
+        self.parity_sent = 0
+        self.overhead_bytes = 0
+        self._send = send
+        self._next_group = random.getrandbits(32)
+        # destination -> (group id, datagrams, deadline)
+        self._groups = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def protect(self, datagrams, dest=None, close=False):
+        """
+        Returns the datagrams to send in place of datagrams (to dest): their FEC frames,
+        followed by the parity of the groups they complete (and of the current group of
+        dest if close is True).
+        """
+        protected = []
+        with self._condition:
+            for datagram in datagrams:
+                group = self._groups.get(dest)
+                if group is None:
+                    group = self._open(dest)
+                group_id, members, _ = group
+                protected.append(frame.encode(frame.CODEC_RAW, datagram,
+                                              fec=(group_id, len(members), self.data_count, self.parity_count)))
+                self.overhead_bytes += frame.HEADER_SIZE + frame.FEC.size
+                members.append(bytes(datagram))
+                if len(members) == self.data_count:
+                    protected.extend(self._close(dest))
+            if close and dest in self._groups:
+                protected.extend(self._close(dest))
+        return protected
+
+    def flush(self):
+        """
+        Closes the groups of every destination: returns a list of couples
+            (dest,parity datagrams)
+        """
+        with self._condition:
+            return [(dest, self._close(dest)) for dest in list(self._groups)]
+
+    def close(self):
+        """
+        Stops the background thread (the parity of the open groups is not sent: see flush).
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _open(self, dest):
+        # invoked holding the lock
+        deadline = time.monotonic() + self.delay if self.delay is not None else None
+        group = self._groups[dest] = (self._next_group, [], deadline)
+        self._next_group = (self._next_group + 1) & 0xFFFFFFFF
+        if deadline is not None and not self._closed:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='multisock-fec', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return group
+
+    def _close(self, dest):
+        group_id, members, _ = self._groups.pop(dest)
+        count = len(members)
+        parity = [frame.encode(frame.CODEC_RAW, symbol, fec=(group_id, count + j, count, self.parity_count))
+                  for (j, symbol) in enumerate(encode_parity(members, self.parity_count))]
+        self.parity_sent += len(parity)
+        self.overhead_bytes += sum(len(datagram) for datagram in parity)
+        return parity
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                if not self._groups:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                deadline = min(group[2] for group in self._groups.values())
+                if deadline > now:
+                    self._condition.wait(deadline - now)
+                    continue
+                for dest in [dest for (dest, group) in self._groups.items() if group[2] <= now]:
+                    try:
+                        self._send(self._close(dest), dest)
+                    except OSError as ex:
+                        logging.getLogger().warning('Cannot send FEC parity to %s: %s' % (dest, ex))
+
+
+class _Group:
+    __slots__ = ('data', 'parity', 'data_count', 'parity_count', 'delivered', 'size', 'deadline', 'done')
+
+    def __init__(self, deadline):
+        self.data = {}
+        self.parity = {}
+        self.data_count = None
+        self.parity_count = None
+        self.delivered = set()
+        self.size = 0
+        self.deadline = deadline
+        self.done = False
+
+
+class FecDecoder:
+    """
+    Delivers the datagrams carried by FEC frames and rebuilds the lost ones. Groups are
+    keyed by sender address and group id; the table never holds more than max_memory
+    bytes of datagrams and forgets the groups timeout seconds after their first datagram.
+    - recovered: datagrams rebuilt from the parity
+    - unrecoverable: datagrams lost beyond the parity of their group (as far as detected)
+    """
+
+    def __init__(self, timeout=DEFAULT_FEC_TIMEOUT, max_memory=DEFAULT_FEC_MEMORY):
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.memory = 0
+        self.recovered = 0
+        self.unrecoverable = 0
+        self.evicted = 0
+        # insertion ordered: the oldest groups come first
+        self._groups = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._groups)
+
+    def add(self, addr, received):
+        """
+        Stores a FEC frame (a parsed Frame). Returns the list of the datagrams to
+        process: the data datagram carried and those recovered thanks to it.
+        """
+        now = time.monotonic()
+        self._expire(now)
+        group_id, index, data_count, parity_count = received.fec
+        if index >= data_count + parity_count:
+            raise InvalidFrameException(f'Invalid FEC index {index}/{data_count}+{parity_count}')
+        key = (addr, group_id)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _Group(now + self.timeout)
+        datagram = bytes(received.payload)
+        if index < data_count:
+            if index in group.delivered:
+                # duplicated, or already recovered
+                return []
+            group.delivered.add(index)
+            datagrams = [datagram]
+            if group.done:
+                return datagrams
+            group.data[index] = datagram
+        else:
+            if group.done or index - data_count in group.parity:
+                return []
+            if group.data_count is not None and (group.data_count, group.parity_count) != (data_count, parity_count):
+                raise InvalidFrameException('Inconsistent FEC group')
+            group.data_count = data_count
+            group.parity_count = parity_count
+            group.parity[index - data_count] = datagram
+            datagrams = []
+        group.size += len(datagram)
+        self.memory += len(datagram)
+        if group.data_count is not None:
+            datagrams.extend(self._recover(key, group))
+        while self.memory > self.max_memory and self._groups:
+            self._drop(next(iter(self._groups)))
+            self.evicted += 1
+        return datagrams
+
+    def _recover(self, key, group):
+        missing = [i for i in range(group.data_count) if i not in group.delivered]
+        if missing and len(group.parity) < len(missing):
+            return []
+        recovered = []
+        if missing:
+            try:
+                recovered = self._solve(group, missing)
+            except (InvalidFrameException, struct.error):
+                self.unrecoverable += len(missing)
+            else:
+                self.recovered += len(recovered)
+                group.delivered.update(missing)
+        # keep the group (without its datagrams) to discard late duplicates
+        group.done = True
+        self.memory -= group.size
+        group.size = 0
+        group.data = group.parity = None
+        return recovered
+
+    def _solve(self, group, missing):
+        rows = coefficients(group.data_count, group.parity_count)
+        used = sorted(group.parity)[:len(missing)]
+        size = len(group.parity[used[0]])
+        known = sorted(group.data)
+        symbols = []
+        for i in known:
+            datagram = group.data[i]
+            if len(datagram) + LENGTH.size > size:
+                raise InvalidFrameException('FEC datagram larger than its parity')
+            symbols.append((LENGTH.pack(len(datagram)) + datagram).ljust(size, b'\0'))
+        # the parity minus the known data: a combination of the missing symbols only
+        syndromes = []
+        for j in used:
+            if len(group.parity[j]) != size:
+                raise InvalidFrameException('FEC parity of different sizes')
+            row = rows[j]
+            syndromes.append(_combine([group.parity[j]] + symbols, [1] + [row[i] for i in known], size))
+        inverse = _invert([[rows[j][i] for i in missing] for j in used])
+        datagrams = []
+        for row in inverse:
+            symbol = _combine(syndromes, row, size)
+            length = LENGTH.unpack_from(symbol)[0]
+            if length + LENGTH.size > size:
+                raise InvalidFrameException('Invalid recovered FEC datagram')
+            datagrams.append(symbol[LENGTH.size:LENGTH.size + length])
+        return datagrams
+
+    def _expire(self, now):
+        while self._groups:
+            key, group = next(iter(self._groups.items()))
+            if group.deadline > now:
+                break
+            self._drop(key)
+
+    def _drop(self, key):
+        group = self._groups.pop(key)
+        self.memory -= group.size
+        if not group.done:
+            if group.data_count is not None:
+                self.unrecoverable += group.data_count - len(group.delivered)
+            elif group.delivered:
+                # no parity arrived: only the holes before the last datagram are known
+                self.unrecoverable += max(group.delivered) + 1 - len(group.delivered)
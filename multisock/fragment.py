@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: fragment.py
+Application level fragmentation of the messages larger than the path MTU.
+
+A message is split in chunks each carried by a frame with the FLAG_FRAGMENT extension
+(message id, index, count). Receivers collect the chunks in a reassembly table bounded
+both in time (a partial message expires timeout seconds after its first fragment) and
+in memory (the oldest partial messages are evicted when the limit is exceeded). The
+memory accounted includes the bookkeeping of every partial message and chunk, and
+messages whose fragments cannot fit the limit are rejected on their first fragment.
+"""
+
+import collections
+import random
+import time
+from multisock import frame
+from multisock.exceptions import InvalidFrameException
+
+DEFAULT_MTU = 1400
+DEFAULT_REASSEMBLY_TIMEOUT = 2.0
+DEFAULT_REASSEMBLY_MEMORY = 4 * 1024 * 1024
+# Approximate bytes taken by the bookkeeping of a partial message and of a chunk
+PARTIAL_OVERHEAD = 256
+CHUNK_OVERHEAD = 64
+
+
+class Fragmenter:
+    """
+    Splits the datagrams larger than mtu bytes into fragments of at most mtu bytes.
+    """
+
+    def __init__(self, mtu=DEFAULT_MTU):
+        self.chunk_size = mtu - frame.HEADER_SIZE - frame.FRAGMENT.size
+        if self.chunk_size <= 0:
+            raise ValueError(f'MTU too small: {mtu}')
+        self.mtu = mtu
+        self._next_id = random.getrandbits(32)
+
+    def split(self, datagram):
+        """
+        Returns the list of datagrams to send in place of datagram.
+        """
+        if len(datagram) <= self.mtu:
+            return [datagram]
+        count = -(-len(datagram) // self.chunk_size)
+        if count > 0xFFFF:
+            raise InvalidFrameException(f'Message too large: {len(datagram)} bytes')
+        msg_id = self._next_id
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        view = memoryview(datagram)
+        size = self.chunk_size
+        return [frame.encode(frame.CODEC_RAW, view[i * size:(i + 1) * size], fragment=(msg_id, i, count))
+                for i in range(count)]
+
+
+class _Partial:
+    __slots__ = ('count', 'chunks', 'received', 'size', 'deadline')
+
+    def __init__(self, count, deadline):
+        self.count = count
+        # index -> chunk: the chunks received only
+        self.chunks = {}
+        self.received = 0
+        self.size = PARTIAL_OVERHEAD
+        self.deadline = deadline
+
+
+class Reassembler:
+    """
+    Rebuilds the fragmented messages. Partial messages are keyed by sender address
+    and message id; the table never holds more than max_memory bytes of chunks and
+    bookkeeping.
+    """
+
+    def __init__(self, timeout=DEFAULT_REASSEMBLY_TIMEOUT, max_memory=DEFAULT_REASSEMBLY_MEMORY):
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.memory = 0
+        self.completed = 0
+        self.expired = 0
+        self.evicted = 0
+        # insertion ordered: the oldest partial messages come first
+        self._partials = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._partials)
+
+    def add(self, addr, fragment):
+        """
+        Stores a fragment (a parsed Frame). Returns the whole message once its last
+        missing fragment arrives, None otherwise.
+        """
+        now = time.monotonic()
+        self._expire(now)
+        msg_id, index, count = fragment.fragment
+        if index >= count:
+            raise InvalidFrameException(f'Invalid fragment {index}/{count}')
+        # all the fragments but the last one carry chunks of the same size
+        least = (count - 1) * (len(fragment.payload) if index < count - 1 else 1)
+        if PARTIAL_OVERHEAD + least + count * CHUNK_OVERHEAD > self.max_memory:
+            raise InvalidFrameException(f'Fragmented message too large: {count} fragments')
+        key = (addr, msg_id)
+        partial = self._partials.get(key)
+        if partial is not None and partial.count != count:
+            # the sender restarted its message ids: the old message is lost
+            self._drop(key)
+            partial = None
+        if partial is None:
+            partial = _Partial(count, now + self.timeout)
+            self._partials[key] = partial
+            self.memory += PARTIAL_OVERHEAD
+        if index in partial.chunks:
+            # duplicated fragment
+            return None
+        chunk = bytes(fragment.payload)
+        partial.chunks[index] = chunk
+        partial.received += 1
+        partial.size += len(chunk) + CHUNK_OVERHEAD
+        self.memory += len(chunk) + CHUNK_OVERHEAD
+        if partial.received == count:
+            self._drop(key)
+            self.completed += 1
+            return b''.join(partial.chunks[i] for i in range(count))
+        while self.memory > self.max_memory and self._partials:
+            self._drop(next(iter(self._partials)))
+            self.evicted += 1
+        return None
+
+    def _expire(self, now):
+        while self._partials:
+            key, partial = next(iter(self._partials.items()))
+            if partial.deadline > now:
+                break
+            self._drop(key)
+            self.expired += 1
+
+    def _drop(self, key):
+        partial = self._partials.pop(key)
+        self.memory -= partial.size
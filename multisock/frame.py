@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: frame.py
+The binary wire format of the channels.
+
+A frame is a fixed 10 bytes header, the optional header extensions announced by the
+flags and the (possibly encrypted) payload:
+
+    +-------+-------+---------+-------+---------+---------+
+    | magic (2)     | version | codec | flags   | length  |
+    | 0xD5 0x4D     | (1)     | (1)   | (2)     | (4)     |
+    +-------+-------+---------+-------+---------+---------+
+    | extensions, in the order of their flag bits          |
+    +------------------------------------------------------+
+    | payload (length bytes): raw serialized data or raw ciphertext |
+    +----------------------------------------------------------------+
+
+Extensions:
+    FLAG_FRAGMENT: message id (4), fragment index (2), fragment count (2)
+    FLAG_TOPIC: topic length (1), utf-8 topic (e.g. /lights/kitchen)
+    FLAG_SEQUENCE: origin id (4) of the sending channel, message sequence number (4)
+    FLAG_TIMESTAMP: send time (8), nanoseconds since the epoch
+    FLAG_COMPRESSED: id (4) of the preset dictionary (0: none) of the payload, compressed
+    before the encryption (see compression.py)
+    FLAG_FEC: group id (4), index (1), data count (1), parity count (1) of a datagram
+    protected by forward error correction, carried as payload (see fec.py)
+
+A batch frame (FLAG_BATCH) carries many messages sent together (see coalesce.py): its
+plain payload is the concatenation of their frames, neither encrypted nor fragmented.
+A NACK frame (FLAG_NACK) carries the sequence numbers of the messages a receiver of a
+reliable channel asks to retransmit, an announcement frame (FLAG_ANNOUNCE) the highest
+sequence number sent by the sender of a reliable channel (see nack.py).
+
+Multi-byte fields are in network byte order. With the AEAD modes of the Crypter the
+header (extensions included) is authenticated together with the payload.
+
+The first byte of the magic is not an ascii character, thus a frame is never confused
+with the base64 text of the legacy format: receivers accept both formats on the same channel.
+Unencrypted legacy datagrams carry arbitrary bytes: channels not framed take a datagram
+starting with the magic for a frame only if its header is valid (see is_frame).
+"""
+
+import struct
+from multisock import compression
+from multisock.exceptions import InvalidFrameException
+
+MAGIC = b'\xd5\x4d'
+VERSION = 1
+HEADER = struct.Struct('!2sBBHI')
+HEADER_SIZE = HEADER.size
+# Offset of the flags in the header
+FLAGS_OFFSET = 4
+FRAGMENT = struct.Struct('!IHH')
+TOPIC_LENGTH = struct.Struct('!B')
+MAX_TOPIC_LENGTH = 255
+SEQUENCE = struct.Struct('!II')
+TIMESTAMP = struct.Struct('!Q')
+COMPRESSION = struct.Struct('!I')
+FEC = struct.Struct('!IBBB')
+
+# Codecs: how the payload has to be interpreted once decrypted
+CODEC_RAW = 0
+CODEC_TEXT = 1
+CODEC_PICKLE = 2
+CODEC_MARSHAL = 3
+CODEC_JSON = 4
+# Ids from CODEC_USER on are free for the application codecs (e.g. schema codecs)
+CODEC_USER = 64
+
+# Flags
+FLAG_ENCRYPTED = 0x0001
+FLAG_FRAGMENT = 0x0002
+FLAG_TOPIC = 0x0004
+FLAG_SEQUENCE = 0x0008
+FLAG_TIMESTAMP = 0x0010
+FLAG_BATCH = 0x0020
+FLAG_COMPRESSED = 0x0040
+FLAG_FEC = 0x0080
+FLAG_NACK = 0x0100
+FLAG_ANNOUNCE = 0x0200
+KNOWN_FLAGS = (FLAG_ENCRYPTED | FLAG_FRAGMENT | FLAG_TOPIC | FLAG_SEQUENCE | FLAG_TIMESTAMP | FLAG_BATCH
+               | FLAG_COMPRESSED | FLAG_FEC | FLAG_NACK | FLAG_ANNOUNCE)
+# Flags not allowed to the frames of a batch
+BATCHED_FLAGS = FLAG_ENCRYPTED | FLAG_FRAGMENT | FLAG_BATCH | FLAG_FEC | FLAG_NACK | FLAG_ANNOUNCE
+
+
+def is_frame(data, validate=False):
+    """
+    True if data starts with the frame magic (otherwise it is a legacy datagram).
+    If validate, the version, the flags and the length of the header must be valid too:
+    a legacy datagram that merely starts with the magic is not taken for a frame.
+    """
+    if len(data) < HEADER_SIZE or data[0] != MAGIC[0] or data[1] != MAGIC[1]:
+        return False
+    if not validate:
+        return True
+    _, version, _, flags, length = HEADER.unpack_from(data)
+    return version == VERSION and not flags & ~KNOWN_FLAGS and HEADER_SIZE + length <= len(data)
+
+
+def encode(codec, payload, crypto=None, flags=0, fragment=None, topic=None, sequence=None, timestamp=None,
+           compressor=None, fec=None):
+    """
+    Builds the frame carrying payload (bytes), compressing it if compressor is given
+    (and the payload is worth it) and encrypting it if crypto is given.
+    The optional extensions are:
+    - fragment: the (message id, index, count) of a fragment
+    - topic: the topic (str) of the message
+    - sequence: the (origin id, sequence number) of the message
+    - timestamp: the send time of the message (time.time_ns())
+    - fec: the (group id, index, data count, parity count) of a FEC datagram
+    """
+    if crypto is not None:
+        flags |= FLAG_ENCRYPTED
+    extensions = b''
+    try:
+        if fragment is not None:
+            flags |= FLAG_FRAGMENT
+            extensions += FRAGMENT.pack(*fragment)
+        if topic is not None:
+            flags |= FLAG_TOPIC
+            topic = topic.encode('utf-8')
+            extensions += TOPIC_LENGTH.pack(len(topic)) + topic
+        if sequence is not None:
+            flags |= FLAG_SEQUENCE
+            extensions += SEQUENCE.pack(*sequence)
+        if timestamp is not None:
+            flags |= FLAG_TIMESTAMP
+            extensions += TIMESTAMP.pack(timestamp)
+        if compressor is not None:
+            compressed = compressor.compress(payload)
+            if compressed is not None:
+                flags |= FLAG_COMPRESSED
+                extensions += COMPRESSION.pack(compressor.dictionary_id)
+                payload = compressed
+        if fec is not None:
+            flags |= FLAG_FEC
+            extensions += FEC.pack(*fec)
+    except struct.error as ex:
+        raise InvalidFrameException(f'Invalid frame extension: {ex}')
+    if crypto is None:
+        return HEADER.pack(MAGIC, VERSION, codec, flags, len(payload)) + extensions + payload
+    header = HEADER.pack(MAGIC, VERSION, codec, flags, crypto.sealed_size(len(payload))) + extensions
+    return header + crypto.encrypt_raw(payload, header)
+
+
+def encode_batch(frames, crypto=None, compressor=None):
+    """
+    Builds the batch frame carrying the given (plain) frames, compressing and encrypting
+    them at once if compressor and crypto are given.
+    """
+    return encode(CODEC_RAW, b''.join(frames), crypto, FLAG_BATCH, compressor=compressor)
+
+
+def split_batch(payload):
+    """
+    Returns the frames carried by the plain payload of a batch frame.
+    """
+    frames = []
+    view = memoryview(payload)
+    offset = 0
+    while offset < len(view):
+        inner = Frame.parse(view[offset:])
+        if inner.flags & BATCHED_FLAGS:
+            raise InvalidFrameException(f'Unsupported flags in batch 0x{inner.flags:04x}')
+        frames.append(inner)
+        offset += len(inner.header) + len(inner.payload)
+    return frames
+
+
+class Frame:
+    """
+    A frame parsed from a datagram. Parsing only reads the header: the payload is
+    decrypted by open(), so that frames can be inspected (and discarded) cheaply.
+    """
+    __slots__ = ('version', 'codec', 'flags', 'payload', 'header', 'fragment', 'topic', 'sequence', 'timestamp',
+                 'dictionary', 'fec', 'plain')
+
+    def __init__(self, codec, payload, flags=0, version=VERSION, header=None, fragment=None, topic=None,
+                 sequence=None, timestamp=None, dictionary=0, fec=None):
+        self.version = version
+        self.codec = codec
+        self.flags = flags
+        self.payload = payload
+        self.header = header
+        self.fragment = fragment
+        self.topic = topic
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.dictionary = dictionary
+        self.fec = fec
+        # the decrypted payload, once authenticated
+        self.plain = None
+
+    def __repr__(self):
+        return 'Frame<v%d codec=%d flags=0x%04x len=%d>' % (self.version, self.codec, self.flags, len(self.payload))
+
+    @classmethod
+    def parse(cls, data):
+        """
+        Parses the header of a datagram. The payload is a memoryview on data.
+        """
+        if len(data) < HEADER_SIZE:
+            raise InvalidFrameException('Datagram shorter than the frame header')
+        magic, version, codec, flags, length = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise InvalidFrameException('Invalid frame magic')
+        if version != VERSION:
+            raise InvalidFrameException(f'Unsupported frame version {version}')
+        if flags & ~KNOWN_FLAGS:
+            raise InvalidFrameException(f'Unsupported frame flags 0x{flags:04x}')
+        offset = HEADER_SIZE
+        fragment = None
+        topic = None
+        sequence = None
+        timestamp = None
+        dictionary = 0
+        fec = None
+        try:
+            if flags & FLAG_FRAGMENT:
+                fragment = FRAGMENT.unpack_from(data, offset)
+                offset += FRAGMENT.size
+            if flags & FLAG_TOPIC:
+                size = data[offset]
+                offset += TOPIC_LENGTH.size
+                if offset + size > len(data):
+                    raise InvalidFrameException('Truncated frame header')
+                topic = str(data[offset:offset + size], 'utf-8')
+                offset += size
+            if flags & FLAG_SEQUENCE:
+                sequence = SEQUENCE.unpack_from(data, offset)
+                offset += SEQUENCE.size
+            if flags & FLAG_TIMESTAMP:
+                timestamp = TIMESTAMP.unpack_from(data, offset)[0]
+                offset += TIMESTAMP.size
+            if flags & FLAG_COMPRESSED:
+                dictionary = COMPRESSION.unpack_from(data, offset)[0]
+                offset += COMPRESSION.size
+            if flags & FLAG_FEC:
+                fec = FEC.unpack_from(data, offset)
+                offset += FEC.size
+        except (struct.error, IndexError):
+            raise InvalidFrameException('Truncated frame header')
+        except UnicodeDecodeError:
+            raise InvalidFrameException('Invalid topic')
+        if offset + length > len(data):
+            raise InvalidFrameException('Truncated frame')
+        view = memoryview(data)
+        return cls(codec, view[offset:offset + length], flags, version, view[:offset], fragment, topic, sequence,
+                   timestamp, dictionary, fec)
+
+    def tobytes(self):
+        """
+        The frame as a standalone datagram (e.g. to hand it over to another process).
+        """
+        return bytes(self.header) + bytes(self.payload)
+
+    @property
+    def encrypted(self):
+        return bool(self.flags & FLAG_ENCRYPTED)
+
+    @property
+    def batch(self):
+        return bool(self.flags & FLAG_BATCH)
+
+    @property
+    def compressed(self):
+        return bool(self.flags & FLAG_COMPRESSED)
+
+    @property
+    def nack(self):
+        return bool(self.flags & FLAG_NACK)
+
+    @property
+    def announce(self):
+        return bool(self.flags & FLAG_ANNOUNCE)
+
+    def authenticate(self, crypto=None):
+        """
+        Decrypts the payload of an encrypted frame, raising DecryptionException if it was
+        tampered with: returns the decrypted payload, kept for open().
+        """
+        if self.plain is None:
+            if crypto is None:
+                raise InvalidFrameException('Encrypted frame received on a channel without crypto')
+            self.plain = crypto.decrypt_raw(self.payload, self.header)
+        return self.plain
+
+    def open(self, crypto=None):
+        """
+        Returns the plain payload, decrypting and decompressing it when needed.
+        """
+        payload = self.payload
+        if self.encrypted:
+            payload = self.authenticate(crypto)
+        if self.compressed:
+            payload = compression.decompress(payload, self.dictionary)
+        return payload
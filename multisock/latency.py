@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: latency.py
+Timing information of the received messages.
+
+Senders of channels created with timestamped=True stamp their messages with the send
+time (FLAG_TIMESTAMP frame extension), receivers keep a one-way latency histogram for
+every sender. Histograms have fixed log-scale buckets (BUCKETS_PER_OCTAVE buckets per
+power of two nanoseconds) so their memory does not depend on the number of samples.
+
+One-way latencies are meaningful only between hosts with synchronized clocks (PTP/NTP).
+"""
+
+BUCKETS_PER_OCTAVE = 4
+# 2^40 ns: about 18 minutes
+MAX_OCTAVE = 40
+BUCKETS = MAX_OCTAVE * BUCKETS_PER_OCTAVE
+# Max number of senders with an histogram
+MAX_SENDERS = 1024
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_of(ns):
+    """
+    Returns the index of the bucket of a latency of ns nanoseconds (ns >= 0).
+    """
+    if ns < BUCKETS_PER_OCTAVE:
+        return ns
+    octave = ns.bit_length() - 1
+    # the 2 bits following the most significant one select the bucket in the octave
+    index = octave * BUCKETS_PER_OCTAVE + ((ns >> (octave - 2)) & 3)
+    return index if index < BUCKETS else BUCKETS - 1
+
+
+def bucket_bound(index):
+    """
+    Returns the upper bound (excluded) in nanoseconds of a bucket.
+    """
+    if index < BUCKETS_PER_OCTAVE:
+        return index + 1
+    octave, sub = divmod(index, BUCKETS_PER_OCTAVE)
+    return ((BUCKETS_PER_OCTAVE + sub + 1) << octave) >> 2
+
+
+class MessageMeta:
+    """
+    The timing of a message returned by recv_with_meta, all in nanoseconds since the
+    epoch (None when unknown):
+    - sent_ns: stamped by the sender (timestamped channels only)
+    - kernel_ns: arrival in the kernel of the (last) datagram (SO_TIMESTAMPNS, Linux)
+    - received_ns: read from the socket
+    - decoded_ns: decrypted and deserialized
+    """
+    __slots__ = ('sent_ns', 'kernel_ns', 'received_ns', 'decoded_ns', 'topic', 'sequence')
+
+    def __init__(self, sent_ns=None, kernel_ns=None, received_ns=None, decoded_ns=None, topic=None, sequence=None):
+        self.sent_ns = sent_ns
+        self.kernel_ns = kernel_ns
+        self.received_ns = received_ns
+        self.decoded_ns = decoded_ns
+        self.topic = topic
+        self.sequence = sequence
+
+    def __repr__(self):
+        return 'MessageMeta<network=%s queue=%s decode=%s>' % (self.network_latency, self.queue_latency,
+                                                               self.decode_latency)
+
+    @staticmethod
+    def _delta(start, end):
+        return None if start is None or end is None else end - start
+
+    @property
+    def network_latency(self):
+        """
+        From the sender to the receiver kernel.
+        """
+        return self._delta(self.sent_ns, self.kernel_ns)
+
+    @property
+    def queue_latency(self):
+        """
+        Time spent in the kernel receive queue.
+        """
+        return self._delta(self.kernel_ns, self.received_ns)
+
+    @property
+    def decode_latency(self):
+        return self._delta(self.received_ns, self.decoded_ns)
+
+
+class LatencyHistogram:
+    """
+    A log-scale histogram of latencies in nanoseconds. Negative latencies (clock skew
+    between the hosts) are only counted.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.negative = 0
+
+    def record(self, ns):
+        if ns < 0:
+            self.negative += 1
+            return
+        self.buckets[bucket_of(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if self.max is None or ns > self.max:
+            self.max = ns
+
+    def merge(self, other):
+        """
+        Adds the samples of another histogram to this one.
+        """
+        self.buckets = [mine + theirs for (mine, theirs) in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total += other.total
+        self.negative += other.negative
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket holding the given percentile
+        (at most 25% above the actual value), None without samples.
+        """
+        if self.count == 0:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return self.max if index == BUCKETS - 1 else min(bucket_bound(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        stats = {'count': self.count, 'negative': self.negative, 'min': self.min, 'max': self.max, 'mean': self.mean}
+        for percent in PERCENTILES:
+            stats[f'p{percent:g}'] = self.percentile(percent)
+        return stats
+
+
+class LatencyTracker:
+    """
+    One LatencyHistogram per sender, for at most max_senders senders.
+    """
+
+    def __init__(self, max_senders=MAX_SENDERS):
+        self.max_senders = max_senders
+        self.histograms = {}
+
+    def __len__(self):
+        return len(self.histograms)
+
+    def record(self, sender, ns):
+        histogram = self.histograms.get(sender)
+        if histogram is None:
+            if len(self.histograms) >= self.max_senders:
+                # forget the sender seen first
+                del self.histograms[next(iter(self.histograms))]
+            histogram = self.histograms[sender] = LatencyHistogram()
+        histogram.record(ns)
+
+    def snapshot(self):
+        """
+        Returns the summary of the histogram of every sender.
+        """
+        return {sender: histogram.snapshot() for sender, histogram in self.histograms.items()}
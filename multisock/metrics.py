@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: metrics.py
+The counters kept by every channel and returned by channel.stats().
+
+Senders of channels created with sequenced=True number their messages (FLAG_SEQUENCE
+frame extension): receivers track the last number of every sender to tell the messages
+lost on the way (gaps) from the ones arriving late or twice.
+"""
+
+# Max number of senders whose sequence numbers are tracked
+MAX_SENDERS = 4096
+SEQUENCE_MASK = 0xFFFFFFFF
+# Sequence numbers wrap around: a distance over half the range means an older message
+HALF_RANGE = 1 << 31
+
+
+class SequenceTracker:
+    """
+    Tracks the (origin id, sequence number) of the received messages:
+    - gaps: messages skipped, counted when a later message arrives
+    - late: messages older than the last one of their sender (reordered or duplicated
+      after a later one)
+    - duplicates: messages with the same number of the last one of their sender
+    The messages actually lost are about gaps - late.
+    """
+
+    def __init__(self, max_senders=MAX_SENDERS):
+        self.max_senders = max_senders
+        self.gaps = 0
+        self.late = 0
+        self.duplicates = 0
+        # origin id -> highest sequence number received
+        self._last = {}
+
+    def __len__(self):
+        return len(self._last)
+
+    @property
+    def lost(self):
+        return max(0, self.gaps - self.late)
+
+    def track(self, origin, sequence):
+        last = self._last.get(origin)
+        if last is None:
+            if len(self._last) >= self.max_senders:
+                # forget the sender seen first
+                del self._last[next(iter(self._last))]
+            self._last[origin] = sequence
+            return
+        distance = (sequence - last) & SEQUENCE_MASK
+        if distance == 0:
+            self.duplicates += 1
+        elif distance < HALF_RANGE:
+            self.gaps += distance - 1
+            self._last[origin] = sequence
+        else:
+            self.late += 1
+
+
+class ChannelMetrics:
+    """
+    The counters of a channel. Plain attributes: updating them costs an addition.
+    - messages/datagrams/bytes sent and received (datagrams and bytes on the wire)
+    - filtered: messages discarded by the topic subscriptions
+    - invalid_frames: datagrams with a broken frame header
+    - decrypt_errors: messages failing decryption or authentication
+    - decode_errors: messages failing deserialization
+    - kernel_drops: datagrams dropped by the kernel because the receive queue was full
+      (Linux SO_RXQ_OVFL, updated as datagrams are received)
+    """
+    COUNTERS = ('messages_sent', 'datagrams_sent', 'bytes_sent',
+                'messages_received', 'datagrams_received', 'bytes_received',
+                'filtered', 'invalid_frames', 'decrypt_errors', 'decode_errors', 'kernel_drops')
+    __slots__ = COUNTERS + ('sequences',)
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.sequences = SequenceTracker()
+
+    def snapshot(self):
+        """
+        Returns the counters as a dict.
+        """
+        stats = {name: getattr(self, name) for name in self.COUNTERS}
+        stats['sequence_gaps'] = self.sequences.gaps
+        stats['sequence_late'] = self.sequences.late
+        stats['sequence_duplicates'] = self.sequences.duplicates
+        stats['lost'] = self.sequences.lost
+        return stats
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: mmsg.py
+Thin ctypes binding of the Linux recvmmsg(2)/sendmmsg(2) system calls and of UDP
+segmentation offload (UDP_SEGMENT), used by the channels to move many datagrams
+across the kernel boundary with a single syscall. It also reads the receive queue drop
+counter that the kernel attaches to the datagrams of SO_RXQ_OVFL sockets, and attaches
+socket filters (classic BPF) to the sockets that read only some of the datagrams.
+
+On platforms missing the calls HAVE_RECVMMSG/HAVE_SENDMMSG/HAVE_UDP_GSO are False
+and the channels fall back to plain loops of recvfrom/sendto.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import sys
+import socket
+import struct
+
+# sizeof(struct sockaddr_in6): large enough for any address family we handle
+SOCKADDR_SIZE = 28
+# Max number of messages accepted by a single sendmmsg call (UIO_MAXIOV)
+MAX_MMSG = 1024
+# linux/udp.h
+SOL_UDP = 17
+UDP_SEGMENT = 103
+# Max segments per GSO send (UDP_MAX_SEGMENTS) and max payload of an IPv4 UDP datagram
+MAX_GSO_SEGMENTS = 64
+MAX_GSO_PAYLOAD = 65507
+# asm-generic/socket.h: the kernel reports (as ancillary data) its receive queue drops
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40 if sys.platform.startswith('linux') else None)
+DROPS = struct.Struct('=I')
+DROPS_CONTROL_SIZE = socket.CMSG_SPACE(DROPS.size) if hasattr(socket, 'CMSG_SPACE') else 0
+# asm-generic/socket.h: the kernel reports the arrival time (struct timespec) of every datagram
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35 if sys.platform.startswith('linux') else None)
+TIMESPEC = struct.Struct('@ll')
+TIMESTAMP_CONTROL_SIZE = socket.CMSG_SPACE(TIMESPEC.size) if hasattr(socket, 'CMSG_SPACE') else 0
+# asm-generic/socket.h: the fq qdisc paces the socket at most at this rate (bytes per second)
+SO_MAX_PACING_RATE = getattr(socket, 'SO_MAX_PACING_RATE', 47 if sys.platform.startswith('linux') else None)
+# asm-generic/socket.h: the fq/etf qdiscs hold every datagram until its departure time (SCM_TXTIME)
+SO_TXTIME = getattr(socket, 'SO_TXTIME', 61 if sys.platform.startswith('linux') else None)
+SCM_TXTIME = SO_TXTIME
+# struct sock_txtime (clock id, flags) and the departure time (nanoseconds of that clock)
+SOCK_TXTIME = struct.Struct('=iI')
+TXTIME = struct.Struct('=Q')
+# asm-generic/socket.h: a classic BPF program selects the datagrams queued to the socket
+SO_ATTACH_FILTER = getattr(socket, 'SO_ATTACH_FILTER', 26 if sys.platform.startswith('linux') else None)
+# struct sock_filter (code, jt, jf, k) and struct sock_fprog (length, pointer to the program)
+SOCK_FILTER = struct.Struct('=HBBI')
+SOCK_FPROG = struct.Struct('@HP')
+# linux/filter.h: the classic BPF opcodes
+BPF_LD, BPF_JMP, BPF_RET = 0x00, 0x05, 0x06
+BPF_H, BPF_ABS, BPF_K = 0x08, 0x20, 0x00
+BPF_JEQ, BPF_JSET = 0x10, 0x40
+# The programs of udp sockets see the datagrams from their udp header on
+UDP_HEADER_SIZE = 8
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_iovec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+    except OSError:
+        return None
+    return libc
+
+
+_libc = _load_libc()
+_recvmmsg = getattr(_libc, 'recvmmsg', None) if _libc is not None else None
+if _recvmmsg is not None:
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+
+_sendmmsg = getattr(_libc, 'sendmmsg', None) if _libc is not None else None
+if _sendmmsg is not None:
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+
+HAVE_RECVMMSG = _recvmmsg is not None and hasattr(socket, 'MSG_DONTWAIT')
+HAVE_SENDMMSG = _sendmmsg is not None
+HAVE_UDP_GSO = sys.platform.startswith('linux') and hasattr(socket.socket, 'sendmsg')
+
+
+def parse_sockaddr(raw):
+    """
+    Converts a raw struct sockaddr into the (host, port) couple returned by recvfrom.
+    """
+    family = struct.unpack_from('=H', raw)[0]
+    port = struct.unpack_from('!H', raw, 2)[0]
+    if family == socket.AF_INET6:
+        return socket.inet_ntop(socket.AF_INET6, raw[8:24]), port
+    return socket.inet_ntoa(raw[4:8]), port
+
+
+def build_sockaddr(addr):
+    """
+    Converts an IPv4 (host, port) couple into a raw struct sockaddr_in.
+    """
+    host, port = addr
+    return struct.pack('=H', socket.AF_INET) + struct.pack('!H', port) + socket.inet_aton(host) + bytes(8)
+
+
+def sendmmsg(sock, datagrams, addr):
+    """
+    Sends all the datagrams to addr by means of sendmmsg, using one syscall
+    for every MAX_MMSG datagrams. Returns the number of datagrams queued.
+    """
+    if not HAVE_SENDMMSG:
+        raise OSError(errno.ENOSYS, 'sendmmsg not available on this platform')
+    name = ctypes.create_string_buffer(build_sockaddr(addr), SOCKADDR_SIZE)
+    sent = 0
+    while sent < len(datagrams):
+        chunk = datagrams[sent:sent + MAX_MMSG]
+        # keep references to the buffers alive for the whole call: the iovecs
+        # point straight into the bytes objects, no copy is involved
+        buffers = [bytes(data) for data in chunk]
+        iovecs = (_iovec * len(chunk))()
+        headers = (_mmsghdr * len(chunk))()
+        for i, buf in enumerate(buffers):
+            iovecs[i].iov_base = ctypes.cast(ctypes.c_char_p(buf), ctypes.c_void_p).value
+            iovecs[i].iov_len = len(buf)
+            hdr = headers[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(name)
+            hdr.msg_namelen = 16
+            hdr.msg_iov = ctypes.pointer(iovecs[i])
+            hdr.msg_iovlen = 1
+        queued = _sendmmsg(sock.fileno(), headers, len(chunk), 0)
+        if queued < 0:
+            err = ctypes.get_errno()
+            if sent > 0:
+                return sent
+            raise OSError(err, os.strerror(err))
+        sent += queued
+        if queued == 0:
+            break
+    return sent
+
+
+def parse_drops(ancdata):
+    """
+    Returns the drop counter found in the ancillary data returned by socket.recvmsg,
+    None if missing.
+    """
+    for (level, kind, data) in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(data) >= DROPS.size:
+            return DROPS.unpack_from(data)[0]
+    return None
+
+
+def parse_timestamp(ancdata):
+    """
+    Returns the kernel arrival time (nanoseconds since the epoch) found in the ancillary
+    data returned by socket.recvmsg, None if missing.
+    """
+    for (level, kind, data) in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(data) >= TIMESPEC.size:
+            seconds, nanoseconds = TIMESPEC.unpack_from(data)
+            return seconds * 1000000000 + nanoseconds
+    return None
+
+
+def attach_filter(sock, program):
+    """
+    Attaches a classic BPF program (a list of (code,jt,jf,k) instructions) to sock: the
+    kernel discards the datagrams it rejects before queuing them, without waking up the
+    readers. Returns False where socket filters are not available.
+    """
+    if SO_ATTACH_FILTER is None:
+        return False
+    code = ctypes.create_string_buffer(b''.join(SOCK_FILTER.pack(*instruction) for instruction in program))
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, SOCK_FPROG.pack(len(program), ctypes.addressof(code)))
+    except OSError:
+        return False
+    return True
+
+
+def is_uniform(datagrams):
+    """
+    True when the datagrams can be sent as UDP GSO segments: all of the same size
+    but the last one, that can be shorter.
+    """
+    if len(datagrams) < 2:
+        return False
+    size = len(datagrams[0])
+    if size == 0:
+        return False
+    for data in datagrams[1:-1]:
+        if len(data) != size:
+            return False
+    return 0 < len(datagrams[-1]) <= size
+
+
+def send_segmented(sock, datagrams, addr):
+    """
+    Sends uniform datagrams (see is_uniform) as large buffers that the kernel (or
+    the NIC) splits into segments: one syscall and one trip through the stack for
+    up to MAX_GSO_SEGMENTS datagrams.
+    Raises OSError if nothing could be sent (e.g. kernels without UDP_SEGMENT),
+    otherwise returns the number of datagrams queued.
+    """
+    size = len(datagrams[0])
+    per_call = max(1, min(MAX_GSO_SEGMENTS, MAX_GSO_PAYLOAD // size))
+    cmsg = [(SOL_UDP, UDP_SEGMENT, struct.pack('=H', size))]
+    sent = 0
+    while sent < len(datagrams):
+        chunk = datagrams[sent:sent + per_call]
+        try:
+            sock.sendmsg([b''.join(chunk)], cmsg, 0, addr)
+        except OSError:
+            if sent == 0:
+                raise
+            break
+        sent += len(chunk)
+    return sent
+
+
+class MmsgReceiver:
+    """
+    Holds the preallocated buffers and headers needed by recvmmsg for up to
+    max_msgs datagrams of bufsize bytes each, so that they are reused on every call.
+    With drops=True the receiver also collects the SO_RXQ_OVFL drop counter, the
+    last value is kept in 'dropped' (None until the kernel reports a drop).
+    With timestamps=True the control buffers have room for the SO_TIMESTAMPNS arrival
+    times too (enabled on the socket), which would otherwise truncate the drop counter.
+    """
+
+    def __init__(self, max_msgs, bufsize, drops=False, timestamps=False):
+        if not HAVE_RECVMMSG:
+            raise OSError(errno.ENOSYS, 'recvmmsg not available on this platform')
+        self.max_msgs = max_msgs
+        self.bufsize = bufsize
+        self.dropped = None
+        self.timestamps = timestamps
+        self._control_size = ((DROPS_CONTROL_SIZE if drops else 0) +
+                              (TIMESTAMP_CONTROL_SIZE if drops and timestamps else 0))
+        self._controls = ctypes.create_string_buffer(max(1, max_msgs * self._control_size))
+        self._buffers = ctypes.create_string_buffer(max_msgs * bufsize)
+        self._names = ctypes.create_string_buffer(max_msgs * SOCKADDR_SIZE)
+        self._iovecs = (_iovec * max_msgs)()
+        self._headers = (_mmsghdr * max_msgs)()
+        base = ctypes.addressof(self._buffers)
+        names = ctypes.addressof(self._names)
+        for i in range(max_msgs):
+            self._iovecs[i].iov_base = base + i * bufsize
+            self._iovecs[i].iov_len = bufsize
+            hdr = self._headers[i].msg_hdr
+            hdr.msg_name = names + i * SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            hdr.msg_iovlen = 1
+
+    def recv(self, sock, max_msgs=None):
+        """
+        Drains without blocking up to max_msgs datagrams from sock.
+        Returns the list of (data, addr) couples, empty if nothing was pending.
+        """
+        count = self.max_msgs if max_msgs is None else min(max_msgs, self.max_msgs)
+        controls = ctypes.addressof(self._controls)
+        for i in range(count):
+            hdr = self._headers[i].msg_hdr
+            hdr.msg_namelen = SOCKADDR_SIZE
+            if self._control_size:
+                hdr.msg_control = controls + i * self._control_size
+                hdr.msg_controllen = self._control_size
+        received = _recvmmsg(sock.fileno(), self._headers, count, socket.MSG_DONTWAIT, None)
+        if received < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise OSError(err, os.strerror(err))
+        base = ctypes.addressof(self._buffers)
+        names = ctypes.addressof(self._names)
+        result = []
+        for i in range(received):
+            data = ctypes.string_at(base + i * self.bufsize, self._headers[i].msg_len)
+            addr = parse_sockaddr(ctypes.string_at(names + i * SOCKADDR_SIZE, SOCKADDR_SIZE))
+            result.append((data, addr))
+        if self._control_size:
+            # the counter only grows: the last datagram carrying it has the latest value
+            for i in range(received - 1, -1, -1):
+                length = self._headers[i].msg_hdr.msg_controllen
+                if length > 0:
+                    dropped = parse_drops(self._parse_control(controls + i * self._control_size, length))
+                    if dropped is not None:
+                        self.dropped = dropped
+                        break
+        return result
+
+    def _parse_control(self, address, length):
+        # struct cmsghdr {size_t cmsg_len; int cmsg_level; int cmsg_type;} + data, as socket.recvmsg returns them
+        ancdata = []
+        offset = 0
+        header = ctypes.sizeof(ctypes.c_size_t)
+        while offset + socket.CMSG_LEN(0) <= length:
+            cmsg_len = ctypes.c_size_t.from_address(address + offset).value
+            if cmsg_len < socket.CMSG_LEN(0) or offset + cmsg_len > length:
+                break
+            level, kind = struct.unpack('=ii', ctypes.string_at(address + offset + header, 8))
+            ancdata.append((level, kind, ctypes.string_at(address + offset + socket.CMSG_LEN(0),
+                                                          cmsg_len - socket.CMSG_LEN(0))))
+            # the next header is aligned as the size_t
+            offset += (cmsg_len + header - 1) // header * header
+        return ancdata
@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: nack.py
+Selective retransmission of the lost messages: the reliable mode of the channels.
+
+Senders of channels created with reliable=True number their messages (as sequenced=True)
+and keep the last history_size of them in a ring. Receivers detect the gaps in the
+numbers of every sender and, after a random backoff of at most nack_delay seconds,
+multicast on the group a NACK frame (FLAG_NACK) listing the missing numbers (in ranges).
+Receivers overhearing the NACK of another receiver for the same messages hold their own
+back: a loss shared by many receivers costs about one NACK, as with the NAK suppression
+of PGM (RFC 3208). The sender retransmits the requested messages still in its history,
+at most once per nack_delay each, and receivers deliver every repair once, discarding
+the copies of the messages already received.
+
+NACKs are repeated every nack_interval seconds, nack_retries times at most. A loss is
+detected when a later message of the same sender arrives, or when the sender announces
+the highest sequence number it sent: as the SPMs of PGM, an announcement frame
+(FLAG_ANNOUNCE) leaves on flush(), on close() and once the sender has been idle for
+nack_interval seconds (repeated after 2 and 4 times as long), so that receivers NACK the
+lost tail of a burst too.
+
+The payload of a NACK frame (encrypted as the messages of the channel) is the origin id
+of the sender (4), the origin id of the receiver (4) and the missing ranges, each made of
+a sequence number (4) and a count (2). The payload of an announcement frame is the origin
+id of the sender (4) and its highest sequence number (4).
+
+The NACKs travel on the group, where receivers overhear them. Senders read them with a
+repair socket of their own, member of the group: on Linux a socket filter (NACK_FILTER)
+has the kernel queue to it the NACK frames only, elsewhere the repair thread discards the
+other datagrams from the flags of their header, without parsing them.
+"""
+
+import logging
+import random
+import select
+import struct
+import threading
+import time
+from multisock import frame, mmsg
+from multisock.metrics import SEQUENCE_MASK, HALF_RANGE, MAX_SENDERS
+from multisock.exceptions import DecryptionException, InvalidFrameException
+
+DEFAULT_HISTORY_SIZE = 1024
+DEFAULT_NACK_DELAY = 0.01
+DEFAULT_NACK_INTERVAL = 0.1
+DEFAULT_NACK_RETRIES = 5
+# Max missing messages of a sender waiting for their repair
+MAX_MISSING = 4096
+NACK = struct.Struct('!II')
+ANNOUNCEMENT = struct.Struct('!II')
+# Announcements of the same sequence number sent by an idle sender
+MAX_ANNOUNCEMENTS = 3
+RANGE = struct.Struct('!IH')
+MAX_RANGE_COUNT = 0xFFFF
+# Ranges per NACK frame: a NACK always fits a single datagram
+MAX_RANGES = 200
+# How often the repair thread checks whether the channel is closed
+POLL_INTERVAL = 0.1
+# Socket filter of the repair sockets: the frames with the magic and FLAG_NACK
+NACK_FILTER = [
+    (mmsg.BPF_LD | mmsg.BPF_H | mmsg.BPF_ABS, 0, 0, mmsg.UDP_HEADER_SIZE),
+    (mmsg.BPF_JMP | mmsg.BPF_JEQ | mmsg.BPF_K, 0, 3, int.from_bytes(frame.MAGIC, 'big')),
+    (mmsg.BPF_LD | mmsg.BPF_H | mmsg.BPF_ABS, 0, 0, mmsg.UDP_HEADER_SIZE + frame.FLAGS_OFFSET),
+    (mmsg.BPF_JMP | mmsg.BPF_JSET | mmsg.BPF_K, 0, 1, frame.FLAG_NACK),
+    (mmsg.BPF_RET | mmsg.BPF_K, 0, 0, 0xFFFFFFFF),
+    (mmsg.BPF_RET | mmsg.BPF_K, 0, 0, 0),
+]
+
+
+def encode_nack(origin, requester, sequences):
+    """
+    Returns the payloads of the NACKs of requester for the given sequence numbers of
+    origin (sorted in the ranges of as few NACK frames as possible).
+    """
+    ranges = []
+    for sequence in sorted(sequences):
+        if ranges and (ranges[-1][0] + ranges[-1][1]) & SEQUENCE_MASK == sequence and \
+                ranges[-1][1] < MAX_RANGE_COUNT:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([sequence, 1])
+    return [NACK.pack(origin, requester) + b''.join(RANGE.pack(*item) for item in ranges[i:i + MAX_RANGES])
+            for i in range(0, len(ranges), MAX_RANGES)]
+
+
+def encode_announcement(origin, sequence):
+    """
+    Returns the payload of the announcement of the highest sequence number of origin.
+    """
+    return ANNOUNCEMENT.pack(origin, sequence)
+
+
+def decode_announcement(payload):
+    """
+    Returns the couple (origin,sequence) of an announcement payload.
+    """
+    if len(payload) != ANNOUNCEMENT.size:
+        raise InvalidFrameException(f'Invalid announcement of {len(payload)} bytes')
+    return ANNOUNCEMENT.unpack(payload)
+
+
+def is_nack(data):
+    """
+    True if data is a NACK frame, judging from its magic and its flags only.
+    """
+    return (frame.is_frame(data) and
+            (data[frame.FLAGS_OFFSET] << 8 | data[frame.FLAGS_OFFSET + 1]) & frame.FLAG_NACK != 0)
+
+
+def decode_nack(payload):
+    """
+    Returns the triple (origin,requester,sequences) of a NACK payload.
+    """
+    if len(payload) < NACK.size or (len(payload) - NACK.size) % RANGE.size:
+        raise InvalidFrameException(f'Invalid NACK of {len(payload)} bytes')
+    origin, requester = NACK.unpack_from(payload)
+    sequences = []
+    for (first, count) in RANGE.iter_unpack(payload[NACK.size:]):
+        sequences.extend((first + i) & SEQUENCE_MASK for i in range(count))
+    return origin, requester, sequences
+
+
+class History:
+    """
+    The last capacity messages sent, by sequence number (a ring of fixed size).
+    repairs() returns a message at most once per holdoff seconds, whatever the number
+    of NACKs requesting it.
+    - retransmitted: messages returned by repairs()
+    - expired: messages requested when no longer in the history
+    - latest: the couple (sequence,time.monotonic()) of the last message stored, or None
+    """
+
+    def __init__(self, capacity=DEFAULT_HISTORY_SIZE, holdoff=DEFAULT_NACK_DELAY):
+        if capacity <= 0:
+            raise ValueError(f'Invalid history size: {capacity}')
+        self.capacity = capacity
+        self.holdoff = holdoff
+        self.retransmitted = 0
+        self.expired = 0
+        self.latest = None
+        # [sequence, message, next repair time]
+        self._ring = [None] * capacity
+        self._lock = threading.Lock()
+
+    def store(self, sequence, message):
+        self._ring[sequence % self.capacity] = [sequence, message, 0.0]
+        self.latest = (sequence, time.monotonic())
+
+    def repairs(self, sequences):
+        """
+        Returns the messages to retransmit for a NACK of the given sequence numbers.
+        """
+        now = time.monotonic()
+        messages = []
+        with self._lock:
+            for sequence in sequences:
+                entry = self._ring[sequence % self.capacity]
+                if entry is None or entry[0] != sequence:
+                    self.expired += 1
+                elif entry[2] <= now:
+                    entry[2] = now + self.holdoff
+                    messages.append(entry[1])
+            self.retransmitted += len(messages)
+        return messages
+
+
+class _Source:
+    __slots__ = ('next', 'missing')
+
+    def __init__(self, sequence):
+        self.next = sequence
+        # sequence number -> [deadline of the next NACK, NACKs sent]
+        self.missing = {}
+
+
+class NackTracker:
+    """
+    Tracks the sequence numbers of the messages of every sender and hands the missing
+    ones over to send(origin, sequences) once their NACK is due: after a random backoff
+    of at most delay seconds, then every interval seconds up to retries times (a
+    background thread sends the NACKs).
+    - sent: NACKs sent
+    - suppressed: NACKs held back because another receiver sent them
+    - repaired: missing messages received afterwards
+    - unrecovered: missing messages given up
+    - duplicates: messages received again (repairs requested by other receivers)
+    """
+
+    def __init__(self, send, delay=DEFAULT_NACK_DELAY, interval=DEFAULT_NACK_INTERVAL,
+                 retries=DEFAULT_NACK_RETRIES, max_senders=MAX_SENDERS):
+        self.delay = delay
+        self.interval = interval
+        self.retries = retries
+        self.max_senders = max_senders
+        self.sent = 0
+        self.suppressed = 0
+        self.repaired = 0
+        self.unrecovered = 0
+        self.duplicates = 0
+        self._send = send
+        # origin id -> _Source
+        self._sources = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def __len__(self):
+        return sum(len(source.missing) for source in self._sources.values())
+
+    def delivered(self, origin, sequence):
+        """
+        Returns True if a message was already received, without tracking it (the
+        messages are tracked by receive() once authenticated).
+        """
+        with self._condition:
+            source = self._sources.get(origin)
+            if source is None or (sequence - source.next) & SEQUENCE_MASK < HALF_RANGE:
+                return False
+            if sequence in source.missing:
+                return False
+            self.duplicates += 1
+            return True
+
+    def receive(self, origin, sequence):
+        """
+        Tracks a received message: returns False if it was already received.
+        """
+        with self._condition:
+            source = self._sources.get(origin)
+            if source is None:
+                if len(self._sources) >= self.max_senders:
+                    # forget the sender seen first
+                    self.unrecovered += len(self._sources.pop(next(iter(self._sources))).missing)
+                self._sources[origin] = _Source((sequence + 1) & SEQUENCE_MASK)
+                return True
+            distance = (sequence - source.next) & SEQUENCE_MASK
+            if distance < HALF_RANGE:
+                if distance > 0:
+                    self._lost(source, distance)
+                source.next = (sequence + 1) & SEQUENCE_MASK
+                return True
+            if source.missing.pop(sequence, None) is None:
+                self.duplicates += 1
+                return False
+            self.repaired += 1
+            return True
+
+    def announced(self, origin, sequence):
+        """
+        Registers the highest sequence number sent by origin: the messages up to it not
+        received yet are missing (the lost tail of a burst).
+        """
+        with self._condition:
+            source = self._sources.get(origin)
+            if source is None:
+                # nothing received yet: the earlier messages were sent before joining
+                return
+            distance = (sequence + 1 - source.next) & SEQUENCE_MASK
+            if 0 < distance < HALF_RANGE:
+                self._lost(source, distance)
+                source.next = (sequence + 1) & SEQUENCE_MASK
+
+    def overheard(self, origin, sequences):
+        """
+        Holds back the NACKs of the given messages of origin, just requested by another
+        receiver.
+        """
+        with self._condition:
+            source = self._sources.get(origin)
+            if source is None:
+                return
+            deadline = time.monotonic() + self.interval
+            for sequence in sequences:
+                entry = source.missing.get(sequence)
+                if entry is not None and entry[0] < deadline:
+                    entry[0] = deadline
+                    self.suppressed += 1
+
+    def close(self):
+        """
+        Stops the background thread (pending NACKs are not sent).
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _lost(self, source, count):
+        # invoked holding the lock
+        first = source.next
+        room = MAX_MISSING - len(source.missing)
+        if count > room:
+            self.unrecovered += count - max(room, 0)
+            first = (first + count - room) & SEQUENCE_MASK
+            count = room
+        now = time.monotonic()
+        for i in range(count):
+            source.missing[(first + i) & SEQUENCE_MASK] = [now + random.uniform(0, self.delay), 0]
+        if count > 0:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name='multisock-nack', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _due(self, now):
+        nacks = []
+        for (origin, source) in self._sources.items():
+            sequences = []
+            for (sequence, entry) in list(source.missing.items()):
+                if entry[0] > now:
+                    continue
+                if entry[1] >= self.retries:
+                    del source.missing[sequence]
+                    self.unrecovered += 1
+                    continue
+                entry[0] = now + self.interval
+                entry[1] += 1
+                sequences.append(sequence)
+            if sequences:
+                nacks.append((origin, sequences))
+        return nacks
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                deadlines = [entry[0] for source in self._sources.values() for entry in source.missing.values()]
+                if not deadlines:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                deadline = min(deadlines)
+                if deadline > now:
+                    self._condition.wait(deadline - now)
+                    continue
+                for (origin, sequences) in self._due(now):
+                    self.sent += 1
+                    try:
+                        self._send(origin, sequences)
+                    except OSError as ex:
+                        logging.getLogger().warning('Cannot send NACK for %08x: %s' % (origin, ex))
+
+
+class Repairer:
+    """
+    Retransmits the messages of the history requested by the NACKs for origin, which a
+    background thread reads from sock (a socket of its own, member of the group, whose
+    filter lets the NACKs only through where possible): retransmit(messages) sends them
+    again. Once no message was stored for idle seconds the thread hands the highest
+    sequence number over to announce(sequence), up to MAX_ANNOUNCEMENTS times at doubling
+    intervals.
+    - filtered: True if the kernel filters the datagrams of sock
+    - announcements: announcements sent
+    """
+
+    def __init__(self, sock, origin, history, retransmit, crypto=None, bufsize=65536, announce=None,
+                 idle=DEFAULT_NACK_INTERVAL):
+        self.origin = origin
+        self.history = history
+        self.crypto = crypto
+        self.bufsize = bufsize
+        self.idle = idle
+        self.announcements = 0
+        self._sock = sock
+        self.filtered = mmsg.attach_filter(sock, NACK_FILTER)
+        self._retransmit = retransmit
+        self._announce = announce
+        # [sequence, times announced since the sender is idle]
+        self._announced = [None, 0]
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='multisock-repair', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._closed = True
+        self._thread.join()
+        self._sock.close()
+
+    def announce(self):
+        """
+        Announces the highest sequence number stored (e.g. on flush), if any.
+        """
+        latest = self.history.latest
+        if self._announce is None or latest is None:
+            return
+        with self._lock:
+            self.announcements += 1
+            self._announce(latest[0])
+
+    def _heartbeat(self):
+        latest = self.history.latest
+        if latest is None:
+            return
+        if latest[0] != self._announced[0]:
+            self._announced = [latest[0], 0]
+        count = self._announced[1]
+        if count < MAX_ANNOUNCEMENTS and time.monotonic() - latest[1] >= self.idle * (1 << count):
+            self._announced[1] += 1
+            self.announce()
+
+    def handle(self, data):
+        """
+        Processes a datagram received on the group: returns the number of messages
+        retransmitted.
+        """
+        if not is_nack(data):
+            return 0
+        try:
+            received = frame.Frame.parse(data)
+            origin, requester, sequences = decode_nack(received.open(self.crypto))
+        except (InvalidFrameException, DecryptionException) as ex:
+            logging.getLogger().debug('Discarding NACK: %s' % ex)
+            return 0
+        if origin != self.origin:
+            return 0
+        messages = self.history.repairs(sequences)
+        if messages:
+            self._retransmit(messages)
+        return len(messages)
+
+    def _run(self):
+        while not self._closed:
+            readable, _, _ = select.select([self._sock], [], [], min(POLL_INTERVAL, self.idle))
+            try:
+                self._heartbeat()
+                if not readable:
+                    continue
+                data, addr = self._sock.recvfrom(self.bufsize)
+                self.handle(data)
+            except OSError as ex:
+                logging.getLogger().warning('Cannot repair messages of %08x: %s' % (self.origin, ex))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: pacing.py
+Spaces the outgoing datagrams of a channel, so that receivers with small socket buffers
+absorb the bursts instead of dropping them.
+
+A Pacer limits a channel to bytes_per_sec and/or packets_per_sec with a token bucket
+each: bursts of burst_bytes/burst_packets leave at once, then every datagram gets a
+departure time at the configured rate. How the datagrams wait for it depends on the mode:
+- PACING_SLEEP: the sending thread sleeps until the departure time
+- PACING_TXTIME: the datagrams carry their departure time (Linux SO_TXTIME) and the fq
+  qdisc holds them in the kernel
+- PACING_MAX_RATE: the fq qdisc paces the socket at bytes_per_sec (Linux SO_MAX_PACING_RATE)
+- PACING_AUTO (default): PACING_TXTIME where the kernel supports it, PACING_SLEEP otherwise
+
+    udpchan = multisock.Channel('224.1.1.1', 1234, pacer=Pacer(bytes_per_sec=2000000, packets_per_sec=2000))
+
+The kernel modes need the fq qdisc on the outgoing interface (tc qdisc replace dev eth0
+root fq), otherwise the datagrams leave right away: the sending thread still sleeps when
+it gets more than horizon seconds ahead of the schedule, so the average rate holds anyway.
+"""
+
+import logging
+import socket
+import threading
+import time
+from multisock import mmsg
+
+PACING_SLEEP = 'sleep'
+PACING_TXTIME = 'txtime'
+PACING_MAX_RATE = 'max-rate'
+PACING_AUTO = 'auto'
+PACING_MODES = (PACING_SLEEP, PACING_TXTIME, PACING_MAX_RATE, PACING_AUTO)
+DEFAULT_BURST_BYTES = 16 * 1024
+DEFAULT_BURST_PACKETS = 16
+# How far ahead of the schedule the kernel modes queue the datagrams
+DEFAULT_HORIZON = 0.01
+# SO_MAX_PACING_RATE is set as a (signed) int
+MAX_KERNEL_RATE = 0x7FFFFFFF
+
+
+class TokenBucket:
+    """
+    A bucket of at most burst tokens refilled at rate tokens per second. Reservations
+    never fail: the tokens go negative and the departure time moves forward.
+    """
+
+    def __init__(self, rate, burst):
+        if rate <= 0 or burst <= 0:
+            raise ValueError(f'Invalid token bucket: rate {rate}, burst {burst}')
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        """
+        Takes amount tokens: returns the time (time.monotonic) when they are available.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - amount
+        self.updated = now
+        if self.tokens >= 0:
+            return now
+        return now - self.tokens / self.rate
+
+
+class Pacer:
+    """
+    Paces the datagrams of a channel at bytes_per_sec and/or packets_per_sec (see the
+    module documentation for the bursts, the modes and the horizon).
+    - delayed: datagrams that had to wait for their departure time
+    - waited: seconds slept by the sending threads
+    """
+
+    def __init__(self, bytes_per_sec=None, packets_per_sec=None, burst_bytes=DEFAULT_BURST_BYTES,
+                 burst_packets=DEFAULT_BURST_PACKETS, mode=PACING_AUTO, horizon=DEFAULT_HORIZON):
+        if bytes_per_sec is None and packets_per_sec is None:
+            raise ValueError('Pacing needs bytes_per_sec or packets_per_sec')
+        if mode not in PACING_MODES:
+            raise ValueError(f'Invalid pacing mode: {mode}')
+        if mode == PACING_MAX_RATE and bytes_per_sec is None:
+            raise ValueError('Kernel pacing needs bytes_per_sec')
+        self.bytes_per_sec = bytes_per_sec
+        self.packets_per_sec = packets_per_sec
+        self.mode = mode
+        self.horizon = horizon
+        self.delayed = 0
+        self.waited = 0.0
+        self._buckets = []
+        if bytes_per_sec is not None:
+            self._buckets.append((TokenBucket(bytes_per_sec, burst_bytes), True))
+        if packets_per_sec is not None:
+            self._buckets.append((TokenBucket(packets_per_sec, burst_packets), False))
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'Pacer<%s bytes/s=%s packets/s=%s>' % (self.mode, self.bytes_per_sec, self.packets_per_sec)
+
+    def attach(self, sock):
+        """
+        Sets the pacing options of the sending socket, resolving the auto mode (a mode
+        the kernel does not support falls back to PACING_SLEEP). Returns the mode.
+        """
+        clock = getattr(time, 'CLOCK_MONOTONIC', None)
+        if self.mode in (PACING_AUTO, PACING_TXTIME):
+            try:
+                if mmsg.SO_TXTIME is None or clock is None or not hasattr(sock, 'sendmsg'):
+                    raise OSError('SO_TXTIME not available')
+                sock.setsockopt(socket.SOL_SOCKET, mmsg.SO_TXTIME, mmsg.SOCK_TXTIME.pack(clock, 0))
+                self.mode = PACING_TXTIME
+            except OSError as ex:
+                if self.mode == PACING_TXTIME:
+                    logging.getLogger().warning('Kernel pacing not available (%s): sleeping instead' % ex)
+                self.mode = PACING_SLEEP
+        elif self.mode == PACING_MAX_RATE:
+            try:
+                if mmsg.SO_MAX_PACING_RATE is None:
+                    raise OSError('SO_MAX_PACING_RATE not available')
+                sock.setsockopt(socket.SOL_SOCKET, mmsg.SO_MAX_PACING_RATE,
+                                min(int(self.bytes_per_sec), MAX_KERNEL_RATE))
+            except OSError as ex:
+                logging.getLogger().warning('Kernel pacing not available (%s): sleeping instead' % ex)
+                self.mode = PACING_SLEEP
+        return self.mode
+
+    def schedule(self, nbytes):
+        """
+        Waits (as needed by the mode) for the departure of a datagram of nbytes: returns
+        its departure time (nanoseconds of CLOCK_MONOTONIC) for PACING_TXTIME, else None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            departure = max(bucket.reserve(nbytes if in_bytes else 1, now) for (bucket, in_bytes) in self._buckets)
+            wait = departure - now
+            if wait > 0:
+                self.delayed += 1
+            if self.mode != PACING_SLEEP:
+                wait -= self.horizon
+            if wait > 0:
+                self.waited += wait
+        if wait > 0:
+            time.sleep(wait)
+        return int(departure * 1e9) if self.mode == PACING_TXTIME else None
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: pipeline.py
+A receive mode spreading the decoding work over many cores.
+
+A dedicated thread only drains the channel socket (and reassembles fragments), while a
+pool of threads or processes decrypts and deserializes the messages. The decoded messages
+are delivered in arrival order for each sender (messages of different senders do not wait
+for each other).
+
+    udpchan = multisock.Channel('224.1.1.1', 1234, crypto=Crypter('key', 'passphrase'))
+    with DecodePipeline(udpchan, workers=4) as pipeline:
+        for (obj, sender) in pipeline:
+            print("Received from %s: %s" % (sender, obj))
+"""
+
+import collections
+import concurrent.futures
+import queue
+import threading
+from multisock import frame
+from multisock.channel import decode_data, decode_object
+from multisock.exceptions import DecryptionException
+
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+DEFAULT_MAX_PENDING = 1024
+BATCH_SIZE = 64
+POLL_INTERVAL = 0.1
+
+# The crypter of the worker processes, sent once by the pool initializer
+_worker_crypto = None
+
+
+def _init_worker(crypto):
+    global _worker_crypto
+    _worker_crypto = crypto
+
+
+def _decode_in_worker(data, objects):
+    if objects:
+        return decode_object(data, _worker_crypto)
+    return decode_data(data, _worker_crypto)
+
+
+class DecodePipeline:
+    """
+    Receives from channel on a dedicated thread and decodes on a pool of workers.
+
+    Parameters:
+    - workers: the size of the pool
+    - executor: EXECUTOR_THREAD (decryption and the built-in codecs release the GIL
+      only partially), EXECUTOR_PROCESS (true parallelism; the worker processes must
+      know the application codecs) or a concurrent.futures.Executor
+    - objects: decode messages as recv_object (True) or as recv (False)
+    - max_pending: max number of messages received but not yet consumed; once reached
+      the receive thread waits (and the kernel buffers the incoming datagrams)
+
+    Messages failing the authentication and invalid datagrams are discarded (see the
+    channel stats), messages failing the decoding are logged and counted in 'errors'.
+    The workers authenticate the sequenced messages too: their numbers (duplicate
+    filter, NACKs, sequence stats) are tracked once decoded, in arrival order.
+    Iterating on the pipeline stops once the receive thread stops (on stop() or on a
+    socket error).
+    """
+
+    def __init__(self, channel, workers=4, executor=EXECUTOR_THREAD, objects=True, max_pending=DEFAULT_MAX_PENDING):
+        self.channel = channel
+        self.objects = objects
+        self.errors = 0
+        self._own_executor = not isinstance(executor, concurrent.futures.Executor)
+        if executor == EXECUTOR_THREAD:
+            self._executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='multisock-decode')
+        elif executor == EXECUTOR_PROCESS:
+            self._executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                                    initargs=(channel.crypto,))
+        elif not self._own_executor:
+            self._executor = executor
+        else:
+            raise ValueError(f'Invalid executor: {executor}')
+        self._processes = isinstance(self._executor, concurrent.futures.ProcessPoolExecutor)
+        self._decoder = decode_object if objects else decode_data
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        # sender address -> (future,message) in arrival order
+        self._in_flight = {}
+        self._output = queue.Queue()
+        self._running = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __iter__(self):
+        while self._running.is_set() or not self._output.empty():
+            try:
+                yield self.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running.set()
+        self.channel._deferred = True
+        self._thread = threading.Thread(target=self._receive_loop, name='multisock-receive', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops receiving and shuts the workers down: decoded messages not yet
+        consumed are still returned by get().
+        """
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+        self.channel._deferred = False
+
+    def get(self, timeout=None):
+        """
+        Returns the next decoded couple (data,addr); raises queue.Empty if none
+        arrives within timeout seconds.
+        """
+        item = self._output.get(timeout=timeout)
+        self._slots.release()
+        return item
+
+    def get_nowait(self):
+        """
+        Returns the next decoded couple (data,addr) if already available, raises queue.Empty otherwise.
+        """
+        item = self._output.get_nowait()
+        self._slots.release()
+        return item
+
+    def _receive_loop(self):
+        try:
+            self._receive()
+        finally:
+            # ends the iteration on the pipeline
+            self._running.clear()
+
+    def _receive(self):
+        channel = self.channel
+        while self._running.is_set():
+            try:
+                batch = channel._recv_batch(BATCH_SIZE, POLL_INTERVAL)
+            except OSError as ex:
+                if self._running.is_set():
+                    channel.logger.warning('Receive error on %s: %s' % (channel, ex))
+                return
+            for (message, addr) in batch:
+                # wait for room, but keep an eye on stop()
+                while not self._slots.acquire(timeout=POLL_INTERVAL):
+                    if not self._running.is_set():
+                        return
+                self._submit(message, addr)
+
+    def _submit(self, message, addr):
+        if self._processes:
+            data = message.tobytes() if isinstance(message, frame.Frame) else message
+            future = self._executor.submit(_decode_in_worker, data, self.objects)
+        else:
+            future = self._executor.submit(self._decoder, message, self.channel.crypto)
+        with self._lock:
+            self._in_flight.setdefault(addr, collections.deque()).append((future, message))
+        # invoked right away if the decoding is already over
+        future.add_done_callback(lambda done, addr=addr: self._deliver(addr))
+
+    def _deliver(self, addr):
+        with self._lock:
+            futures = self._in_flight.get(addr)
+            while futures and futures[0][0].done():
+                (future, message) = futures.popleft()
+                try:
+                    data = future.result()
+                    sequence = message.sequence if isinstance(message, frame.Frame) else None
+                    # a copy may have been admitted meanwhile
+                    if sequence is None or self.channel._track(sequence):
+                        self._output.put((data, addr))
+                        continue
+                except DecryptionException as ex:
+                    self.channel._reject(addr, ex)
+                except Exception as ex:
+                    self.errors += 1
+                    self.channel.metrics.decode_errors += 1
+                    self.channel.logger.warning('Cannot decode message from %s: %s' % (addr, ex))
+                self._slots.release()
+            if futures is not None and not futures:
+                del self._in_flight[addr]
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: ring.py
+The background reception of the channels: a thread drains the socket into a ring buffer.
+
+The kernel queue of a socket is small and drops the datagrams silently once full, e.g.
+while the application is paused by the garbage collector or a slow handler. Channels
+created with background=True start a reader thread moving every datagram, as soon as
+it arrives, into a bounded ring of ring_size preallocated bufsize slots; the receive
+methods of the channel consume the ring instead of the socket.
+
+When the ring is full the overflow policy applies:
+- OVERFLOW_DROP_OLDEST (default): the oldest datagram makes room for the new one
+- OVERFLOW_DROP_NEWEST: the new datagram is dropped
+- OVERFLOW_BLOCK: the reader thread waits for room (the datagrams queue in the kernel)
+"""
+
+import logging
+import select
+import threading
+import time
+from multisock import mmsg
+
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+OVERFLOW_DROP_NEWEST = 'drop-newest'
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK)
+DEFAULT_RING_SIZE = 1024
+# How often the reader thread checks whether the channel is closed
+POLL_INTERVAL = 0.1
+
+
+class RingBuffer:
+    """
+    A bounded FIFO of datagrams stored in size preallocated slots of bufsize bytes.
+    A single producer receives into the slot returned by acquire() and queues it with
+    put(); consumers copy the datagrams out with get().
+    - received: datagrams queued
+    - overflows: datagrams dropped by the overflow policy
+    - high_water: max number of datagrams queued at once
+    """
+
+    def __init__(self, size=DEFAULT_RING_SIZE, bufsize=4096, overflow=OVERFLOW_DROP_OLDEST):
+        if size <= 0:
+            raise ValueError(f'Invalid ring size: {size}')
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'Invalid overflow policy: {overflow}')
+        self.size = size
+        self.bufsize = bufsize
+        self.overflow = overflow
+        self.received = 0
+        self.overflows = 0
+        self.high_water = 0
+        self.closed = False
+        # one slot more than the ring: the producer receives into it while the ring is full
+        self._memory = bytearray((size + 1) * bufsize)
+        self._view = memoryview(self._memory)
+        self._free = list(range(size + 1))
+        # the ring: slot, length, sender address and arrival time of the queued datagrams
+        self._slots = [0] * size
+        self._lengths = [0] * size
+        self._addrs = [None] * size
+        self._times = [0] * size
+        self._head = 0
+        self._count = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return self._count
+
+    def acquire(self):
+        """
+        Returns a couple (slot,view) where view is the writable memory of a free slot.
+        """
+        with self._condition:
+            slot = self._free.pop()
+        return slot, self._view[slot * self.bufsize:(slot + 1) * self.bufsize]
+
+    def release(self, slot):
+        """
+        Gives back a slot acquired and not queued.
+        """
+        with self._condition:
+            self._free.append(slot)
+
+    def put(self, slot, nbytes, addr, arrival_ns=None):
+        """
+        Queues the datagram of nbytes received into slot: returns False if the overflow
+        policy (or the closing of the ring) dropped it.
+        """
+        with self._condition:
+            if self._count == self.size:
+                if self.overflow == OVERFLOW_BLOCK:
+                    while self._count == self.size and not self.closed:
+                        self._condition.wait()
+                    if self.closed:
+                        self._free.append(slot)
+                        return False
+                elif self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.overflows += 1
+                    self._free.append(slot)
+                    return False
+                else:
+                    self.overflows += 1
+                    self._free.append(self._slots[self._head])
+                    self._addrs[self._head] = None
+                    self._head = (self._head + 1) % self.size
+                    self._count -= 1
+            position = (self._head + self._count) % self.size
+            self._slots[position] = slot
+            self._lengths[position] = nbytes
+            self._addrs[position] = addr
+            self._times[position] = arrival_ns
+            self._count += 1
+            self.received += 1
+            if self._count > self.high_water:
+                self.high_water = self._count
+            self._condition.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Returns the oldest datagram as a triple
+            (data,addr,arrival_ns)
+        waiting at most timeout seconds (None: forever) for one. Returns None on
+        timeout, or once the ring is closed and empty.
+        """
+        with self._condition:
+            if not self._count and not self.closed:
+                if timeout is None:
+                    while not self._count and not self.closed:
+                        self._condition.wait()
+                elif timeout > 0:
+                    deadline = time.monotonic() + timeout
+                    while not self._count and not self.closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+            if not self._count:
+                return None
+            return self._pop()
+
+    def get_many(self, max_items, timeout=None):
+        """
+        Returns up to max_items datagrams (as get), waiting at most timeout seconds for
+        the first one.
+        """
+        first = self.get(timeout)
+        if first is None:
+            return []
+        received = [first]
+        with self._condition:
+            while self._count and len(received) < max_items:
+                received.append(self._pop())
+        return received
+
+    def close(self):
+        """
+        Wakes up the producer and the consumers waiting: the ring accepts no more datagrams.
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def _pop(self):
+        # invoked holding the lock
+        head = self._head
+        slot = self._slots[head]
+        offset = slot * self.bufsize
+        received = bytes(self._view[offset:offset + self._lengths[head]]), self._addrs[head], self._times[head]
+        self._addrs[head] = None
+        self._free.append(slot)
+        self._head = (head + 1) % self.size
+        self._count -= 1
+        self._condition.notify_all()
+        return received
+
+
+class BackgroundReader:
+    """
+    A thread moving the datagrams of sock into ring as soon as they arrive. With drops
+    the kernel drop counter of the socket (SO_RXQ_OVFL) is handed over to on_drops(count).
+    """
+
+    def __init__(self, sock, ring, drops=False, on_drops=None):
+        self.ring = ring
+        self._sock = sock
+        self._drops = drops
+        self._on_drops = on_drops
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='multisock-reader', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Stops the thread (the socket is left open).
+        """
+        self._closed = True
+        self.ring.close()
+        self._thread.join()
+
+    def _run(self):
+        ring = self.ring
+        while not self._closed:
+            try:
+                readable, _, _ = select.select([self._sock], [], [], POLL_INTERVAL)
+            except (OSError, ValueError):
+                # closed socket
+                break
+            if not readable:
+                continue
+            slot, view = ring.acquire()
+            try:
+                if self._drops:
+                    nbytes, ancdata, _, addr = self._sock.recvmsg_into([view], mmsg.DROPS_CONTROL_SIZE)
+                    if ancdata:
+                        self._on_drops(mmsg.parse_drops(ancdata))
+                else:
+                    nbytes, addr = self._sock.recvfrom_into(view)
+            except BlockingIOError:
+                ring.release(slot)
+                continue
+            except OSError as ex:
+                ring.release(slot)
+                if not self._closed:
+                    logging.getLogger().warning('Background reader stopped: %s' % ex)
+                break
+            finally:
+                view.release()
+            ring.put(slot, nbytes, addr, time.time_ns())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: serialization.py
+The registry of the codecs used by send_object/recv_object.
+
+Every codec has a numeric id (travelling in the frame header) and a name. The built-in
+codecs are raw, text, pickle, marshal and json; application codecs take the ids from
+frame.CODEC_USER on. SchemaCodec compiles a fixed record layout into a struct.Struct:
+
+    sensor = SchemaCodec(64, 'sensor', [('id', 'I'), ('temperature', 'f'), ('humidity', 'f')])
+    register_codec(sensor)
+    udpchan.send_object({'id': 7, 'temperature': 21.5, 'humidity': 0.4}, codec='sensor')
+
+The codec registry is process wide: senders and receivers must register the same codecs.
+"""
+
+import json
+import marshal
+import operator
+import pickle
+import struct
+from multisock import frame
+from multisock.crypter import ENCODING
+from multisock.exceptions import CodecException
+
+
+class Codec:
+    """
+    Converts objects to bytes and back. Subclasses implement encode/decode.
+    """
+
+    def __init__(self, codec_id, name):
+        if not 0 <= codec_id <= 255:
+            raise CodecException(f'Invalid codec id {codec_id}')
+        self.codec_id = codec_id
+        self.name = name
+
+    def __repr__(self):
+        return 'Codec<%s:%d>' % (self.name, self.codec_id)
+
+    def encode(self, obj):
+        raise NotImplementedError()
+
+    def decode(self, data):
+        raise NotImplementedError()
+
+
+class RawCodec(Codec):
+    def __init__(self):
+        super().__init__(frame.CODEC_RAW, 'raw')
+
+    def encode(self, obj):
+        return bytes(obj)
+
+    def decode(self, data):
+        return bytes(data)
+
+
+class TextCodec(Codec):
+    def __init__(self):
+        super().__init__(frame.CODEC_TEXT, 'text')
+
+    def encode(self, obj):
+        return obj.encode(ENCODING)
+
+    def decode(self, data):
+        return str(data, ENCODING)
+
+
+class PickleCodec(Codec):
+    def __init__(self):
+        super().__init__(frame.CODEC_PICKLE, 'pickle')
+
+    def encode(self, obj):
+        return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data):
+        return pickle.loads(data)
+
+
+class MarshalCodec(Codec):
+    """
+    Fast, but limited to the core python types and to peers running the same python version.
+    """
+
+    def __init__(self):
+        super().__init__(frame.CODEC_MARSHAL, 'marshal')
+
+    def encode(self, obj):
+        return marshal.dumps(obj)
+
+    def decode(self, data):
+        return marshal.loads(data)
+
+
+class JsonCodec(Codec):
+    """
+    Language independent: receivers are not tied to python classes.
+    """
+
+    def __init__(self):
+        super().__init__(frame.CODEC_JSON, 'json')
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode(ENCODING)
+
+    def decode(self, data):
+        return json.loads(str(data, ENCODING))
+
+
+class SchemaCodec(Codec):
+    """
+    Codec for fixed shape records described by a list of (field name, struct format)
+    couples, e.g. [('id', 'I'), ('temperature', 'f')]. The layout is compiled once
+    into a struct.Struct, so that records are packed/unpacked without introspection.
+
+    Records are encoded from dicts or from objects having the fields as attributes and
+    decoded as dicts, or through factory(*values) when a factory is given.
+    """
+
+    def __init__(self, codec_id, name, fields, factory=None, byteorder='!'):
+        super().__init__(codec_id, name)
+        if not fields:
+            raise CodecException('A schema requires at least one field')
+        self.fields = tuple(field for (field, fmt) in fields)
+        self.factory = factory
+        try:
+            self._struct = struct.Struct(byteorder + ''.join(fmt for (field, fmt) in fields))
+        except struct.error as ex:
+            raise CodecException(f'Invalid schema {fields}: {ex}')
+        self._items = operator.itemgetter(*self.fields)
+        self._attrs = operator.attrgetter(*self.fields)
+        self._single = len(self.fields) == 1
+
+    @property
+    def size(self):
+        return self._struct.size
+
+    def encode(self, obj):
+        values = self._items(obj) if isinstance(obj, dict) else self._attrs(obj)
+        if self._single:
+            return self._struct.pack(values)
+        return self._struct.pack(*values)
+
+    def decode(self, data):
+        values = self._struct.unpack(data)
+        if self.factory is not None:
+            return self.factory(*values)
+        return dict(zip(self.fields, values))
+
+
+_codecs_by_id = {}
+_codecs_by_name = {}
+
+
+def register_codec(codec, replace=False):
+    """
+    Registers a codec. Registering a different codec with the id or the name of an
+    existing one raises CodecException unless replace is True.
+    """
+    if not isinstance(codec, Codec):
+        raise CodecException('Codec instance expected')
+    for existing in (_codecs_by_id.get(codec.codec_id), _codecs_by_name.get(codec.name)):
+        if existing is not None and existing is not codec:
+            if not replace:
+                raise CodecException(f'Codec already registered: {existing}')
+            _codecs_by_id.pop(existing.codec_id, None)
+            _codecs_by_name.pop(existing.name, None)
+    _codecs_by_id[codec.codec_id] = codec
+    _codecs_by_name[codec.name] = codec
+    return codec
+
+
+def unregister_codec(codec):
+    codec = get_codec(codec)
+    _codecs_by_id.pop(codec.codec_id, None)
+    _codecs_by_name.pop(codec.name, None)
+
+
+def get_codec(codec):
+    """
+    Returns the registered codec given its id, its name or the codec itself.
+    """
+    if isinstance(codec, Codec):
+        return codec
+    found = _codecs_by_id.get(codec) if isinstance(codec, int) else _codecs_by_name.get(codec)
+    if found is None:
+        raise CodecException(f'Unknown codec {codec}')
+    return found
+
+
+for _codec in (RawCodec(), TextCodec(), PickleCodec(), MarshalCodec(), JsonCodec()):
+    register_codec(_codec)
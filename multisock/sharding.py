@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: sharding.py
+Spreads the traffic of a channel over many multicast groups (the shards), so that
+every receiver joins only the shards it needs and the NIC and the kernel drop the
+others (IGMP) before they reach Python.
+
+Messages are assigned to a shard by hashing their key (by default their topic) on a
+consistent hash ring: adding or removing a shard remaps only the keys of that shard.
+
+#### THE CONSUMER ####
+udpchan = ShardedChannel(['239.1.1.1', '239.1.1.2', '239.1.1.3'], 1234)
+udpchan.join('/lights/kitchen')
+(data, sender) = udpchan.recv()
+
+#### THE PRODUCER ####
+udpchan = ShardedChannel(['239.1.1.1', '239.1.1.2', '239.1.1.3'], 1234)
+udpchan.send('on', topic='/lights/kitchen')
+"""
+
+import bisect
+import hashlib
+import socket
+import struct
+import sys
+from multisock.channel import Channel, SOCKET_MODE_SINGLE
+
+DEFAULT_REPLICAS = 128
+CACHE_SIZE = 4096
+# linux/in.h: deliver only the groups joined by the socket (not by the whole host)
+IP_MULTICAST_ALL = getattr(socket, 'IP_MULTICAST_ALL', 49 if sys.platform.startswith('linux') else None)
+
+
+def _hash(value):
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    elif not isinstance(value, (bytes, bytearray)):
+        value = str(value).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    A consistent hash ring: every node owns replicas * weight points of the ring, and a
+    key belongs to the node of the first point following the hash of the key.
+    """
+
+    def __init__(self, nodes=(), replicas=DEFAULT_REPLICAS):
+        self.replicas = replicas
+        self._weights = {}
+        self._points = []
+        self._owners = []
+        self._cache = {}
+        weights = nodes if isinstance(nodes, dict) else dict.fromkeys(nodes, 1)
+        for node, weight in weights.items():
+            self._check(node, weight)
+            self._weights[node] = weight
+        self._rebuild()
+
+    def __len__(self):
+        return len(self._weights)
+
+    def __contains__(self, node):
+        return node in self._weights
+
+    @property
+    def nodes(self):
+        return list(self._weights)
+
+    def add(self, node, weight=1):
+        self._check(node, weight)
+        self._weights[node] = weight
+        self._rebuild()
+
+    def remove(self, node):
+        """
+        Removes a node; raises KeyError if not in the ring.
+        """
+        del self._weights[node]
+        self._rebuild()
+
+    def lookup(self, key):
+        """
+        Returns the node owning key.
+        """
+        node = self._cache.get(key)
+        if node is None:
+            if not self._points:
+                raise ValueError('Empty hash ring')
+            index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+            node = self._owners[index]
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.clear()
+            self._cache[key] = node
+        return node
+
+    def _check(self, node, weight):
+        if node in self._weights:
+            raise ValueError(f'Node already in the ring: {node}')
+        if weight <= 0:
+            raise ValueError(f'Invalid weight: {weight}')
+
+    def _rebuild(self):
+        ring = sorted((_hash(f'{node}#{i}'), node)
+                      for node, weight in self._weights.items()
+                      for i in range(self.replicas * weight))
+        self._points = [point for (point, node) in ring]
+        self._owners = [node for (point, node) in ring]
+        self._cache.clear()
+
+
+class ShardedChannel(Channel):
+    """
+    Creates a channel whose messages are spread over the multicast groups of shard_map
+    (a list of group ips, or a dict mapping group ips to their weight), all on mcast_port.
+    Shards are told apart by group rather than by port because the NIC filters
+    multicast by group address: traffic of the shards not joined never reaches the host.
+
+    - send/send_object/send_many/send_objects_many take a key (by default the topic)
+      selecting the shard of the message
+    - join(key)/join_shard(mcast_ip) subscribe the receiver to the shard of key or to
+      a given shard; a receiver gets only the messages of the joined shards
+    - add_shard/remove_shard change the shard map: only the keys of the shard added or
+      removed move to another shard
+
+    Other parameters are the ones of the Channel, except shared (the groups joined are
+    the channel's own) and reliable (the NACKs travel on a single group). Messages leave
+    from an unbound socket outside of the groups, unless socket_mode is SOCKET_MODE_SINGLE.
+    Note: systems bound the groups joined by a socket (20 by default on Linux, see
+    net.ipv4.igmp_max_memberships).
+    """
+
+    def __init__(self, shard_map, mcast_port, bufsize=4096, iface_ip=None, crypto=None,
+                 replicas=DEFAULT_REPLICAS, **kwargs):
+        if kwargs.get('shared'):
+            raise ValueError('ShardedChannel does not support shared sockets')
+        if kwargs.get('reliable'):
+            raise ValueError('ShardedChannel does not support the reliable mode')
+        self.ring = HashRing(shard_map, replicas)
+        if len(self.ring) == 0:
+            raise ValueError('At least a shard is required')
+        self.joined = set()
+        super().__init__(self.ring.nodes[0], mcast_port, bufsize, iface_ip, crypto, **kwargs)
+
+    def __init_protocol__(self):
+        # UDP socket reader: joins the groups later on
+        self.reader = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.reader.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._drop_counter = self.__init_drop_counter__(self.reader)
+        if IP_MULTICAST_ALL is not None:
+            self.reader.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+        self.reader.setblocking(1)
+        self.reader.bind((self.iface_ip, self.mcast_port))
+        if self.socket_mode == SOCKET_MODE_SINGLE:
+            self.writer = self.reader
+        else:
+            self.writer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.__init_sender__(self.writer)
+
+    def __repr__(self):
+        return 'ShardedMulticastCh<%d shards:%d>' % (len(self.ring), self.mcast_port)
+
+    def shard(self, key):
+        """
+        Returns the group ip of the shard of key.
+        """
+        return self.ring.lookup(key)
+
+    def join(self, *keys):
+        """
+        Joins the shards of the given keys (e.g. topics).
+        """
+        for key in keys:
+            self.join_shard(self.shard(key))
+
+    def join_shard(self, mcast_ip):
+        if mcast_ip not in self.ring:
+            raise ValueError(f'Unknown shard: {mcast_ip}')
+        if mcast_ip in self.joined:
+            return
+        _mreq = struct.pack("4sI", socket.inet_aton(mcast_ip), socket.INADDR_ANY)
+        self.reader.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _mreq)
+        self.joined.add(mcast_ip)
+
+    def leave_shard(self, mcast_ip):
+        if mcast_ip not in self.joined:
+            return
+        _mreq = struct.pack("4sI", socket.inet_aton(mcast_ip), socket.INADDR_ANY)
+        self.reader.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, _mreq)
+        self.joined.discard(mcast_ip)
+
+    def add_shard(self, mcast_ip, weight=1):
+        self.ring.add(mcast_ip, weight)
+
+    def remove_shard(self, mcast_ip):
+        self.leave_shard(mcast_ip)
+        self.ring.remove(mcast_ip)
+
+    def _dest(self, key, topic):
+        key = topic if key is None else key
+        if key is None:
+            raise ValueError('A key or a topic is required to select the shard')
+        return self.shard(key), self.mcast_port
+
+    def send_object(self, obj, codec=None, topic=None, key=None):
+        """
+        Sends an object on the shard of key (by default the topic).
+        """
+        self._transmit(self._encode_object(obj, codec, topic), self._dest(key, topic))
+
+    def send(self, data, topic=None, key=None):
+        """
+        Sends data on the shard of key (by default the topic).
+        """
+        self._transmit(self._encode(data, topic), self._dest(key, topic))
+
+    def send_many(self, iterable, topic=None, key=None):
+        """
+        Sends every element of iterable on the shard of key (by default the topic).
+        Returns the number of datagrams actually queued by the kernel.
+        """
+        return self._transmit_many([self._encode(data, topic) for data in iterable], self._dest(key, topic))
+
+    def send_objects_many(self, iterable, codec=None, topic=None, key=None):
+        """
+        Sends every object of iterable on the shard of key (by default the topic).
+        Returns the number of datagrams actually queued by the kernel.
+        """
+        return self._transmit_many([self._encode_object(obj, codec, topic) for obj in iterable],
+                                   self._dest(key, topic))
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: shared.py
+One receiving socket per group for all the channels of the process.
+
+Every channel joins the group with sockets of its own (two in SOCKET_MODE_DUAL): the
+kernel copies every datagram into each of them, so N channels of a process on the same
+group cost 2N copies per datagram. Channels created with shared=True read the group
+from a socket shared by all the channels of the process on the same (group, port,
+interface): a thread receives every datagram once and copies it into the ring (see
+ring.py) of each channel. The socket is reference counted: it leaves the group when the
+last channel reading it is closed.
+
+Shared channels send from a socket of their own, neither bound nor member of the group
+(as SOCKET_MODE_SEND_ONLY), thus their sending options (ttl, loop, pacing) stay their own.
+The channels of a socket share its options (e.g. rcvbuf) but not their timeouts.
+With the OVERFLOW_BLOCK policy a slow channel holds back the others too.
+"""
+
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+from multisock import mmsg
+
+# Large enough for any UDP datagram: every channel gets at most its bufsize bytes
+MAX_DATAGRAM = 65535
+# How often the fan-out thread checks whether the socket is closed
+POLL_INTERVAL = 0.1
+
+# (group, port, interface) -> SharedSocket
+_sockets = {}
+_lock = threading.Lock()
+
+
+def open_reader(mcast_ip, mcast_port, iface_ip='0.0.0.0'):
+    """
+    Returns a new SharedReader on the socket shared by the process for the group
+    mcast_ip:mcast_port on iface_ip, opening the socket on first usage.
+    """
+    key = (mcast_ip, mcast_port, iface_ip)
+    with _lock:
+        shared = _sockets.get(key)
+        if shared is None:
+            shared = _sockets[key] = SharedSocket(mcast_ip, mcast_port, iface_ip)
+        reader = SharedReader(shared)
+        shared.readers.append(reader)
+        return reader
+
+
+def shared_sockets():
+    """
+    Returns the number of readers of every shared socket open, by (group,port,interface).
+    """
+    with _lock:
+        return {key: len(shared.readers) for (key, shared) in _sockets.items()}
+
+
+class SharedSocket:
+    """
+    A socket member of mcast_ip, bound to mcast_port on iface_ip, whose datagrams a
+    background thread copies into the ring of every reader attached (see open_reader).
+    - received: datagrams received
+    - delivered: copies queued into the rings of the readers
+    """
+
+    def __init__(self, mcast_ip, mcast_port, iface_ip):
+        self.key = (mcast_ip, mcast_port, iface_ip)
+        self.readers = []
+        self.received = 0
+        self.delivered = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._drops = False
+        if mmsg.SO_RXQ_OVFL is not None and mmsg.DROPS_CONTROL_SIZE > 0:
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, mmsg.SO_RXQ_OVFL, 1)
+                self._drops = True
+            except OSError:
+                pass
+        _mreq = struct.pack("4sI", socket.inet_aton(mcast_ip), socket.INADDR_ANY)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, _mreq)
+        self.sock.bind((iface_ip, mcast_port))
+        # the readers attached to a ring, replaced (never changed) by subscribe/release
+        self._subscribers = ()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='multisock-shared', daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return len(self.readers)
+
+    def subscribe(self):
+        """
+        Starts the delivery to the readers just attached to a ring.
+        """
+        with _lock:
+            self._subscribers = tuple(item for item in self.readers if item.ring is not None)
+
+    def release(self, reader):
+        """
+        Detaches reader: the last one closes the socket.
+        """
+        with _lock:
+            if reader in self.readers:
+                self.readers.remove(reader)
+            self._subscribers = tuple(item for item in self.readers if item.ring is not None)
+            last = not self.readers
+            if last and _sockets.get(self.key) is self:
+                del _sockets[self.key]
+        if reader.ring is not None:
+            reader.ring.close()
+        if last:
+            self.close()
+
+    def close(self):
+        self._closed = True
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self.sock.close()
+
+    def _run(self):
+        memory = bytearray(MAX_DATAGRAM)
+        view = memoryview(memory)
+        while not self._closed:
+            try:
+                readable, _, _ = select.select([self.sock], [], [], POLL_INTERVAL)
+            except (OSError, ValueError):
+                # closed socket
+                break
+            if not readable:
+                continue
+            dropped = None
+            try:
+                if self._drops:
+                    nbytes, ancdata, _, addr = self.sock.recvmsg_into([view], mmsg.DROPS_CONTROL_SIZE)
+                    if ancdata:
+                        dropped = mmsg.parse_drops(ancdata)
+                else:
+                    nbytes, addr = self.sock.recvfrom_into(view)
+            except BlockingIOError:
+                continue
+            except OSError as ex:
+                if not self._closed:
+                    logging.getLogger().warning('Shared reader of %s:%d stopped: %s' % (self.key[0], self.key[1], ex))
+                break
+            arrival_ns = time.time_ns()
+            self.received += 1
+            for reader in self._subscribers:
+                if dropped is not None and reader.on_drops is not None:
+                    reader.on_drops(dropped)
+                ring = reader.ring
+                slot, target = ring.acquire()
+                size = min(nbytes, ring.bufsize)
+                target[:size] = view[:size]
+                target.release()
+                if ring.put(slot, size, addr, arrival_ns):
+                    self.delivered += 1
+
+
+class SharedReader:
+    """
+    The handle of a channel on a SharedSocket, standing for its reader socket: socket
+    options are set on the shared socket, while the timeout (settimeout, setblocking)
+    is the channel's own and bounds the wait on its ring. close() releases the socket.
+    """
+
+    def __init__(self, shared):
+        self.shared = shared
+        self.ring = None
+        self.on_drops = None
+        self.closed = False
+        self._timeout = None
+
+    def __repr__(self):
+        return 'SharedReader<%s:%d>' % self.shared.key[:2]
+
+    def attach(self, ring, on_drops=None):
+        """
+        Starts the delivery of the datagrams of the shared socket into ring, handing the
+        kernel drop counter of the socket (SO_RXQ_OVFL) over to on_drops(count).
+        """
+        self.ring = ring
+        self.on_drops = on_drops
+        self.shared.subscribe()
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def gettimeout(self):
+        return self._timeout
+
+    def setblocking(self, flag):
+        self._timeout = None if flag else 0.0
+
+    def getblocking(self):
+        return self._timeout != 0.0
+
+    def fileno(self):
+        return self.shared.sock.fileno()
+
+    def getsockname(self):
+        return self.shared.sock.getsockname()
+
+    def setsockopt(self, *args):
+        return self.shared.sock.setsockopt(*args)
+
+    def getsockopt(self, *args):
+        return self.shared.sock.getsockopt(*args)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.shared.release(self)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: state.py
+Publishes the state (a dict of fields) of many keys (e.g. devices) sending only what
+changes.
+
+The publisher keeps the last state sent for every key: an update carries only the
+fields changed or removed since then (a delta), and a full keyframe goes out every
+keyframe_interval updates or keyframe_period seconds. Every message of a key has a
+version: subscribers apply a delta only on top of the version preceding it, otherwise
+(a message was lost) the key is stale until its next keyframe.
+
+#### THE PUBLISHER ####
+publisher = StatePublisher(udpchan)
+publisher.publish('thermostat-1', {'temperature': 21.5, 'mode': 'heat'})
+
+#### THE SUBSCRIBER ####
+subscriber = StateSubscriber(udpchan)
+(key, state, sender) = subscriber.recv()
+
+Messages are sent with send_object as tuples (kind, key, epoch, version, fields, removed):
+the epoch tells apart the restarts of the publisher.
+"""
+
+import random
+import time
+
+KEYFRAME = 'K'
+DELTA = 'D'
+DEFAULT_KEYFRAME_INTERVAL = 10
+DEFAULT_KEYFRAME_PERIOD = 5.0
+
+
+class _PublishedKey:
+    __slots__ = ('state', 'version', 'updates', 'next_keyframe')
+
+    def __init__(self):
+        self.state = None
+        self.version = 0
+        self.updates = 0
+        self.next_keyframe = 0.0
+
+
+class StatePublisher:
+    """
+    Publishes on channel the state of many keys: a keyframe with all the fields every
+    keyframe_interval updates or keyframe_period seconds (whatever comes first), a delta
+    with the changed and removed fields otherwise. The optional topic is the one of the
+    messages sent.
+    States are compared field by field (==) to the copy of the last one sent: values
+    must be replaced rather than mutated in place.
+    """
+
+    def __init__(self, channel, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+                 keyframe_period=DEFAULT_KEYFRAME_PERIOD, topic=None):
+        self.channel = channel
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_period = keyframe_period
+        self.topic = topic
+        self.epoch = random.getrandbits(32)
+        self.keyframes = 0
+        self.deltas = 0
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def publish(self, key, state):
+        """
+        Publishes the current state (a dict) of key. Nothing is sent when the state did
+        not change and no keyframe is due. Returns True if a message was sent.
+        """
+        published = self._keys.get(key)
+        if published is None:
+            published = self._keys[key] = _PublishedKey()
+        if published.state is None or self._keyframe_due(published):
+            self._send_keyframe(key, published, state)
+            return True
+        last = published.state
+        changed = {field: value for (field, value) in state.items() if field not in last or last[field] != value}
+        removed = [field for field in last if field not in state]
+        if not changed and not removed:
+            return False
+        if len(changed) + len(removed) >= len(state):
+            # the delta is not smaller than the state
+            self._send_keyframe(key, published, state)
+            return True
+        published.version += 1
+        published.updates += 1
+        published.state = dict(state)
+        self.deltas += 1
+        self.channel.send_object((DELTA, key, self.epoch, published.version, changed, removed), topic=self.topic)
+        return True
+
+    def keyframe(self, key=None):
+        """
+        Sends right away the keyframe of key (of every key if None), e.g. when a
+        subscriber joins.
+        """
+        for (published_key, published) in ([(key, self._keys[key])] if key is not None else self._keys.items()):
+            if published.state is not None:
+                self._send_keyframe(published_key, published, published.state)
+
+    def forget(self, key):
+        """
+        Stops tracking key: its next state is published as a keyframe.
+        """
+        self._keys.pop(key, None)
+
+    def _keyframe_due(self, published):
+        return published.updates >= self.keyframe_interval or time.monotonic() >= published.next_keyframe
+
+    def _send_keyframe(self, key, published, state):
+        published.version += 1
+        published.updates = 0
+        published.next_keyframe = time.monotonic() + self.keyframe_period
+        published.state = dict(state)
+        self.keyframes += 1
+        self.channel.send_object((KEYFRAME, key, self.epoch, published.version, published.state, []),
+                                 topic=self.topic)
+
+
+class StateSubscriber:
+    """
+    Rebuilds the state of the keys published by StatePublishers on channel.
+    A key whose messages were lost is stale (see is_stale) until its next keyframe:
+    its last known state is kept meanwhile.
+    Other objects received on the channel are ignored.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.states = {}
+        self.gaps = 0
+        self.ignored = 0
+        # key -> (epoch, version) of the state
+        self._versions = {}
+        self._stale = set()
+
+    def __len__(self):
+        return len(self.states)
+
+    def get(self, key, default=None):
+        return self.states.get(key, default)
+
+    def is_stale(self, key):
+        return key in self._stale
+
+    @property
+    def stale(self):
+        return set(self._stale)
+
+    def apply(self, message):
+        """
+        Applies a received message: returns the key whose state changed, or None when
+        the message is ignored (not a state message, out of date or not applicable).
+        """
+        try:
+            kind, key, epoch, version, fields, removed = message
+            current = self._versions.get(key)
+        except (TypeError, ValueError):
+            self.ignored += 1
+            return None
+        if kind == KEYFRAME:
+            if current is not None and current[0] == epoch and version <= current[1]:
+                # older than the state (reordered)
+                return None
+            self.states[key] = dict(fields)
+            self._versions[key] = (epoch, version)
+            self._stale.discard(key)
+            return key
+        if kind != DELTA:
+            self.ignored += 1
+            return None
+        if current is None or key in self._stale:
+            # waiting for a keyframe
+            return None
+        if current[0] != epoch or version != current[1] + 1:
+            if current[0] != epoch or version > current[1]:
+                self.gaps += 1
+                self._stale.add(key)
+            return None
+        state = self.states[key]
+        state.update(fields)
+        for field in removed:
+            state.pop(field, None)
+        self._versions[key] = (epoch, version)
+        return key
+
+    def recv(self):
+        """
+        Receives messages until the state of a key changes and returns a triple
+            (key,state,addr)
+        where state is the current state of key (None once the channel returns None).
+        """
+        while True:
+            received = self.channel.recv_object()
+            if received is None:
+                return None
+            message, addr = received
+            key = self.apply(message)
+            if key is not None:
+                return key, self.states[key], addr
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Filename: topics.py
+The subscription index used by the channels to filter messages by topic.
+
+Topics are '/' separated paths (e.g. /lights/kitchen). Patterns can use the wildcards:
+- '+' matching exactly one level: /lights/+ matches /lights/kitchen
+- '#' (last level only) matching any number of remaining levels: /lights/# matches
+  /lights, /lights/kitchen and /lights/kitchen/ceiling
+
+Patterns are stored in a trie, and the result of every lookup is cached by topic so
+that the (usually few) topics seen on a group cost a single dict lookup.
+"""
+
+SEPARATOR = '/'
+SINGLE_LEVEL = '+'
+MULTI_LEVEL = '#'
+CACHE_SIZE = 4096
+
+
+class _Node:
+    __slots__ = ('children', 'values', 'multi_level')
+
+    def __init__(self):
+        self.children = {}
+        # values of the patterns ending here
+        self.values = []
+        # values of the patterns ending here with '#'
+        self.multi_level = []
+
+    def empty(self):
+        return not self.children and not self.values and not self.multi_level
+
+
+def validate_pattern(pattern):
+    levels = pattern.split(SEPARATOR)
+    for i, level in enumerate(levels):
+        if MULTI_LEVEL in level and (level != MULTI_LEVEL or i != len(levels) - 1):
+            raise ValueError(f"Invalid pattern {pattern}: '#' must be the whole last level")
+        if SINGLE_LEVEL in level and level != SINGLE_LEVEL:
+            raise ValueError(f"Invalid pattern {pattern}: '+' must be a whole level")
+    return levels
+
+
+class TopicIndex:
+    """
+    Maps topic patterns to values (e.g. callbacks).
+    match(topic) returns the values of all the patterns matching topic.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._cache = {}
+        self._count = 0
+
+    def __len__(self):
+        """
+        The number of (pattern, value) couples in the index.
+        """
+        return self._count
+
+    def add(self, pattern, value):
+        levels = validate_pattern(pattern)
+        node = self._root
+        multi_level = levels[-1] == MULTI_LEVEL
+        for level in (levels[:-1] if multi_level else levels):
+            node = node.children.setdefault(level, _Node())
+        (node.multi_level if multi_level else node.values).append(value)
+        self._count += 1
+        self._cache.clear()
+
+    def remove(self, pattern, value):
+        """
+        Removes a (pattern, value) couple; raises KeyError if not in the index.
+        """
+        levels = validate_pattern(pattern)
+        multi_level = levels[-1] == MULTI_LEVEL
+        path = [self._root]
+        for level in (levels[:-1] if multi_level else levels):
+            node = path[-1].children.get(level)
+            if node is None:
+                raise KeyError(pattern)
+            path.append(node)
+        values = path[-1].multi_level if multi_level else path[-1].values
+        if value not in values:
+            raise KeyError(pattern)
+        values.remove(value)
+        self._count -= 1
+        self._cache.clear()
+        # prune the branches left empty
+        for i in range(len(path) - 1, 0, -1):
+            if not path[i].empty():
+                break
+            del path[i - 1].children[levels[i - 1]]
+
+    def match(self, topic):
+        """
+        Returns the tuple of the values of the patterns matching topic.
+        """
+        found = self._cache.get(topic)
+        if found is None:
+            values = []
+            self._collect(self._root, topic.split(SEPARATOR), 0, values)
+            found = tuple(values)
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.clear()
+            self._cache[topic] = found
+        return found
+
+    def _collect(self, node, levels, depth, values):
+        values.extend(node.multi_level)
+        if depth == len(levels):
+            values.extend(node.values)
+            return
+        level = levels[depth]
+        child = node.children.get(level)
+        if child is not None:
+            self._collect(child, levels, depth + 1, values)
+        child = node.children.get(SINGLE_LEVEL) if level != SINGLE_LEVEL else None
+        if child is not None:
+            self._collect(child, levels, depth + 1, values)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""
+Compares the kernel CPU time spent per received datagram by the channel socket modes.
+
+A child process blasts datagrams on the group while the channel drains them: in dual
+mode the kernel also delivers every datagram to the writer socket, which nobody reads,
+until its buffer is full and then keeps cloning and dropping them (see the kernel
+RcvbufErrors counter). On loopback the delivery to the group members runs in the context
+of the sender, so the system time of both processes is accounted; the best of a few
+rounds is reported.
+
+    python samples/bench_socket_modes.py [count] [payload size] [rounds]
+"""
+
+# Include parent folder in module resolution
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import multiprocessing
+import resource
+import socket
+import time
+from multisock.channel import Channel, SOCKET_MODES
+
+GROUP = ('224.1.1.1', 1260)
+
+
+def blast(count, size):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    payload = bytes(size)
+    for i in range(count):
+        sock.sendto(payload, GROUP)
+        if i % 64 == 63:
+            # leave the receiver a chance to keep up
+            time.sleep(0.0002)
+    sock.close()
+
+
+def system_time():
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_stime
+            + resource.getrusage(resource.RUSAGE_CHILDREN).ru_stime)
+
+
+def rcvbuf_errors():
+    try:
+        with open('/proc/net/snmp') as snmp:
+            names, values = [line.split() for line in snmp if line.startswith('Udp:')][:2]
+        return int(values[names.index('RcvbufErrors')])
+    except (OSError, ValueError):
+        return 0
+
+
+def drain(sock):
+    queued = 0
+    sock.setblocking(0)
+    try:
+        while True:
+            queued += len(sock.recv(65536))
+    except BlockingIOError:
+        return queued
+
+
+def run(socket_mode, count, size):
+    channel = Channel(GROUP[0], GROUP[1], 2048, '0.0.0.0', socket_mode=socket_mode)
+    channel.reader.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    errors = rcvbuf_errors()
+    start = system_time()
+    sender = multiprocessing.Process(target=blast, args=(count, size))
+    sender.start()
+    received = 0
+    while True:
+        batch = channel.recv_many(256, timeout=0.5)
+        if not batch:
+            break
+        received += len(batch)
+    sender.join()
+    elapsed = system_time() - start
+    dropped = rcvbuf_errors() - errors
+    # payload bytes queued (and never read) in the writer socket
+    pinned = drain(channel.writer) if channel.writer is not channel.reader else 0
+    channel.close()
+    return received, elapsed, dropped, pinned
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    print(f'{count} datagrams of {size} bytes, best of {rounds} rounds')
+    print(f'{"mode":<10} {"received":>9} {"sys µs/pkt":>11} {"kernel drops":>13} {"writer queue":>13}')
+    for socket_mode in SOCKET_MODES:
+        results = [run(socket_mode, count, size) for _ in range(rounds)]
+        received, elapsed, dropped, pinned = min(results, key=lambda result: result[1] / max(result[0], 1))
+        per_packet = elapsed / max(received, 1) * 1e6
+        print(f'{socket_mode:<10} {received:>9} {per_packet:>11.2f} {dropped:>13} {pinned:>13}')
@@ -0,0 +1,109 @@
+import unittest
+import asyncio
+from multisock import frame
+from multisock.asyncchannel import AsyncChannel
+from multisock.crypter import Crypter
+
+
+class Test_AsyncChannel(unittest.TestCase):
+
+    def test_message_exchange(self):
+        async def scenario():
+            crypto = Crypter('pwd', 'passphrase')
+            async with AsyncChannel('224.1.1.1', 1240, 2048, '0.0.0.0', crypto) as receiver, \
+                    AsyncChannel('224.1.1.1', 1240, 2048, '0.0.0.0', crypto) as sender:
+                await sender.send('Hello World')
+                return await asyncio.wait_for(receiver.recv(), 5)
+
+        (data, sender) = asyncio.run(scenario())
+        self.assertEqual(data, 'Hello World')
+
+    def test_object_exchange(self):
+        async def scenario():
+            async with AsyncChannel('224.1.1.1', 1241, 2048, '0.0.0.0') as receiver, \
+                    AsyncChannel('224.1.1.1', 1241, 2048, '0.0.0.0') as sender:
+                await sender.send_object({'str': 'Hello world', 'bool': True})
+                return await asyncio.wait_for(receiver.recv_object(), 5)
+
+        (obj, sender) = asyncio.run(scenario())
+        self.assertEqual(obj, {'str': 'Hello world', 'bool': True})
+
+    def test_send_many(self):
+        async def scenario():
+            async with AsyncChannel('224.1.1.1', 1283, 2048, '0.0.0.0') as receiver, \
+                    AsyncChannel('224.1.1.1', 1283, 2048, '0.0.0.0', fec=(4, 1)) as sender:
+                sent = [await sender.send_objects_many(range(10)), await sender.send_many([b'a', b'b'])]
+                datagram = frame.encode(frame.CODEC_RAW, b'raw')
+                sent.append(await sender.send_raw([datagram]))
+                objects = [(await asyncio.wait_for(receiver.recv_object(), 5))[0] for _ in range(10)]
+                data = [(await asyncio.wait_for(receiver.recv(), 5))[0] for _ in range(3)]
+                return sent, objects, data
+
+        (sent, objects, data) = asyncio.run(scenario())
+        # the parity of the groups closed by every batch
+        self.assertEqual(sent, [13, 3, 1])
+        self.assertEqual(objects, list(range(10)))
+        self.assertEqual(data, [b'a', b'b', b'raw'])
+
+    def test_fec_group_deadline(self):
+        async def scenario():
+            async with AsyncChannel('224.1.1.1', 1284, 2048, '0.0.0.0', fec=(4, 1), fec_delay=0.02) as sender:
+                await sender.send_object('alone')
+                await asyncio.sleep(0.2)
+                return sender.stats()
+
+        stats = asyncio.run(scenario())
+        # the parity of the partly filled group, sent by the event loop
+        self.assertEqual((stats['fec_parity_sent'], stats['datagrams_sent']), (1, 2))
+
+    def test_async_iteration_stops_on_close(self):
+        async def scenario():
+            received = []
+            async with AsyncChannel('224.1.1.1', 1242, 2048, '0.0.0.0') as sender:
+                receiver = await AsyncChannel('224.1.1.1', 1242, 2048, '0.0.0.0').open()
+                for i in range(3):
+                    await sender.send(b'msg%d' % i)
+
+                async def consume():
+                    async for (data, addr) in receiver:
+                        received.append(data)
+                        if len(received) == 3:
+                            receiver.close()
+
+                await asyncio.wait_for(consume(), 5)
+            return received
+
+        self.assertEqual(asyncio.run(scenario()), [b'msg0', b'msg1', b'msg2'])
+
+    def test_single_socket_mode(self):
+        async def scenario():
+            async with AsyncChannel('224.1.1.1', 1248, 2048, '0.0.0.0', socket_mode='single') as receiver, \
+                    AsyncChannel('224.1.1.1', 1248, 2048, '0.0.0.0', socket_mode='send-only') as sender:
+                await sender.send(b'Hello World')
+                return await asyncio.wait_for(receiver.recv(), 5)
+
+        (data, sender) = asyncio.run(scenario())
+        self.assertEqual(data, b'Hello World')
+
+    def test_recv_after_close_returns_none(self):
+        async def scenario():
+            chan = AsyncChannel('224.1.1.1', 1243, 2048, '0.0.0.0')
+            chan.close()
+            return await chan.recv()
+
+        self.assertIsNone(asyncio.run(scenario()))
+
+    def test_set_read_blocking_not_supported(self):
+        chan = AsyncChannel('224.1.1.1', 1244, 2048, '0.0.0.0')
+        with self.assertRaises(NotImplementedError):
+            chan.set_read_blocking(True)
+        chan.close()
+
+    def test_blocking_receive_not_supported(self):
+        chan = AsyncChannel('224.1.1.1', 1244, 2048, '0.0.0.0')
+        for (method, args) in [(chan.recv_many, ()), (chan.recv_objects_many, ()), (chan.recv_into, (bytearray(16),)),
+                               (chan.recv_view, ()), (chan.recv_with_meta, ()), (chan.recv_object_with_meta, ()),
+                               (chan.dispatch, ())]:
+            with self.assertRaises(NotImplementedError):
+                method(*args)
+        chan.close()
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import unittest
+from multisock import benchmark
+
+PORT = 1281
+
+
+class Test_Benchmark(unittest.TestCase):
+
+    def test_default_sizes(self):
+        self.assertEqual(benchmark.default_sizes(4096), [16, 64, 256, 1024, 3968])
+        self.assertEqual(benchmark.default_sizes(4096, legacy=True), [16, 64, 256, 1024, 2176])
+
+    def test_run_suite(self):
+        report = benchmark.run_suite(['data'], ['none', 'cbc'], [16], [1], count=50, port=PORT)
+
+        self.assertEqual(len(report['channel']), 2)
+        for result in report['channel']:
+            self.assertEqual(result['sent'], 50)
+            self.assertGreater(result['received'], 0)
+            self.assertEqual(result['lost'], result['sent'] - result['received'])
+            self.assertEqual(result['latency_ns']['count'], result['received'])
+        self.assertEqual([result['crypto'] for result in report['crypter']], ['cbc'])
+        self.assertGreater(report['crypter'][0]['decrypt_per_sec'], 0)
+        json.dumps(report)
+
+    def test_legacy(self):
+        result = benchmark.run_channel('object', 'cbc', 64, 2, 50, rate=5000, port=PORT, legacy=True)
+
+        self.assertTrue(result['legacy'])
+        self.assertGreater(result['received'], 0)
+        # not timestamped
+        self.assertEqual(result['latency_ns']['count'], 0)
+        self.assertIsNone(result['latency_ns']['p50'])
+        benchmark.format_channel_result(result)
+
+    def test_legacy_largest_size(self):
+        for operation in benchmark.OPERATIONS:
+            size = benchmark.default_sizes(benchmark.DEFAULT_BUFSIZE, legacy=True)[-1]
+            result = benchmark.run_channel(operation, 'cbc', size, 1, 5, port=PORT, legacy=True)
+            self.assertEqual((result['received'], result['errors']), (5, 0))
+        # truncated by the receiver: counted as lost
+        result = benchmark.run_channel('data', 'cbc', 3968, 1, 5, port=PORT, legacy=True)
+        self.assertEqual((result['received'], result['errors'], result['lost']), (0, 5, 5))
+
+    def test_reliable_under_loss(self):
+        result = benchmark.run_channel('object', 'gcm', 64, 1, 300, rate=5000, port=PORT, loss=0.1, reliable=True)
+
+        self.assertGreater(result['dropped'], 0)
+        self.assertGreater(result['repaired'], 0)
+        # the tail of the burst too, once announced
+        self.assertEqual(result['lost'], 0)
+
+    def test_main_output(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'results.json')
+            benchmark.main(['--output', path, '--operations', 'object', '--crypto', 'gcm', '--sizes', '64',
+                            '--senders', '2', '--count', '20', '--rate', '2000', '--pace', '5000', '--port', str(PORT)])
+            with open(path) as results:
+                report = json.load(results)
+
+        self.assertEqual(report['config']['senders'], [2])
+        self.assertEqual(report['channel'][0]['sent'], 40)
+        self.assertEqual(report['channel'][0]['rate'], 2000)
+        self.assertEqual(report['config']['pace'], 5000)
+
+
+if __name__ == '__main__':
+    unittest.main()
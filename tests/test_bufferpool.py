@@ -0,0 +1,45 @@
+import unittest
+from multisock.bufferpool import BufferPool, PooledBuffer
+from multisock.exceptions import BufferPoolExhaustedException
+
+
+class Test_BufferPool(unittest.TestCase):
+
+    def test_pool_ctor_invalid_size(self):
+        with self.assertRaises(ValueError):
+            BufferPool(0, 4)
+        with self.assertRaises(ValueError):
+            BufferPool(1024, 0)
+
+    def test_acquire_and_release(self):
+        pool = BufferPool(1024, 2)
+        first = pool.acquire()
+        second = pool.acquire()
+
+        self.assertEqual(len(first), 1024)
+        self.assertIsNot(first, second)
+        self.assertEqual(len(pool), 0)
+        with self.assertRaises(BufferPoolExhaustedException):
+            pool.acquire()
+
+        pool.release(first)
+        self.assertEqual(len(pool), 1)
+        self.assertIs(pool.acquire(), first)
+
+    def test_pooled_buffer_release(self):
+        pool = BufferPool(16, 1)
+        buffer = pool.acquire()
+        buffer[:5] = b'Hello'
+        payload = PooledBuffer(pool, buffer, 5)
+
+        self.assertEqual(len(payload), 5)
+        self.assertEqual(bytes(payload), b'Hello')
+        with payload as view:
+            self.assertEqual(view, b'Hello')
+
+        self.assertEqual(len(pool), 1)
+        with self.assertRaises(ValueError):
+            payload.view.tobytes()
+        # releasing twice must not duplicate the buffer in the pool
+        payload.release()
+        self.assertEqual(len(pool), 1)
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import time
+import unittest
+from multisock.capture import (Recorder, Replayer, SegmentReader, Record, read_records, segment_paths, HEADER,
+                               RECORD, MIN_SEGMENT_SIZE)
+from multisock.exceptions import InvalidSegmentException
+
+ADDR = ('10.0.0.1', 1234)
+
+
+def record_all(recorder, count, first=0, size=100):
+    for i in range(first, first + count):
+        recorder.record(b'%d' % i + b'.' * (size - len(b'%d' % i)), ADDR, 1000 + i)
+
+
+class FakeChannel:
+
+    def __init__(self):
+        self.sent = []
+
+    def send_raw(self, datagrams):
+        self.sent.append(list(datagrams))
+        return len(datagrams)
+
+
+class Test_Capture(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        with Recorder(self.directory) as recorder:
+            recorder.record(b'hello', ('192.168.1.10', 5000), 42)
+            recorder.record(bytearray(b'world'), ('10.0.0.1', 6000))
+            recorder.record(memoryview(b'!'), ADDR, 44)
+        self.assertEqual((recorder.recorded, recorder.bytes_recorded, len(recorder.segments)), (3, 11, 1))
+
+        records = list(read_records(self.directory))
+        self.assertEqual(records[0], Record(42, ('192.168.1.10', 5000), b'hello'))
+        self.assertEqual(records[1].data, b'world')
+        self.assertGreater(records[1].timestamp, 44)
+        self.assertEqual(records[2], Record(44, ADDR, b'!'))
+        # truncated to the records and the index
+        with SegmentReader(recorder.segments[0]) as reader:
+            self.assertEqual(reader.end, HEADER.size + 3 * RECORD.size + 11)
+            self.assertEqual(reader.index, [(42, HEADER.size)])
+        with self.assertRaises(ValueError):
+            recorder.record(b'closed', ADDR)
+
+    def test_rotation(self):
+        recorder = Recorder(self.directory, segment_size=MIN_SEGMENT_SIZE, index_interval=4096, max_segments=3)
+        # 116 bytes per record: 565 records per segment
+        record_all(recorder, 3000)
+        recorder.close()
+
+        self.assertEqual(len(recorder.segments), 3)
+        self.assertEqual(segment_paths(self.directory), recorder.segments)
+        records = list(read_records(self.directory))
+        # the first three of six segments were deleted
+        self.assertEqual([record.timestamp for record in records], list(range(1000 + 3 * 565, 4000)))
+        with SegmentReader(recorder.segments[0]) as reader:
+            # an entry every 36 records
+            self.assertEqual(len(reader.index), 16)
+            self.assertEqual(reader.index[1], (1000 + 3 * 565 + 36, HEADER.size + 36 * 116))
+
+    def test_time_range(self):
+        with Recorder(self.directory, segment_size=MIN_SEGMENT_SIZE, index_interval=1024) as recorder:
+            record_all(recorder, 2000)
+        self.assertEqual([record.timestamp for record in read_records(self.directory, 1500, 1600)],
+                         list(range(1500, 1601)))
+        self.assertEqual([record.timestamp for record in read_records(self.directory, start=2990)],
+                         list(range(2990, 3000)))
+        self.assertEqual([record.timestamp for record in read_records(self.directory, end=1002)], [1000, 1001, 1002])
+        self.assertEqual(list(read_records(self.directory, 5000)), [])
+
+    def test_open_segment(self):
+        recorder = Recorder(self.directory, segment_size=MIN_SEGMENT_SIZE)
+        record_all(recorder, 10)
+        recorder.flush()
+        # still preallocated, without index
+        with SegmentReader(recorder.segments[0]) as reader:
+            self.assertEqual(os.path.getsize(reader.path), MIN_SEGMENT_SIZE)
+            self.assertEqual(reader.index, [])
+            self.assertEqual([record.timestamp for record in reader.records(1005)], list(range(1005, 1010)))
+        record_all(recorder, 5, 10)
+        self.assertEqual(len(list(read_records(recorder.segments[0]))), 15)
+        recorder.close()
+
+    def test_invalid_segment(self):
+        path = os.path.join(self.directory, 'invalid.seg')
+        with open(path, 'wb') as f:
+            f.write(b'not a segment at all')
+        with self.assertRaises(InvalidSegmentException):
+            SegmentReader(path)
+        with open(path, 'wb') as f:
+            f.write(b'MSC')
+        with self.assertRaises(InvalidSegmentException):
+            SegmentReader(path)
+        with self.assertRaises(ValueError):
+            Recorder(self.directory, segment_size=1024)
+
+    def test_replay(self):
+        with Recorder(self.directory) as recorder:
+            for i in range(10):
+                # 20ms apart
+                recorder.record(b'datagram %d' % i, ADDR, i * 20000000)
+        channel = FakeChannel()
+
+        replayer = Replayer(channel, speed=2.0)
+        started = time.monotonic()
+        self.assertEqual(replayer.replay(self.directory), 10)
+        elapsed = time.monotonic() - started
+        # 180ms recorded at twice the speed
+        self.assertGreaterEqual(elapsed, 0.085)
+        self.assertLess(elapsed, 0.18)
+        self.assertEqual([data for batch in channel.sent for data in batch],
+                         [b'datagram %d' % i for i in range(10)])
+
+        channel = FakeChannel()
+        replayer = Replayer(channel, speed=None, batch=4)
+        self.assertEqual(replayer.replay(self.directory, start=20000000), 9)
+        self.assertEqual([len(batch) for batch in channel.sent], [4, 4, 1])
+        with self.assertRaises(ValueError):
+            Replayer(channel, speed=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -83,6 +83,37 @@ class Test_Channel(unittest.TestCase):
         chan.writer.close.assert_called()
         chan.reader.close.assert_called()
 
+    def test_channel_single_socket_mode(self):
+        chan = Channel('224.1.1.1', 1234, 2048, '0.0.0.0', socket_mode='single',
+                       multicast_loop=False, multicast_ttl=1, multicast_if='127.0.0.1')
+
+        self.assertIs(chan.writer, chan.reader)
+        self.assertEqual(self.mock_socket.socket.call_count, 1)
+        chan.reader.setsockopt.assert_any_call(self.mock_socket.IPPROTO_IP, self.mock_socket.IP_MULTICAST_TTL, 1)
+        chan.reader.setsockopt.assert_any_call(self.mock_socket.IPPROTO_IP, self.mock_socket.IP_MULTICAST_LOOP, 0)
+        chan.reader.setsockopt.assert_any_call(self.mock_socket.IPPROTO_IP, self.mock_socket.IP_MULTICAST_IF,
+                                               self.mock_socket.inet_aton.return_value)
+
+        chan.close()
+        chan.reader.close.assert_called_once()
+
+    def test_channel_send_only_writer(self):
+        writer_mock = MagicMock()
+        reader_mock = MagicMock()
+        self.mock_socket.socket.side_effect = [writer_mock, reader_mock]
+
+        chan = Channel('224.1.1.1', 1234, 2048, '0.0.0.0', socket_mode='send-only')
+
+        self.assertIs(chan.writer, writer_mock)
+        writer_mock.bind.assert_not_called()
+        for call in writer_mock.setsockopt.call_args_list:
+            self.assertNotEqual(call.args[1], self.mock_socket.IP_ADD_MEMBERSHIP)
+        reader_mock.bind.assert_called_with(('0.0.0.0', 1234))
+
+    def test_channel_invalid_socket_mode(self):
+        with self.assertRaises(ValueError):
+            Channel('224.1.1.1', 1234, 2048, '0.0.0.0', socket_mode='triple')
+
     def test_channel_ctor_invalid_crypter_type(self):
         with self.assertRaises(ValueError):
             Channel('224.1.1.1', 1234, 2048, '0.0.0.0', MagicMock())
@@ -1,10 +1,24 @@
 import unittest
+import socket
+from unittest.mock import patch
 import random
 import string
+import time
+import queue
+import pickle
+import tempfile
 import multiprocessing
 from multiprocessing import Process
+from multisock import frame
 from multisock.channel import Channel
-from multisock.crypter import Crypter
+from multisock.crypter import Crypter, MODE_CHACHA20, MODE_GCM
+from multisock.bufferpool import BufferPool
+from multisock.compression import Compressor, train_dictionary
+from multisock.pacing import Pacer, DEFAULT_HORIZON
+from multisock.shared import shared_sockets
+from multisock.capture import Recorder, Replayer
+from multisock.serialization import SchemaCodec, register_codec, unregister_codec
+from multisock.exceptions import BufferPoolExhaustedException
 
 
 def get_random_string(length):
@@ -113,3 +127,875 @@ class Test_Channel_E2E(unittest.TestCase):
         self.assertTrue(results.qsize() >= 1)
         received_msg = results.get()
         self.assertTrue(received_msg == msg_to_send)
+
+    def test_recv_many(self):
+        crypto = Crypter('pwd', 'passphrase')
+        sender = Channel('224.1.1.1', 1235, 2048, '0.0.0.0', crypto)
+        receiver = Channel('224.1.1.1', 1235, 2048, '0.0.0.0', crypto)
+
+        msgs = [get_random_string(64) for i in range(10)]
+        for msg in msgs:
+            sender.send(msg)
+        received = receiver.recv_many(max_msgs=32, timeout=1)
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual([data for (data, addr) in received], msgs)
+
+    def test_recv_objects_many_without_recvmmsg(self):
+        sender = Channel('224.1.1.1', 1235, 2048, '0.0.0.0')
+        receiver = Channel('224.1.1.1', 1235, 2048, '0.0.0.0')
+
+        objs = [{'index': i} for i in range(10)]
+        for obj in objs:
+            sender.send_object(obj)
+        with patch('multisock.mmsg.HAVE_RECVMMSG', False):
+            first = receiver.recv_objects_many(max_msgs=4, timeout=1)
+            others = receiver.recv_objects_many(timeout=1)
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual([obj for (obj, addr) in first + others], objs)
+
+    def test_recv_many_skips_invalid_datagrams(self):
+        sender = Channel('224.1.1.1', 1257, 2048, '0.0.0.0', socket_mode='send-only', framed=True)
+        receiver = Channel('224.1.1.1', 1257, 2048, '0.0.0.0', socket_mode='single', framed=True)
+
+        # a fragment without its extension, in the middle of the batch
+        invalid = frame.HEADER.pack(frame.MAGIC, frame.VERSION, frame.CODEC_RAW, frame.FLAG_FRAGMENT, 0)
+        sender.send_objects_many(range(3))
+        sender.writer.sendto(invalid, ('224.1.1.1', 1257))
+        sender.send_objects_many(range(3, 6))
+        time.sleep(0.1)
+        received = receiver.recv_objects_many(64, timeout=5)
+        stats = receiver.stats()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual([obj for (obj, addr) in received], list(range(6)))
+        self.assertEqual(stats['invalid_frames'], 1)
+
+    def test_recv_many_timeout(self):
+        receiver = Channel('224.1.1.1', 1235, 2048, '0.0.0.0')
+        self.assertEqual(receiver.recv_many(timeout=0.01), [])
+        receiver.set_read_blocking(False)
+        self.assertEqual(receiver.recv_many(), [])
+        receiver.close()
+
+    def test_send_many(self):
+        crypto = Crypter('pwd', 'passphrase')
+        sender = Channel('224.1.1.1', 1236, 2048, '0.0.0.0', crypto)
+        receiver = Channel('224.1.1.1', 1236, 2048, '0.0.0.0', crypto)
+
+        msgs = [get_random_string(32) for i in range(20)]
+        sent = sender.send_many(msgs)
+        received = receiver.recv_many(max_msgs=64, timeout=1)
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(sent, 20)
+        self.assertEqual([data for (data, addr) in received], msgs)
+
+    def test_send_objects_many_fallbacks(self):
+        sender = Channel('224.1.1.1', 1236, 2048, '0.0.0.0')
+        receiver = Channel('224.1.1.1', 1236, 2048, '0.0.0.0')
+
+        objs = [{'index': i} for i in range(10)]
+        with patch('multisock.mmsg.HAVE_SENDMMSG', False):
+            sent = sender.send_objects_many(objs)
+        sender._gso = False
+        sent += sender.send_objects_many(objs)
+        received = receiver.recv_objects_many(max_msgs=64, timeout=1)
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(sent, 20)
+        self.assertEqual([obj for (obj, addr) in received], objs + objs)
+
+    def test_recv_into(self):
+        crypto = Crypter('pwd', 'passphrase')
+        sender = Channel('224.1.1.1', 1237, 2048, '0.0.0.0', crypto)
+        receiver = Channel('224.1.1.1', 1237, 2048, '0.0.0.0', crypto)
+
+        buffer = bytearray(2048)
+        sender.send('Hello World')
+        (nbytes, addr) = receiver.recv_into(buffer)
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(buffer[:nbytes], b'Hello World')
+
+    def test_recv_view(self):
+        sender = Channel('224.1.1.1', 1237, 2048, '0.0.0.0')
+        receiver = Channel('224.1.1.1', 1237, 2048, '0.0.0.0', buffer_pool=BufferPool(2048, 2))
+
+        sender.send(b'first')
+        sender.send(b'second')
+        sender.send(b'third')
+        (first, addr) = receiver.recv_view()
+        (second, addr) = receiver.recv_view()
+        with self.assertRaises(BufferPoolExhaustedException):
+            receiver.recv_view()
+        self.assertEqual(first.view, b'first')
+        first.release()
+        (third, addr) = receiver.recv_view()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(second.view, b'second')
+        self.assertEqual(third.view, b'third')
+
+    def test_buffer_pool_smaller_than_bufsize(self):
+        with self.assertRaises(ValueError):
+            Channel('224.1.1.1', 1237, 2048, '0.0.0.0', buffer_pool=BufferPool(1024, 2))
+
+    def test_framed_exchange(self):
+        crypto = Crypter('pwd', 'passphrase')
+        sender = Channel('224.1.1.1', 1238, 2048, '0.0.0.0', crypto, framed=True)
+        receiver = Channel('224.1.1.1', 1238, 2048, '0.0.0.0', crypto)
+
+        sender.send('Hello World')
+        sender.send(b'\x00\x01\x02')
+        sender.send_object({'str': 'Hello world', 'bool': True})
+        (text, addr) = receiver.recv()
+        (data, addr) = receiver.recv()
+        (obj, addr) = receiver.recv_object()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(text, 'Hello World')
+        self.assertEqual(data, b'\x00\x01\x02')
+        self.assertEqual(obj, {'str': 'Hello world', 'bool': True})
+
+    def test_framed_and_legacy_senders_on_same_group(self):
+        crypto = Crypter('pwd', 'passphrase')
+        framed = Channel('224.1.1.1', 1238, 2048, '0.0.0.0', crypto, framed=True)
+        legacy = Channel('224.1.1.1', 1238, 2048, '0.0.0.0', crypto)
+        receiver = Channel('224.1.1.1', 1238, 2048, '0.0.0.0', crypto)
+
+        framed.send_object({'from': 'framed'})
+        legacy.send_object({'from': 'legacy'})
+        received = receiver.recv_objects_many(timeout=1)
+
+        framed.close()
+        legacy.close()
+        receiver.close()
+
+        self.assertEqual([obj for (obj, addr) in received], [{'from': 'framed'}, {'from': 'legacy'}])
+
+    def test_legacy_data_starting_with_magic(self):
+        sender = Channel('224.1.1.1', 1256, 2048, '0.0.0.0', socket_mode='send-only')
+        receiver = Channel('224.1.1.1', 1256, 2048, '0.0.0.0', socket_mode='single')
+        receiver.reader.settimeout(5)
+
+        # not a valid frame header: delivered as legacy data by the channels not framed
+        legacy = b'\xd5\x4d' + b'legacy data'
+        sender.send(legacy)
+        (data, addr) = receiver.recv()
+        sender.send(legacy)
+        buffer = bytearray(2048)
+        (nbytes, addr) = receiver.recv_into(buffer)
+        sender.send(legacy)
+        messages = receiver.recv_many(10, timeout=5)
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(data, legacy)
+        self.assertEqual(bytes(buffer[:nbytes]), legacy)
+        self.assertEqual([message for (message, addr) in messages], [legacy])
+
+    def test_framed_recv_into(self):
+        for crypto in (None, Crypter('pwd', 'passphrase')):
+            sender = Channel('224.1.1.1', 1238, 2048, '0.0.0.0', crypto, framed=True)
+            receiver = Channel('224.1.1.1', 1238, 2048, '0.0.0.0', crypto)
+
+            sender.send(b'Hello World')
+            (payload, addr) = receiver.recv_view()
+            with payload as view:
+                self.assertEqual(view, b'Hello World')
+
+            sender.close()
+            receiver.close()
+
+    def test_mixed_codecs_on_same_group(self):
+        schema = register_codec(SchemaCodec(120, 'e2e_reading', [('id', 'I'), ('value', 'f')]))
+        crypto = Crypter('pwd', 'passphrase')
+        json_sender = Channel('224.1.1.1', 1239, 2048, '0.0.0.0', crypto, codec='json')
+        legacy_sender = Channel('224.1.1.1', 1239, 2048, '0.0.0.0', crypto)
+        receiver = Channel('224.1.1.1', 1239, 2048, '0.0.0.0', crypto)
+
+        json_sender.send_object({'from': 'json'})
+        json_sender.send_object({'id': 1, 'value': 0.5}, codec='e2e_reading')
+        legacy_sender.send_object({'from': 'legacy'})
+        legacy_sender.send_object({'from': 'marshal'}, codec='marshal')
+        received = receiver.recv_objects_many(timeout=1)
+
+        json_sender.close()
+        legacy_sender.close()
+        receiver.close()
+        unregister_codec(schema)
+
+        self.assertTrue(json_sender.framed)
+        self.assertFalse(legacy_sender.framed)
+        self.assertEqual([obj for (obj, addr) in received],
+                         [{'from': 'json'}, {'id': 1, 'value': 0.5}, {'from': 'legacy'}, {'from': 'marshal'}])
+
+    def test_fragmented_exchange(self):
+        crypto = Crypter('pwd', 'passphrase')
+        sender = Channel('224.1.1.1', 1245, 2048, '0.0.0.0', crypto, mtu=1200)
+        receiver = Channel('224.1.1.1', 1245, 2048, '0.0.0.0', crypto)
+
+        firmware = bytes(random.getrandbits(8) for _ in range(100000))
+        config = {'blob': get_random_string(5000)}
+        sender.send(firmware)
+        sender.send_object(config)
+        sender.send('small')
+        (data, addr) = receiver.recv()
+        (obj, addr) = receiver.recv_object()
+        received = receiver.recv_many(timeout=1)
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(data, firmware)
+        self.assertEqual(obj, config)
+        self.assertEqual([data for (data, addr) in received], ['small'])
+
+    def test_fragmented_recv_into(self):
+        sender = Channel('224.1.1.1', 1245, 2048, '0.0.0.0', mtu=512)
+        receiver = Channel('224.1.1.1', 1245, 2048, '0.0.0.0')
+
+        message = bytes(random.getrandbits(8) for _ in range(3000))
+        buffer = bytearray(4096)
+        sender.send(message)
+        (nbytes, addr) = receiver.recv_into(buffer)
+        sender.send(message)
+        with self.assertRaises(ValueError):
+            receiver.recv_into(bytearray(2048))
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(buffer[:nbytes], message)
+
+    def test_aead_exchange_discards_foreign_messages(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        sender = Channel('224.1.1.1', 1246, 2048, '0.0.0.0', crypto)
+        intruder = Channel('224.1.1.1', 1246, 2048, '0.0.0.0', Crypter('other', 'passphrase', mode=MODE_CHACHA20))
+        receiver = Channel('224.1.1.1', 1246, 2048, '0.0.0.0', Crypter('pwd', 'passphrase', mode=MODE_CHACHA20))
+
+        intruder.send_object({'command': 'all lights on'})
+        sender.send_object({'command': 'all lights off'})
+        intruder.send('forged')
+        sender.send('Hello World')
+        (obj, addr) = receiver.recv_object()
+        received = receiver.recv_many(timeout=1)
+
+        sender.close()
+        intruder.close()
+        receiver.close()
+
+        self.assertTrue(sender.framed)
+        self.assertEqual(obj, {'command': 'all lights off'})
+        self.assertEqual([data for (data, addr) in received], ['Hello World'])
+
+    def test_topic_subscriptions(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        sender = Channel('224.1.1.1', 1247, 2048, '0.0.0.0', crypto)
+        receiver = Channel('224.1.1.1', 1247, 2048, '0.0.0.0', crypto)
+        kitchen = []
+        receiver.subscribe('/lights/kitchen', lambda obj, addr, topic: kitchen.append(obj))
+        receiver.subscribe('/lights/#', lambda obj, addr, topic: kitchen.append(topic))
+        receiver.subscribe('/doors/+')
+
+        sender.send('untagged')
+        sender.send_object({'on': True}, topic='/lights/kitchen')
+        sender.send_object({'on': False}, topic='/heating/kitchen')
+        sender.send_object({'open': True}, topic='/doors/front')
+        sender.send_objects_many([1, 2], topic='/lights/garage')
+        dispatched = receiver.dispatch(timeout=1)
+
+        sender.send('skipped', topic='/heating')
+        sender.send('opened', topic='/doors/back')
+        (data, addr) = receiver.recv()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(dispatched, 4)
+        self.assertEqual(kitchen, ['/lights/kitchen', {'on': True}, '/lights/garage', '/lights/garage'])
+        self.assertEqual(data, 'opened')
+
+    def test_topic_filter_before_decryption(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        sender = Channel('224.1.1.1', 1268, 2048, '0.0.0.0', crypto, socket_mode='send-only', sequenced=True)
+        receiver = Channel('224.1.1.1', 1268, 2048, '0.0.0.0', crypto, socket_mode='single', sequenced=True)
+        receiver.reader.settimeout(5)
+        receiver.subscribe('/doors/+')
+        data = frame.encode(frame.CODEC_PICKLE, pickle.dumps('heating'), crypto, topic='/heating',
+                            sequence=(0x4321, 0))
+
+        # a tampered message of another topic: discarded without decrypting it
+        sender.send_raw([data[:-1] + bytes([data[-1] ^ 1])])
+        sender.send_object('opened', topic='/doors/back')
+        (obj, addr) = receiver.recv_object()
+        stats = receiver.stats()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(obj, 'opened')
+        self.assertEqual(stats['filtered'], 1)
+        self.assertEqual(stats['decrypt_errors'], 0)
+
+    def test_socket_modes(self):
+        single = Channel('224.1.1.1', 1249, 2048, '0.0.0.0', socket_mode='single')
+        sender = Channel('224.1.1.1', 1249, 2048, '0.0.0.0', socket_mode='send-only', multicast_ttl=1)
+        no_loop = Channel('224.1.1.1', 1249, 2048, '0.0.0.0', socket_mode='single', multicast_loop=False)
+
+        sender.send(b'from send-only')
+        (data, addr) = single.recv()
+        single.send(b'from single')
+        received = single.recv_many(timeout=1)
+        no_loop.send(b'not looped')
+        looped = single.recv_many(timeout=0.2)
+
+        sender.close()
+        single.close()
+        no_loop.close()
+
+        self.assertEqual(data, b'from send-only')
+        self.assertNotEqual(addr[1], 1249)
+        self.assertEqual([data for (data, addr) in received], [b'from single'])
+        self.assertEqual(looped, [])
+
+    def test_stats(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        sender = Channel('224.1.1.1', 1271, 2048, '0.0.0.0', crypto, socket_mode='send-only', sequenced=True)
+        intruder = Channel('224.1.1.1', 1271, 2048, '0.0.0.0', Crypter('other', 'passphrase', mode=MODE_CHACHA20),
+                           socket_mode='send-only')
+        receiver = Channel('224.1.1.1', 1271, 2048, '0.0.0.0', crypto, socket_mode='single')
+        reports = []
+        receiver.set_stats_hook(reports.append, interval=0)
+
+        sender.send_object({'on': True})
+        intruder.send('forged')
+        # a message lost on the way
+        sender._next_sequence()
+        sender.send_objects_many([1, 2])
+        received = receiver.recv_objects_many(timeout=1)
+        stats = receiver.stats()
+
+        sender.close()
+        intruder.close()
+        receiver.close()
+
+        self.assertEqual(len(received), 3)
+        self.assertEqual(sender.stats()['messages_sent'], 3)
+        self.assertEqual(sender.stats()['datagrams_sent'], 3)
+        self.assertEqual(stats['datagrams_received'], 4)
+        self.assertEqual(stats['messages_received'], 4)
+        self.assertEqual(stats['decrypt_errors'], 1)
+        self.assertEqual(stats['sequence_gaps'], 1)
+        self.assertEqual(stats['lost'], 1)
+        self.assertGreater(stats['bytes_received'], 0)
+        self.assertEqual(len(reports), 4)
+
+    def test_stats_kernel_drops(self):
+        sender = Channel('224.1.1.1', 1272, 2048, '0.0.0.0', socket_mode='send-only')
+        receiver = Channel('224.1.1.1', 1272, 2048, '0.0.0.0', socket_mode='single')
+        if not receiver._drop_counter:
+            sender.close()
+            receiver.close()
+            self.skipTest('SO_RXQ_OVFL not available')
+        receiver.reader.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024)
+
+        sender.send_many([b'x' * 100] * 200)
+        queued = len(receiver.recv_many(256, timeout=1))
+        sender.send(b'last')
+        (data, addr) = receiver.recv()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(data, b'last')
+        self.assertEqual(receiver.stats()['kernel_drops'], 200 - queued)
+
+    def test_stats_kernel_drops_with_timestamps(self):
+        sender = Channel('224.1.1.1', 1260, 2048, '0.0.0.0', socket_mode='send-only')
+        receiver = Channel('224.1.1.1', 1260, 2048, '0.0.0.0', socket_mode='single')
+        if not receiver._drop_counter:
+            sender.close()
+            receiver.close()
+            self.skipTest('SO_RXQ_OVFL not available')
+        receiver.reader.settimeout(5)
+        receiver.reader.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024)
+        # enables the kernel timestamps
+        sender.send(b'first')
+        receiver.recv_with_meta()
+
+        buffer = bytearray(2048)
+        receive = [lambda: receiver.recv()[0], lambda: bytes(buffer[:receiver.recv_into(buffer)[0]]),
+                   lambda: receiver.recv_many(1, timeout=5)[0][0]]
+        dropped = 0
+        for recv in receive:
+            sender.send_many([b'x' * 100] * 200)
+            dropped += 200 - len(receiver.recv_many(256, timeout=1))
+            sender.send(b'last')
+            self.assertEqual(recv(), b'last')
+            self.assertEqual(receiver.stats()['kernel_drops'], dropped)
+
+        sender.close()
+        receiver.close()
+
+    def test_recv_with_meta(self):
+        sender = Channel('224.1.1.1', 1273, 2048, '0.0.0.0', socket_mode='send-only', timestamped=True)
+        legacy = Channel('224.1.1.1', 1273, 2048, '0.0.0.0', socket_mode='send-only')
+        receiver = Channel('224.1.1.1', 1273, 2048, '0.0.0.0', socket_mode='single')
+
+        sender.send_object({'on': True}, topic='/lights')
+        (obj, addr, meta) = receiver.recv_object_with_meta()
+        legacy.send(b'Hello World')
+        (data, legacy_addr, legacy_meta) = receiver.recv_with_meta()
+        sender.send(b'counted')
+        receiver.recv()
+        latency = receiver.stats()['latency']
+
+        sender.close()
+        legacy.close()
+        receiver.close()
+
+        self.assertEqual(obj, {'on': True})
+        self.assertEqual(meta.topic, '/lights')
+        self.assertLessEqual(meta.sent_ns, meta.received_ns)
+        self.assertLessEqual(meta.received_ns, meta.decoded_ns)
+        if receiver._kernel_timestamps:
+            self.assertGreaterEqual(meta.network_latency, 0)
+            self.assertGreaterEqual(meta.queue_latency, 0)
+        self.assertEqual(data, b'Hello World')
+        self.assertIsNone(legacy_meta.sent_ns)
+        self.assertEqual(list(latency), [addr])
+        self.assertEqual(latency[addr]['count'], 2)
+
+    def test_coalescing(self):
+        for crypto in (None, Crypter('pwd', 'passphrase'), Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)):
+            sender = Channel('224.1.1.1', 1274, 2048, '0.0.0.0', crypto, socket_mode='send-only', sequenced=True,
+                             coalesce=60)
+            receiver = Channel('224.1.1.1', 1274, 2048, '0.0.0.0', crypto, socket_mode='single')
+            receiver.reader.settimeout(5)
+
+            for i in range(100):
+                sender.send_object({'light': i})
+            sender.send_many([b'on', b'off'])
+            sender.send(b'flushed')
+            sender.flush()
+            received = [receiver.recv_object()[0] for _ in range(30)]
+            received += [obj for (obj, addr) in receiver.recv_objects_many(40)]
+            while len(received) < 100:
+                received.append(receiver.recv_object_with_meta()[0])
+            buffer = bytearray(2048)
+            (nbytes, addr) = receiver.recv_into(buffer)
+            data = [bytes(buffer[:nbytes])]
+            data += [receiver.recv()[0] for _ in range(2)]
+            sent = sender.stats()
+            stats = receiver.stats()
+
+            sender.close()
+            receiver.close()
+
+            self.assertEqual(received, [{'light': i} for i in range(100)])
+            self.assertEqual(data, [b'on', b'off', b'flushed'])
+            self.assertEqual(sent['messages_sent'], 103)
+            self.assertLess(sent['datagrams_sent'], 10)
+            self.assertEqual(stats['messages_received'], 103)
+            self.assertEqual(stats['datagrams_received'], sent['datagrams_sent'])
+            self.assertEqual(stats['lost'], 0)
+
+    def test_coalescing_max_msgs(self):
+        sender = Channel('224.1.1.1', 1259, 2048, '0.0.0.0', socket_mode='send-only', coalesce=60)
+        receiver = Channel('224.1.1.1', 1259, 2048, '0.0.0.0', socket_mode='single')
+
+        sender.send_objects_many(range(20))
+        sender.flush()
+        # the messages of the batch beyond max_msgs wait for the next calls
+        received = [receiver.recv_objects_many(1, timeout=5)]
+        received.append(receiver.recv_objects_many(5, timeout=5))
+        received.append(receiver.recv_objects_many(64, timeout=5))
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual([[obj for (obj, addr) in batch] for batch in received],
+                         [[0], list(range(1, 6)), list(range(6, 20))])
+
+    def test_coalescing_deadline(self):
+        sender = Channel('224.1.1.1', 1275, 2048, '0.0.0.0', Crypter('pwd', 'passphrase'), socket_mode='send-only',
+                         coalesce=0.001)
+        receiver = Channel('224.1.1.1', 1275, 2048, '0.0.0.0', Crypter('pwd', 'passphrase'), socket_mode='single')
+        receiver.reader.settimeout(5)
+
+        sender.send_object('on', topic='/lights')
+        sender.send_object('off', topic='/lights')
+        first = receiver.recv_object()
+        second = receiver.recv_object()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual((first[0], second[0]), ('on', 'off'))
+
+    def test_compression(self):
+        readings = [{'device_id': 'sensor-%04d' % i, 'temperature': 20.5, 'status': 'ok'} for i in range(50)]
+        dictionary = train_dictionary(pickle.dumps(reading) for reading in readings)
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        sender = Channel('224.1.1.1', 1276, 2048, '0.0.0.0', crypto, socket_mode='send-only',
+                         compressor=Compressor(threshold=32, dictionary=dictionary))
+        batched = Channel('224.1.1.1', 1276, 2048, '0.0.0.0', crypto, socket_mode='send-only', coalesce=60,
+                          compressor=Compressor(threshold=32))
+        receiver = Channel('224.1.1.1', 1276, 2048, '0.0.0.0', crypto, socket_mode='single')
+        receiver.reader.settimeout(5)
+
+        sender.send_object(readings[0])
+        sender.send(b'x' * 500)
+        batched.send_objects_many(readings)
+        batched.flush()
+        first = receiver.recv_object()[0]
+        buffer = bytearray(2048)
+        (nbytes, addr) = receiver.recv_into(buffer)
+        received = [receiver.recv_object()[0] for _ in readings]
+        sent = sender.stats()['bytes_sent'] + batched.stats()['bytes_sent']
+
+        sender.close()
+        batched.close()
+        receiver.close()
+
+        self.assertEqual(first, readings[0])
+        self.assertEqual(bytes(buffer[:nbytes]), b'x' * 500)
+        self.assertEqual(received, readings)
+        self.assertLess(sent, sum(len(pickle.dumps(reading)) for reading in readings))
+
+    def test_fec(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        sender = Channel('224.1.1.1', 1278, 2048, '0.0.0.0', crypto, socket_mode='send-only', fec=(4, 2), mtu=600)
+        receiver = Channel('224.1.1.1', 1278, 2048, '0.0.0.0', crypto, socket_mode='single')
+        receiver.reader.settimeout(5)
+
+        firmware = bytes(random.getrandbits(8) for _ in range(2000))
+        sender.send(firmware)
+        sender.send_objects_many(range(10))
+        sender.send(b'flushed')
+        sender.flush()
+        (data, addr) = receiver.recv()
+        received = [receiver.recv_object()[0] for _ in range(10)]
+        flushed = receiver.recv()[0]
+        sent = sender.stats()
+
+        # lost datagrams: two data ones of the first group, one of the second
+        messages = [sender._encode_object(i) for i in range(8)]
+        datagrams = sender._protect(messages, close=True)
+        sender._send_batch([datagram for (i, datagram) in enumerate(datagrams) if i not in (1, 2, 8)])
+        buffer = bytearray(2048)
+        (nbytes, addr) = receiver.recv_into(buffer)
+        recovered = [pickle.loads(buffer[:nbytes])]
+        recovered += [receiver.recv_object()[0] for _ in range(7)]
+        stats = receiver.stats()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(data, firmware)
+        self.assertEqual(received, list(range(10)))
+        self.assertEqual(flushed, b'flushed')
+        self.assertGreater(sent['fec_parity_sent'], 0)
+        self.assertGreater(sent['fec_overhead_bytes'], 0)
+        self.assertEqual(sorted(recovered), list(range(8)))
+        self.assertEqual(stats['fec_recovered'], 3)
+        self.assertEqual(stats['fec_unrecoverable'], 0)
+
+    def test_fec_recv_into(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_GCM)
+        sender = Channel('224.1.1.1', 1255, 2048, '0.0.0.0', crypto, socket_mode='send-only', fec=(4, 2))
+        receiver = Channel('224.1.1.1', 1255, 2048, '0.0.0.0', crypto, socket_mode='single')
+        receiver.reader.settimeout(5)
+
+        # two datagrams lost: recovered at once, the second one queued in the backlog
+        messages = [sender._encode(b'message %d' % i) for i in range(4)]
+        datagrams = sender._protect(messages, close=True)
+        sender._send_batch(datagrams[2:])
+        buffer = bytearray(2048)
+        received = []
+        for _ in range(4):
+            (nbytes, addr) = receiver.recv_into(buffer)
+            received.append(bytes(buffer[:nbytes]))
+        stats = receiver.stats()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(sorted(received), [b'message %d' % i for i in range(4)])
+        self.assertEqual(stats['fec_recovered'], 2)
+        self.assertEqual(stats['decrypt_errors'], 0)
+
+    def test_reliable(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        sender = Channel('224.1.1.1', 1279, 2048, '0.0.0.0', crypto, socket_mode='send-only', mtu=1200,
+                         reliable=True)
+        receivers = [Channel('224.1.1.1', 1279, 2048, '0.0.0.0', crypto, socket_mode='single', reliable=True)
+                     for _ in range(2)]
+        for receiver in receivers:
+            receiver.reader.settimeout(5)
+
+        messages = [{'id': i, 'blob': get_random_string(3000 if i == 10 else 10)} for i in range(20)]
+        for (i, message) in enumerate(messages):
+            data = sender._encode_object(message)
+            # tampered on the way: neither delivered nor taken for received
+            if i in (3, 5):
+                sender._transmit(data[:-1] + bytes([data[-1] ^ 1]))
+            # lost on the way
+            if i not in (3, 4, 10):
+                sender._transmit(data)
+        received = [[receiver.recv_object()[0] for _ in messages] for receiver in receivers]
+        late = [receiver.recv_many(timeout=0.3) for receiver in receivers]
+        sent = sender.stats()
+        stats = [receiver.stats() for receiver in receivers]
+
+        sender.close()
+        for receiver in receivers:
+            receiver.close()
+
+        for (objects, stat) in zip(received, stats):
+            self.assertEqual(sorted(objects, key=lambda obj: obj['id']), messages)
+            self.assertEqual(stat['nack_repaired'], 3)
+            self.assertEqual(stat['nack_unrecovered'], 0)
+            self.assertEqual(stat['decrypt_errors'], 2)
+        self.assertEqual(late, [[], []])
+        self.assertGreaterEqual(sent['nack_retransmitted'], 3)
+        # 17 messages and 2 tampered copies
+        self.assertEqual(sent['messages_sent'], 19)
+
+    def test_reliable_tail(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        sender = Channel('224.1.1.1', 1270, 2048, '0.0.0.0', crypto, socket_mode='send-only', reliable=True)
+        receiver = Channel('224.1.1.1', 1270, 2048, '0.0.0.0', crypto, socket_mode='single', reliable=True)
+        receiver.reader.settimeout(5)
+
+        def burst(first):
+            for i in range(first, first + 5):
+                data = sender._encode_object(i)
+                # the tail is lost on the way
+                if i < first + 3:
+                    sender._transmit(data)
+
+        burst(0)
+        # announced by flush
+        sender.flush()
+        received = [receiver.recv_object()[0] for _ in range(5)]
+        # announced once the sender is idle
+        burst(5)
+        received += [receiver.recv_object()[0] for _ in range(5)]
+        stats = receiver.stats()
+        sent = sender.stats()
+
+        sender.close()
+        receiver.close()
+
+        # the repairs arrive in any order
+        self.assertEqual(sorted(received), list(range(10)))
+        self.assertEqual(stats['nack_repaired'], 4)
+        self.assertGreaterEqual(sent['nack_announcements'], 2)
+
+    def test_dedup(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        # redundant hubs relaying the same stream
+        hubs = [Channel('224.1.1.1', 1262, 2048, '0.0.0.0', crypto, socket_mode='send-only', dedup=True,
+                        origin=0x1234) for _ in range(2)]
+        receiver = Channel('224.1.1.1', 1262, 2048, '0.0.0.0', crypto, socket_mode='single', dedup=True)
+        plain = Channel('224.1.1.1', 1262, 2048, '0.0.0.0', crypto, socket_mode='single')
+        receiver.reader.settimeout(5)
+        plain.reader.settimeout(5)
+
+        def tampered(obj, sequence):
+            data = frame.encode(frame.CODEC_PICKLE, pickle.dumps(obj), crypto, sequence=(0x1234, sequence))
+            return data[:-1] + bytes([data[-1] ^ 1])
+
+        for i in range(10):
+            for hub in hubs:
+                hub.send_object(i)
+        # a tampered copy of a message received: dropped before the decryption
+        hubs[0].send_raw([tampered(9, 9)])
+        # a tampered copy first: the original is still delivered
+        hubs[0].send_raw([tampered('tampered first', 10)])
+        for obj in ('tampered first', 'last'):
+            for hub in hubs:
+                hub.send_object(obj)
+        received = [receiver.recv_object()[0] for _ in range(12)]
+        copies = [plain.recv_object()[0] for _ in range(24)]
+        stats = receiver.stats()
+
+        for hub in hubs:
+            hub.close()
+        receiver.close()
+        plain.close()
+
+        self.assertEqual(received, list(range(10)) + ['tampered first', 'last'])
+        self.assertEqual(copies[:4], [0, 0, 1, 1])
+        # the copy of 'last' is not read yet
+        self.assertEqual(stats['dedup_dropped'], 12)
+        self.assertEqual(stats['dedup_origins'], 1)
+        self.assertEqual(stats['decrypt_errors'], 1)
+        self.assertEqual(stats['sequence_duplicates'], 0)
+        with self.assertRaises(ValueError):
+            Channel('224.1.1.1', 1262, 2048, '0.0.0.0', origin=1 << 32)
+
+    def test_pacing(self):
+        for mode in ('auto', 'sleep'):
+            sender = Channel('224.1.1.1', 1263, 2048, '0.0.0.0', socket_mode='send-only', mtu=512,
+                             pacer=Pacer(bytes_per_sec=500000, packets_per_sec=1000, burst_packets=4, mode=mode))
+            receiver = Channel('224.1.1.1', 1263, 2048, '0.0.0.0', socket_mode='single')
+            receiver.reader.settimeout(5)
+
+            begin = time.monotonic()
+            sender.send_many([b'on', b'off'] * 10)
+            # fragmented: 4 datagrams
+            sender.send(bytes(1500))
+            received = [receiver.recv()[0] for _ in range(21)]
+            elapsed = time.monotonic() - begin
+            stats = sender.stats()
+
+            sender.close()
+            receiver.close()
+
+            self.assertEqual(received, [b'on', b'off'] * 10 + [bytes(1500)])
+            # 20 datagrams after the burst: the kernel modes queue a horizon ahead
+            self.assertGreaterEqual(elapsed, 0.019 - (DEFAULT_HORIZON if mode == 'auto' else 0))
+            self.assertEqual(stats['datagrams_sent'], 24)
+            self.assertGreater(stats['pacing_delayed'], 0)
+
+    def test_background(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        sender = Channel('224.1.1.1', 1264, 2048, '0.0.0.0', crypto, socket_mode='send-only', timestamped=True)
+        receiver = Channel('224.1.1.1', 1264, 2048, '0.0.0.0', crypto, socket_mode='single', background=True,
+                           rcvbuf=1 << 20)
+        receiver.reader.settimeout(5)
+
+        # the application is busy: the reader thread drains the socket meanwhile
+        sender.send_objects_many(range(200))
+        time.sleep(0.2)
+        pending = receiver.stats()['ring_pending']
+        received = [receiver.recv_object()[0] for _ in range(50)]
+        received += [obj for (obj, addr) in receiver.recv_objects_many(50)]
+        (obj, addr, meta) = receiver.recv_object_with_meta()
+        received.append(obj)
+        buffer = bytearray(2048)
+        (nbytes, addr) = receiver.recv_into(buffer)
+        received.append(pickle.loads(buffer[:nbytes]))
+        while True:
+            try:
+                received.append(receiver.get_object_nowait()[0])
+            except queue.Empty:
+                break
+        receiver.reader.settimeout(0.05)
+        with self.assertRaises(socket.timeout):
+            receiver.recv()
+        stats = receiver.stats()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(pending, 200)
+        self.assertEqual(received, list(range(200)))
+        # received by the reader thread, decoded after the pause
+        self.assertGreater(meta.decode_latency, 100000000)
+        self.assertEqual(stats['ring_high_water'], 200)
+        self.assertEqual(stats['ring_overflows'], 0)
+        with self.assertRaises(ValueError):
+            sender.get_nowait()
+
+    def test_shared(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        sender = Channel('224.1.1.1', 1266, 2048, '0.0.0.0', crypto, socket_mode='send-only')
+        receivers = [Channel('224.1.1.1', 1266, 2048, '0.0.0.0', crypto, shared=True) for _ in range(3)]
+        for receiver in receivers:
+            receiver.reader.settimeout(5)
+        sockets = shared_sockets()[('224.1.1.1', 1266, '0.0.0.0')]
+
+        sender.send_objects_many(range(100))
+        received = [[receiver.recv_object()[0] for _ in range(100)] for receiver in receivers]
+        # shared channels send as any other channel
+        receivers[0].send_object('reply')
+        replies = [receiver.recv_object()[0] for receiver in receivers]
+        receivers[1].reader.settimeout(0.05)
+        with self.assertRaises(socket.timeout):
+            receivers[1].recv()
+        # the others keep their own timeout
+        self.assertEqual(receivers[2].reader.gettimeout(), 5)
+
+        sender.close()
+        receivers[0].close()
+        receivers[1].close()
+        remaining = shared_sockets()[('224.1.1.1', 1266, '0.0.0.0')]
+        receivers[2].close()
+
+        self.assertEqual(sockets, 3)
+        self.assertEqual(received, [list(range(100))] * 3)
+        self.assertEqual(replies, ['reply'] * 3)
+        self.assertEqual(remaining, 1)
+        self.assertNotIn(('224.1.1.1', 1266, '0.0.0.0'), shared_sockets())
+
+    def test_capture(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        with tempfile.TemporaryDirectory() as directory:
+            sender = Channel('224.1.1.1', 1267, 2048, '0.0.0.0', crypto, socket_mode='send-only', mtu=512)
+            receiver = Channel('224.1.1.1', 1267, 2048, '0.0.0.0', crypto)
+            receiver.reader.settimeout(5)
+            recorder = Recorder(directory)
+            receiver.set_recorder(recorder)
+
+            sender.send_object('x' * 1200)
+            sender.send_objects_many(range(10))
+            recorded = [receiver.recv_object()[0] for _ in range(11)]
+            sender.send('raw')
+            buffer = bytearray(2048)
+            (nbytes, addr) = receiver.recv_into(buffer)
+            recorded.append(bytes(buffer[:nbytes]))
+            receiver.set_recorder(None)
+            recorder.close()
+
+            # the datagrams go out again as they were: a receiver without the
+            # recording decrypts and reassembles them
+            replayed = Replayer(sender, speed=None).replay(directory)
+            received = [receiver.recv_object()[0] for _ in range(11)] + [receiver.recv()[0]]
+
+            sender.close()
+            receiver.close()
+
+        self.assertEqual(recorded, ['x' * 1200] + list(range(10)) + [b'raw'])
+        # 3 fragments, 10 messages and the raw one
+        self.assertEqual((recorder.recorded, replayed), (14, 14))
+        self.assertEqual(received, ['x' * 1200] + list(range(10)) + ['raw'])
+
+    def test_background_overflow(self):
+        for (overflow, expected) in (('drop-oldest', list(range(92, 100))), ('drop-newest', list(range(8)))):
+            sender = Channel('224.1.1.1', 1264, 2048, '0.0.0.0', socket_mode='send-only')
+            receiver = Channel('224.1.1.1', 1264, 2048, '0.0.0.0', socket_mode='single', background=True,
+                               ring_size=8, overflow=overflow)
+
+            sender.send_objects_many(range(100))
+            time.sleep(0.2)
+            received = [obj for (obj, addr) in receiver.recv_objects_many(100, timeout=1)]
+            stats = receiver.stats()
+
+            sender.close()
+            receiver.close()
+
+            self.assertEqual(received, expected)
+            self.assertEqual(stats['ring_overflows'], 92)
@@ -0,0 +1,67 @@
+import threading
+import time
+import unittest
+from multisock.coalesce import Coalescer
+
+
+class Test_Coalescer(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = []
+        self.flushed = threading.Event()
+
+    def flush(self, messages, dest):
+        self.batches.append((list(messages), dest))
+        self.flushed.set()
+
+    def test_flush_on_capacity(self):
+        coalescer = Coalescer(self.flush, 10, delay=60)
+        coalescer.add(b'1234')
+        coalescer.add(b'5678')
+        self.assertEqual(len(coalescer), 2)
+        self.assertEqual(self.batches, [])
+        # does not fit: the queued messages leave first
+        coalescer.add(b'abcd')
+        self.assertEqual(self.batches, [([b'1234', b'5678'], None)])
+        # fills the batch exactly
+        coalescer.add(b'efghij')
+        self.assertEqual(self.batches[1], ([b'abcd', b'efghij'], None))
+        # larger than a batch: sent alone
+        coalescer.add(b'x' * 20)
+        self.assertEqual(self.batches[2], ([b'x' * 20], None))
+        self.assertEqual(coalescer.batches, 3)
+        coalescer.close()
+
+    def test_flush_on_deadline(self):
+        coalescer = Coalescer(self.flush, 1000, delay=0.01)
+        start = time.monotonic()
+        coalescer.add(b'on')
+        coalescer.add(b'off')
+        self.assertTrue(self.flushed.wait(5))
+        self.assertGreaterEqual(time.monotonic() - start, 0.01)
+        self.assertEqual(self.batches, [([b'on', b'off'], None)])
+        self.assertEqual(len(coalescer), 0)
+        coalescer.close()
+
+    def test_destinations(self):
+        coalescer = Coalescer(self.flush, 1000, delay=60)
+        coalescer.add(b'a', ('239.1.1.1', 1234))
+        coalescer.add(b'b', ('239.1.1.2', 1234))
+        coalescer.add(b'c', ('239.1.1.1', 1234))
+        coalescer.flush()
+        self.assertEqual(sorted(self.batches), [([b'a', b'c'], ('239.1.1.1', 1234)), ([b'b'], ('239.1.1.2', 1234))])
+        coalescer.close()
+
+    def test_close(self):
+        coalescer = Coalescer(self.flush, 1000, delay=60)
+        coalescer.add(b'on')
+        coalescer.close()
+        self.assertEqual(self.batches, [([b'on'], None)])
+        with self.assertRaises(ValueError):
+            coalescer.add(b'off')
+        with self.assertRaises(ValueError):
+            Coalescer(self.flush, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
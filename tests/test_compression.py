@@ -0,0 +1,64 @@
+import pickle
+import unittest
+import zlib
+from multisock import compression
+from multisock.compression import Compressor, train_dictionary, register_dictionary, decompress
+from multisock.exceptions import CompressionException
+
+
+def sample(i):
+    return pickle.dumps({'device_id': 'sensor-%04d' % (i * 7919 % 5000), 'temperature': 20 + i % 7,
+                         'status': ('ok', 'warning')[i % 2], 'firmware': '1.4.2', 'ts': 1700000000 + i})
+
+
+class Test_Compressor(unittest.TestCase):
+
+    def test_compress(self):
+        compressor = Compressor(threshold=64)
+        payload = b'temperature' * 20
+
+        data = compressor.compress(payload)
+        self.assertLess(len(data), len(payload))
+        self.assertEqual(decompress(data), payload)
+        # below the threshold
+        self.assertIsNone(compressor.compress(b'temperature'))
+        # not getting smaller
+        self.assertIsNone(Compressor(threshold=0).compress(bytes(range(200))))
+
+    def test_dictionary(self):
+        dictionary = train_dictionary(sample(i) for i in range(500))
+        self.assertLessEqual(len(dictionary), compression.DEFAULT_DICTIONARY_SIZE)
+        plain = Compressor(threshold=0)
+        primed = Compressor(threshold=0, dictionary=dictionary)
+        self.assertEqual(primed.dictionary_id, compression.dictionary_id(dictionary))
+        self.assertNotEqual(primed.dictionary_id, 0)
+
+        payload = sample(1000)
+        data = primed.compress(payload)
+        self.assertLess(len(data), len(plain.compress(payload) or payload) / 2)
+        self.assertEqual(decompress(data, primed.dictionary_id), payload)
+        compression.unregister_dictionary(primed.dictionary_id)
+        with self.assertRaises(CompressionException):
+            decompress(data, primed.dictionary_id)
+        self.assertEqual(register_dictionary(dictionary), primed.dictionary_id)
+
+    def test_train_without_repetitions(self):
+        with self.assertRaises(CompressionException):
+            train_dictionary([b'abcdefghij', b'klmnopqrst'])
+        with self.assertRaises(CompressionException):
+            train_dictionary([sample(1)], size=0)
+
+    def test_invalid_payloads(self):
+        data = Compressor(threshold=0).compress(b'temperature' * 20)
+        with self.assertRaises(CompressionException):
+            decompress(data[:-4])
+        with self.assertRaises(CompressionException):
+            decompress(b'\xff' * 16)
+        bomb = zlib.compressobj(9, zlib.DEFLATED, compression.WBITS)
+        bomb = bomb.compress(bytes(compression.MAX_DECOMPRESSED_SIZE + 1)) + bomb.flush()
+        with self.assertRaises(CompressionException):
+            decompress(bomb)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,10 @@
+import os
 import unittest
 from unittest.mock import patch
 import random
 import string
-from multisock.crypter import Crypter
-from multisock.exceptions import InvalidParameterException, InvalidKeyLenghtException, EncryptionInvalidParameterException
+from multisock.crypter import Crypter, AEAD_MODES, MODE_GCM, MODE_CHACHA20, NONCE_SIZE
+from multisock.exceptions import InvalidParameterException, InvalidKeyLenghtException, EncryptionInvalidParameterException, DecryptionException
 
 class SerializableObject():
     def __init__(self, token, payload={}):
@@ -145,3 +146,98 @@ class Test_Crypter(unittest.TestCase):
 
         # Compare objects after encryption/serialization
         self.assertTrue(pickle.dumps(obj) == pickle.dumps(decrypted_obj))
+
+    def test_encrypt_raw_and_decrypt_raw(self):
+        crypter = Crypter(key=get_random_string(24), iv='The IV')
+        for size in (0, 1, 15, 16, 17, 723, 1024):
+            initial_bytes = bytes(random.getrandbits(8) for _ in range(size))
+            encrypted = crypter.encrypt_raw(initial_bytes)
+            self.assertEqual(len(encrypted), crypter.sealed_size(size))
+            self.assertEqual(crypter.decrypt_raw(encrypted), initial_bytes)
+
+    def test_decrypt_raw_invalid_data(self):
+        crypter = Crypter(key=get_random_string(24), iv='The IV')
+        with self.assertRaises(InvalidParameterException):
+            crypter.decrypt_raw(None)
+        with self.assertRaises(DecryptionException):
+            crypter.decrypt_raw(b'not aligned')
+
+    def test_crypter_ctor_with_invalid_mode(self):
+        with self.assertRaises(InvalidParameterException):
+            Crypter(key='ValidKey', iv='ValidIV', mode='ecb')
+
+    def test_aead_encrypt_raw_and_decrypt_raw(self):
+        for mode in AEAD_MODES:
+            crypter = Crypter(key=get_random_string(24), iv='The IV', mode=mode)
+            self.assertTrue(crypter.aead)
+            for size in (0, 1, 15, 16, 17, 723, 1024):
+                initial_bytes = bytes(random.getrandbits(8) for _ in range(size))
+                encrypted = crypter.encrypt_raw(initial_bytes, b'header')
+                self.assertEqual(len(encrypted), crypter.sealed_size(size))
+                self.assertEqual(crypter.decrypt_raw(encrypted, b'header'), initial_bytes)
+
+    def test_aead_nonce_never_reused(self):
+        crypter = Crypter(key=' --- My Key --- ', iv='The IV', mode=MODE_GCM)
+        first = crypter.encrypt_raw(b'Hello World')
+        second = crypter.encrypt_raw(b'Hello World')
+        self.assertNotEqual(first[:NONCE_SIZE], second[:NONCE_SIZE])
+        self.assertNotEqual(first, second)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'fork not available')
+    def test_aead_nonce_not_reused_after_fork(self):
+        crypter = Crypter(key=' --- My Key --- ', iv='The IV', mode=MODE_GCM)
+        crypter.encrypt_raw(b'Hello World')
+        reader, writer = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(writer, crypter.encrypt_raw(b'Hello World')[:NONCE_SIZE])
+            os._exit(0)
+        os.close(writer)
+        child = os.read(reader, NONCE_SIZE)
+        os.close(reader)
+        os.waitpid(pid, 0)
+        self.assertEqual(len(child), NONCE_SIZE)
+        self.assertNotEqual(child, crypter.encrypt_raw(b'Hello World')[:NONCE_SIZE])
+
+    def test_aead_rejects_tampered_data(self):
+        for mode in AEAD_MODES:
+            crypter = Crypter(key=' --- My Key --- ', iv='The IV', mode=mode)
+            encrypted = bytearray(crypter.encrypt_raw(b'Hello World', b'header'))
+            with self.assertRaises(DecryptionException):
+                crypter.decrypt_raw(bytes(encrypted), b'HEADER')
+            encrypted[NONCE_SIZE] ^= 1
+            with self.assertRaises(DecryptionException):
+                crypter.decrypt_raw(bytes(encrypted), b'header')
+            with self.assertRaises(DecryptionException):
+                crypter.decrypt_raw(b'short')
+
+    def test_aead_rejects_other_keys(self):
+        crypter = Crypter(key=' --- My Key --- ', iv='The IV', mode=MODE_CHACHA20)
+        encrypted = crypter.encrypt_raw(b'Hello World')
+        for other in (Crypter(key=' --- No Key --- ', iv='The IV', mode=MODE_CHACHA20),
+                      Crypter(key=' --- My Key --- ', iv='Another IV', mode=MODE_CHACHA20),
+                      Crypter(key=' --- My Key --- ', iv='The IV', mode=MODE_GCM)):
+            with self.assertRaises(DecryptionException):
+                other.decrypt_raw(encrypted)
+        # same key and passphrase on another instance
+        self.assertEqual(Crypter(key=' --- My Key --- ', iv='The IV', mode=MODE_CHACHA20).decrypt_raw(encrypted), b'Hello World')
+
+    def test_aead_legacy_encrypt_and_decrypt(self):
+        crypter = Crypter(key=' --- My Key --- ', iv='The IV', mode=MODE_GCM)
+        self.assertEqual(crypter.decrypt(crypter.encrypt('   Hello World   ')), '   Hello World   ')
+        initial_bytes = bytearray(random.getrandbits(8) for _ in range(723))
+        self.assertEqual(crypter.decrypt(crypter.encrypt(initial_bytes)), initial_bytes)
+        with self.assertRaises(EncryptionInvalidParameterException):
+            crypter.encrypt({'key': 'value'})
+
+    def test_aead_backends_interoperate(self):
+        for mode in AEAD_MODES:
+            crypter = Crypter(key=' --- My Key --- ', iv='The IV', mode=mode)
+            portable = Crypter(key=' --- My Key --- ', iv='The IV', mode=mode)
+            portable._cached_aead = None
+            initial_bytes = bytes(random.getrandbits(8) for _ in range(723))
+
+            self.assertEqual(portable.decrypt_raw(crypter.encrypt_raw(initial_bytes, b'header'), b'header'), initial_bytes)
+            self.assertEqual(crypter.decrypt_raw(portable.encrypt_raw(initial_bytes, b'header'), b'header'), initial_bytes)
+            with self.assertRaises(DecryptionException):
+                crypter.decrypt_raw(portable.encrypt_raw(initial_bytes, b'header'), b'other')
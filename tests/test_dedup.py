@@ -0,0 +1,56 @@
+import unittest
+from multisock.dedup import DuplicateFilter
+
+
+class Test_DuplicateFilter(unittest.TestCase):
+
+    def test_window(self):
+        dedup = DuplicateFilter(window=8)
+        self.assertEqual([dedup.seen(1, sequence) for sequence in (10, 12, 11, 12, 10, 13, 20, 13, 14, 12, 2)],
+                         [False, False, False, True, True, False, False, True, False, True, True])
+        self.assertEqual((dedup.duplicates, dedup.stale, dedup.dropped), (3, 2, 5))
+
+    def test_wrap_around(self):
+        dedup = DuplicateFilter()
+        self.assertFalse(dedup.seen(1, 0xFFFFFFFE))
+        self.assertFalse(dedup.seen(1, 1))
+        self.assertFalse(dedup.seen(1, 0xFFFFFFFF))
+        self.assertTrue(dedup.seen(1, 0xFFFFFFFE))
+        self.assertFalse(dedup.seen(1, 0))
+        self.assertTrue(dedup.seen(1, 1))
+
+    def test_large_jump(self):
+        dedup = DuplicateFilter(window=64)
+        dedup.seen(1, 0)
+        self.assertFalse(dedup.seen(1, 1 << 30))
+        self.assertTrue(dedup.seen(1, 1 << 30))
+        self.assertFalse(dedup.seen(1, (1 << 30) - 1))
+
+    def test_check_does_not_track(self):
+        dedup = DuplicateFilter(window=8)
+        dedup.seen(1, 10)
+        # e.g. a tampered copy, or a forged number far ahead
+        self.assertFalse(dedup.check(1, 11))
+        self.assertFalse(dedup.check(1, 1 << 20))
+        self.assertFalse(dedup.seen(1, 11))
+        self.assertFalse(dedup.seen(1, 12))
+        self.assertTrue(dedup.check(1, 10))
+        self.assertFalse(dedup.check(2, 10))
+        self.assertEqual((len(dedup), dedup.duplicates, dedup.stale), (1, 1, 0))
+
+    def test_origins(self):
+        dedup = DuplicateFilter(max_origins=2)
+        dedup.seen(1, 0)
+        dedup.seen(2, 0)
+        self.assertTrue(dedup.seen(1, 0))
+        # the origin 2 is idle for the longest time
+        dedup.seen(3, 0)
+        self.assertEqual((len(dedup), dedup.evicted), (2, 1))
+        self.assertTrue(dedup.seen(1, 0))
+        self.assertFalse(dedup.seen(2, 0))
+        with self.assertRaises(ValueError):
+            DuplicateFilter(window=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import itertools
+import os
+import time
+import unittest
+from multisock import frame
+from multisock.fec import FecEncoder, FecDecoder, encode_parity, gf_mul, gf_inv
+from multisock.exceptions import InvalidFrameException
+
+ADDR = ('10.0.0.1', 1234)
+
+
+def datagrams(count):
+    return [os.urandom(10 + 37 * i % 300) for i in range(count)]
+
+
+class Test_GF(unittest.TestCase):
+
+    def test_field(self):
+        for a in range(1, 256):
+            self.assertEqual(gf_mul(a, gf_inv(a)), 1)
+            self.assertEqual(gf_mul(a, 1), a)
+            self.assertEqual(gf_mul(a, 0), 0)
+        self.assertEqual(gf_mul(2, 0x80), 0x1d)
+
+    def test_xor_parity(self):
+        group = [b'\x01\x02', b'\x04']
+        self.assertEqual(encode_parity(group, 1), [b'\x00\x03\x05\x02'])
+
+
+class Test_Fec(unittest.TestCase):
+
+    def transfer(self, encoder, decoder, data, lost=(), close=True):
+        delivered = []
+        for (index, datagram) in enumerate(encoder.protect(data, close=close)):
+            if index not in lost:
+                delivered.extend(decoder.add(ADDR, frame.Frame.parse(datagram)))
+        return delivered
+
+    def test_any_loss_pattern(self):
+        for (data_count, parity_count) in ((4, 1), (4, 2), (5, 3)):
+            data = datagrams(data_count)
+            total = data_count + parity_count
+            for losses in range(parity_count + 1):
+                for lost in itertools.combinations(range(total), losses):
+                    decoder = FecDecoder()
+                    delivered = self.transfer(FecEncoder(data_count, parity_count), decoder, data, lost)
+                    self.assertEqual(sorted(delivered), sorted(data), (data_count, parity_count, lost))
+                    self.assertEqual(decoder.recovered, len([i for i in lost if i < data_count]))
+
+    def test_overhead(self):
+        encoder = FecEncoder(4, 2)
+        protected = encoder.protect(datagrams(6))
+        # a full group and its parity, the second group still open
+        self.assertEqual(len(protected), 4 + 2 + 2)
+        self.assertEqual(encoder.parity_sent, 2)
+        (dest, parity), = encoder.flush()
+        self.assertEqual((dest, len(parity)), (None, 2))
+        self.assertEqual(frame.Frame.parse(parity[0]).fec[2:], (2, 2))
+        self.assertEqual(encoder.parity_sent, 4)
+        self.assertEqual(encoder.flush(), [])
+        with self.assertRaises(ValueError):
+            FecEncoder(200, 60)
+
+    def test_partial_group(self):
+        data = datagrams(3)
+        decoder = FecDecoder()
+        # 8 data datagrams expected, the group is closed after 3
+        delivered = self.transfer(FecEncoder(8, 2), decoder, data, lost=(0, 2))
+        self.assertEqual(sorted(delivered), sorted(data))
+
+    def test_group_deadline(self):
+        data = datagrams(3)
+        sent = []
+        encoder = FecEncoder(8, 2, delay=0.02, send=lambda parity, dest: sent.append((dest, parity)))
+        protected = encoder.protect(data)
+        self.assertEqual(len(protected), 3)
+        time.sleep(0.1)
+        encoder.close()
+
+        # the partly filled group is closed on its deadline
+        self.assertEqual([(dest, len(parity)) for (dest, parity) in sent], [(None, 2)])
+        self.assertEqual(encoder.flush(), [])
+        decoder = FecDecoder()
+        delivered = []
+        for datagram in [protected[1]] + sent[0][1]:
+            delivered.extend(decoder.add(ADDR, frame.Frame.parse(datagram)))
+        self.assertEqual(sorted(delivered), sorted(data))
+
+    def test_duplicates(self):
+        data = datagrams(4)
+        encoder = FecEncoder(4, 1)
+        decoder = FecDecoder()
+        protected = encoder.protect(data)
+        delivered = []
+        for datagram in protected[1:] + protected:
+            delivered.extend(decoder.add(ADDR, frame.Frame.parse(datagram)))
+        # the first one is recovered, then discarded when it arrives late
+        self.assertEqual(sorted(delivered), sorted(data))
+
+    def test_unrecoverable(self):
+        decoder = FecDecoder(timeout=0.05)
+        self.transfer(FecEncoder(4, 1), decoder, datagrams(4), lost=(0, 1))
+        self.assertEqual((decoder.recovered, decoder.unrecoverable), (0, 0))
+        time.sleep(0.1)
+        decoder.add(ADDR, frame.Frame.parse(FecEncoder(4, 1).protect([b'late'])[0]))
+        self.assertEqual(decoder.unrecoverable, 2)
+
+    def test_memory_bound(self):
+        decoder = FecDecoder(max_memory=1000)
+        # the parity is lost: the groups stay pending
+        delivered = self.transfer(FecEncoder(2, 1), decoder, [bytes(300)] * 6, lost=(2, 5, 8))
+        self.assertEqual(len(delivered), 6)
+        self.assertEqual((decoder.memory, decoder.evicted, len(decoder)), (600, 2, 1))
+
+    def test_invalid_index(self):
+        datagram = frame.encode(frame.CODEC_RAW, b'on', fec=(1, 5, 4, 1))
+        with self.assertRaises(InvalidFrameException):
+            FecDecoder().add(ADDR, frame.Frame.parse(datagram))
+
+
+if __name__ == '__main__':
+    unittest.main()
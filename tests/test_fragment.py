@@ -0,0 +1,117 @@
+import unittest
+import os
+from unittest.mock import patch
+from multisock import frame
+from multisock.fragment import Fragmenter, Reassembler, PARTIAL_OVERHEAD, CHUNK_OVERHEAD
+from multisock.exceptions import InvalidFrameException
+
+SENDER = ('10.0.0.1', 1234)
+
+
+def parse_all(datagrams):
+    return [frame.Frame.parse(datagram) for datagram in datagrams]
+
+
+class Test_Fragmenter(unittest.TestCase):
+
+    def test_small_datagram_not_fragmented(self):
+        fragmenter = Fragmenter(1400)
+        self.assertEqual(fragmenter.split(b'Hello'), [b'Hello'])
+
+    def test_split(self):
+        fragmenter = Fragmenter(100)
+        message = os.urandom(1000)
+        fragments = fragmenter.split(message)
+
+        self.assertTrue(all(len(datagram) <= 100 for datagram in fragments))
+        parsed = parse_all(fragments)
+        self.assertEqual(len({fragment.fragment[0] for fragment in parsed}), 1)
+        self.assertEqual([fragment.fragment[1:] for fragment in parsed], [(i, len(fragments)) for i in range(len(fragments))])
+        self.assertEqual(b''.join(bytes(fragment.payload) for fragment in parsed), message)
+        # every message gets its own id
+        self.assertNotEqual(frame.Frame.parse(fragmenter.split(message)[0]).fragment[0], parsed[0].fragment[0])
+
+    def test_mtu_too_small(self):
+        with self.assertRaises(ValueError):
+            Fragmenter(frame.HEADER_SIZE)
+
+
+class Test_Reassembler(unittest.TestCase):
+
+    def test_reassemble_out_of_order_with_duplicates(self):
+        message = os.urandom(1000)
+        fragments = parse_all(Fragmenter(100).split(message))
+        reassembler = Reassembler()
+
+        for fragment in reversed(fragments[1:]):
+            self.assertIsNone(reassembler.add(SENDER, fragment))
+        self.assertIsNone(reassembler.add(SENDER, fragments[1]))
+        self.assertTrue(reassembler.memory > 0)
+
+        self.assertEqual(reassembler.add(SENDER, fragments[0]), message)
+        self.assertEqual(len(reassembler), 0)
+        self.assertEqual(reassembler.memory, 0)
+        self.assertEqual(reassembler.completed, 1)
+
+    def test_senders_do_not_mix(self):
+        fragments = parse_all(Fragmenter(100).split(os.urandom(300)))
+        reassembler = Reassembler()
+
+        reassembler.add(SENDER, fragments[0])
+        reassembler.add(SENDER, fragments[1])
+        self.assertIsNone(reassembler.add(('10.0.0.2', 1234), fragments[-1]))
+        self.assertEqual(len(reassembler), 2)
+
+    def test_partial_messages_expire(self):
+        fragments = parse_all(Fragmenter(100).split(os.urandom(300)))
+        reassembler = Reassembler(timeout=2.0)
+
+        with patch('multisock.fragment.time.monotonic', return_value=100.0):
+            reassembler.add(SENDER, fragments[0])
+        with patch('multisock.fragment.time.monotonic', return_value=103.0):
+            self.assertIsNone(reassembler.add(SENDER, fragments[1]))
+
+        self.assertEqual(reassembler.expired, 1)
+        self.assertEqual(len(reassembler), 1)
+
+    def test_memory_limit_evicts_oldest(self):
+        fragmenter = Fragmenter(100)
+        first = parse_all(fragmenter.split(os.urandom(300)))
+        second = parse_all(fragmenter.split(os.urandom(300)))
+        # room for a message of 4 fragments, not for the first fragments of two
+        reassembler = Reassembler(max_memory=800)
+
+        reassembler.add(SENDER, first[0])
+        reassembler.add(SENDER, second[0])
+
+        self.assertEqual(reassembler.evicted, 1)
+        self.assertEqual(len(reassembler), 1)
+        self.assertTrue(reassembler.memory <= 800)
+        self.assertIsNone(reassembler.add(SENDER, first[1]))
+
+    def test_fragment_count_bounded(self):
+        reassembler = Reassembler(max_memory=1024 * 1024)
+        # tiny fragments of huge messages: the bookkeeping is accounted too
+        for msg_id in range(2000):
+            fragment = frame.Frame.parse(frame.encode(frame.CODEC_RAW, b'x', fragment=(msg_id, 65534, 65535)))
+            with self.assertRaises(InvalidFrameException):
+                reassembler.add(SENDER, fragment)
+        self.assertEqual((len(reassembler), reassembler.memory), (0, 0))
+
+        reassembler = Reassembler(max_memory=64 * 1024)
+        for msg_id in range(2000):
+            fragment = frame.Frame.parse(frame.encode(frame.CODEC_RAW, b'x', fragment=(msg_id, 0, 100)))
+            reassembler.add(SENDER, fragment)
+        self.assertTrue(reassembler.memory <= 64 * 1024)
+        self.assertEqual(len(reassembler), reassembler.memory // (PARTIAL_OVERHEAD + CHUNK_OVERHEAD + 1))
+        self.assertGreater(reassembler.evicted, 1500)
+
+        # a message that cannot fit the memory
+        fragment = frame.Frame.parse(frame.encode(frame.CODEC_RAW, b'x' * 1000, fragment=(1, 0, 100)))
+        with self.assertRaises(InvalidFrameException):
+            reassembler.add(SENDER, fragment)
+
+    def test_invalid_fragment_index(self):
+        fragment = frame.Frame.parse(frame.encode(frame.CODEC_RAW, b'x', fragment=(1, 5, 5)))
+        with self.assertRaises(InvalidFrameException):
+            Reassembler().add(SENDER, fragment)
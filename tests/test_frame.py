@@ -0,0 +1,168 @@
+import unittest
+from multisock import frame
+from multisock.crypter import Crypter, MODE_GCM
+from multisock.compression import Compressor
+from multisock.exceptions import InvalidFrameException, DecryptionException
+
+
+class Test_Frame(unittest.TestCase):
+
+    def test_encode_and_parse(self):
+        data = frame.encode(frame.CODEC_RAW, b'Hello World')
+
+        self.assertEqual(len(data), frame.HEADER_SIZE + 11)
+        self.assertTrue(frame.is_frame(data))
+        received = frame.Frame.parse(data)
+        self.assertEqual(received.codec, frame.CODEC_RAW)
+        self.assertFalse(received.encrypted)
+        self.assertEqual(received.open(), b'Hello World')
+
+    def test_encode_and_parse_encrypted(self):
+        crypto = Crypter('pwd', 'passphrase')
+        data = frame.encode(frame.CODEC_TEXT, b'Hello World', crypto)
+
+        received = frame.Frame.parse(data)
+        self.assertTrue(received.encrypted)
+        self.assertEqual(len(received.payload), crypto.sealed_size(11))
+        self.assertNotEqual(bytes(received.payload), b'Hello World')
+        self.assertEqual(received.open(crypto), b'Hello World')
+
+    def test_open_encrypted_without_crypto(self):
+        data = frame.encode(frame.CODEC_RAW, b'Hello World', Crypter('pwd', 'passphrase'))
+        with self.assertRaises(InvalidFrameException):
+            frame.Frame.parse(data).open()
+
+    def test_legacy_data_is_not_a_frame(self):
+        crypto = Crypter('pwd', 'passphrase')
+        self.assertFalse(frame.is_frame(crypto.encrypt('Hello World')))
+        self.assertFalse(frame.is_frame(b'Hello World'))
+        self.assertFalse(frame.is_frame(frame.MAGIC))
+
+    def test_validate_header(self):
+        data = frame.encode(frame.CODEC_RAW, b'Hello World', flags=frame.FLAG_BATCH)
+        self.assertTrue(frame.is_frame(data, validate=True))
+        # legacy data starting with the magic
+        legacy = frame.MAGIC + b'legacy payload'
+        self.assertTrue(frame.is_frame(legacy))
+        self.assertFalse(frame.is_frame(legacy, validate=True))
+        # unsupported version, unknown flags, truncated payload
+        self.assertFalse(frame.is_frame(data[:2] + bytes([2]) + data[3:], validate=True))
+        self.assertFalse(frame.is_frame(data[:4] + b'\x80\x00' + data[6:], validate=True))
+        self.assertFalse(frame.is_frame(data[:-1], validate=True))
+
+    def test_parse_invalid_frames(self):
+        data = frame.encode(frame.CODEC_RAW, b'Hello World')
+        with self.assertRaises(InvalidFrameException):
+            frame.Frame.parse(data[:5])
+        with self.assertRaises(InvalidFrameException):
+            frame.Frame.parse(data[:-1])
+        with self.assertRaises(InvalidFrameException):
+            frame.Frame.parse(b'XX' + data[2:])
+        with self.assertRaises(InvalidFrameException):
+            frame.Frame.parse(data[:2] + bytes([frame.VERSION + 1]) + data[3:])
+
+    def test_invalid_extension(self):
+        with self.assertRaises(InvalidFrameException):
+            frame.encode(frame.CODEC_RAW, b'', fragment=(1, 70000, 2))
+
+    def test_fragment_extension(self):
+        data = frame.encode(frame.CODEC_RAW, b'chunk', fragment=(12345, 3, 10))
+
+        received = frame.Frame.parse(data)
+        self.assertEqual(received.fragment, (12345, 3, 10))
+        self.assertEqual(received.open(), b'chunk')
+        self.assertIsNone(frame.Frame.parse(frame.encode(frame.CODEC_RAW, b'chunk')).fragment)
+        with self.assertRaises(InvalidFrameException):
+            frame.Frame.parse(data[:frame.HEADER_SIZE + 2])
+
+    def test_topic_extension(self):
+        data = frame.encode(frame.CODEC_RAW, b'on', fragment=(1, 0, 1), topic='/lights/cucina')
+
+        received = frame.Frame.parse(data)
+        self.assertEqual(received.topic, '/lights/cucina')
+        self.assertEqual(received.fragment, (1, 0, 1))
+        self.assertEqual(received.open(), b'on')
+        with self.assertRaises(InvalidFrameException):
+            frame.encode(frame.CODEC_RAW, b'on', topic='x' * (frame.MAX_TOPIC_LENGTH + 1))
+
+    def test_sequence_extension(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_GCM)
+        data = frame.encode(frame.CODEC_RAW, b'on', crypto, topic='/lights', sequence=(0xCAFE, 42))
+
+        received = frame.Frame.parse(data)
+        self.assertEqual(received.sequence, (0xCAFE, 42))
+        self.assertEqual(received.topic, '/lights')
+        self.assertEqual(received.open(crypto), b'on')
+        self.assertIsNone(frame.Frame.parse(frame.encode(frame.CODEC_RAW, b'on')).sequence)
+
+    def test_timestamp_extension(self):
+        data = frame.encode(frame.CODEC_RAW, b'on', sequence=(1, 2), timestamp=1700000000123456789)
+
+        received = frame.Frame.parse(data)
+        self.assertEqual(received.timestamp, 1700000000123456789)
+        self.assertEqual(received.sequence, (1, 2))
+        self.assertEqual(received.open(), b'on')
+
+    def test_unknown_flags(self):
+        data = bytearray(frame.encode(frame.CODEC_RAW, b'Hello World'))
+        data[4] = 0x80
+        with self.assertRaises(InvalidFrameException):
+            frame.Frame.parse(data)
+
+    def test_aead_authenticates_header(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_GCM)
+        data = bytearray(frame.encode(frame.CODEC_TEXT, b'Hello World', crypto))
+
+        self.assertEqual(frame.Frame.parse(data).open(crypto), b'Hello World')
+        # a different codec in the header
+        data[3] = frame.CODEC_RAW
+        with self.assertRaises(DecryptionException):
+            frame.Frame.parse(data).open(crypto)
+
+    def test_batch(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_GCM)
+        frames = [frame.encode(frame.CODEC_RAW, b'on', topic='/lights', sequence=(1, 2)),
+                  frame.encode(frame.CODEC_TEXT, b'off', timestamp=1700000000123456789)]
+        data = frame.encode_batch(frames, crypto)
+
+        received = frame.Frame.parse(data)
+        self.assertTrue(received.batch)
+        self.assertTrue(received.encrypted)
+        first, second = frame.split_batch(received.open(crypto))
+        self.assertEqual(first.topic, '/lights')
+        self.assertEqual(first.sequence, (1, 2))
+        self.assertEqual(first.open(), b'on')
+        self.assertEqual(second.codec, frame.CODEC_TEXT)
+        self.assertEqual(second.timestamp, 1700000000123456789)
+        self.assertEqual(second.open(), b'off')
+
+    def test_invalid_batch(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_GCM)
+        nested = frame.encode_batch([frame.encode(frame.CODEC_RAW, b'on')])
+        with self.assertRaises(InvalidFrameException):
+            frame.split_batch(nested)
+        with self.assertRaises(InvalidFrameException):
+            frame.split_batch(frame.encode(frame.CODEC_RAW, b'on', crypto))
+        with self.assertRaises(InvalidFrameException):
+            frame.split_batch(frame.encode(frame.CODEC_RAW, b'on')[:-1])
+
+    def test_compressed(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_GCM)
+        payload = b'temperature' * 20
+        data = frame.encode(frame.CODEC_RAW, payload, crypto, topic='/sensors', compressor=Compressor())
+
+        self.assertLess(len(data), len(payload))
+        received = frame.Frame.parse(data)
+        self.assertTrue(received.compressed)
+        self.assertEqual(received.dictionary, 0)
+        self.assertEqual(received.topic, '/sensors')
+        self.assertEqual(received.open(crypto), payload)
+        # below the threshold
+        self.assertFalse(frame.Frame.parse(frame.encode(frame.CODEC_RAW, b'on', compressor=Compressor())).compressed)
+
+    def test_fec(self):
+        data = frame.encode(frame.CODEC_RAW, b'datagram', fec=(7, 1, 4, 2))
+        received = frame.Frame.parse(data)
+        self.assertEqual(received.fec, (7, 1, 4, 2))
+        self.assertEqual(bytes(received.payload), b'datagram')
+        self.assertIsNone(frame.Frame.parse(frame.encode(frame.CODEC_RAW, b'datagram')).fec)
@@ -0,0 +1,97 @@
+import unittest
+from multisock.latency import (LatencyHistogram, LatencyTracker, MessageMeta, bucket_of, bucket_bound,
+                               BUCKETS)
+
+
+class Test_Buckets(unittest.TestCase):
+
+    def test_bucket_bounds(self):
+        for ns in list(range(2000)) + [10 ** i + 7 for i in range(4, 12)]:
+            index = bucket_of(ns)
+            self.assertLess(ns, bucket_bound(index))
+            if index > 0:
+                # the bucket upper bound is at most 25% above its values
+                self.assertLessEqual(bucket_bound(index), ns * 1.25 + 1)
+            self.assertLessEqual(index, bucket_of(ns + 1))
+
+    def test_overflow_bucket(self):
+        self.assertEqual(bucket_of(2 ** 50), BUCKETS - 1)
+
+
+class Test_LatencyHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for ns in range(1000, 101000, 1000):
+            histogram.record(ns)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.min, 1000)
+        self.assertEqual(histogram.max, 100000)
+        self.assertEqual(histogram.mean, 50500)
+        for percent in (50, 90, 99):
+            actual = percent * 1000
+            self.assertGreaterEqual(histogram.percentile(percent), actual)
+            self.assertLessEqual(histogram.percentile(percent), actual * 1.25)
+        self.assertEqual(histogram.percentile(100), 100000)
+
+    def test_negative_and_empty(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        histogram.record(-5)
+
+        stats = histogram.snapshot()
+        self.assertEqual(stats['count'], 0)
+        self.assertEqual(stats['negative'], 1)
+        self.assertIsNone(stats['p50'])
+
+    def test_merge(self):
+        merged = LatencyHistogram()
+        first = LatencyHistogram()
+        second = LatencyHistogram()
+        for ns in range(1000, 51000, 1000):
+            first.record(ns)
+        for ns in range(51000, 101000, 1000):
+            second.record(ns)
+        second.record(-1)
+
+        merged.merge(first)
+        merged.merge(second)
+        self.assertEqual(merged.count, 100)
+        self.assertEqual(merged.negative, 1)
+        self.assertEqual(merged.min, 1000)
+        self.assertEqual(merged.max, 100000)
+        self.assertEqual(merged.mean, 50500)
+        self.assertEqual(merged.buckets, [a + b for (a, b) in zip(first.buckets, second.buckets)])
+
+
+class Test_LatencyTracker(unittest.TestCase):
+
+    def test_per_sender(self):
+        tracker = LatencyTracker(max_senders=2)
+        tracker.record(('10.0.0.1', 1234), 1000)
+        tracker.record(('10.0.0.2', 1234), 2000)
+        tracker.record(('10.0.0.1', 1234), 3000)
+
+        stats = tracker.snapshot()
+        self.assertEqual(stats[('10.0.0.1', 1234)]['count'], 2)
+        self.assertEqual(stats[('10.0.0.2', 1234)]['max'], 2000)
+
+        tracker.record(('10.0.0.3', 1234), 1000)
+        self.assertEqual(len(tracker), 2)
+        self.assertNotIn(('10.0.0.1', 1234), tracker.snapshot())
+
+
+class Test_MessageMeta(unittest.TestCase):
+
+    def test_latencies(self):
+        meta = MessageMeta(sent_ns=100, kernel_ns=150, received_ns=400, decoded_ns=450)
+
+        self.assertEqual(meta.network_latency, 50)
+        self.assertEqual(meta.queue_latency, 250)
+        self.assertEqual(meta.decode_latency, 50)
+        self.assertIsNone(MessageMeta(received_ns=400).network_latency)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from multisock.metrics import ChannelMetrics, SequenceTracker
+
+
+class Test_SequenceTracker(unittest.TestCase):
+
+    def test_in_order(self):
+        tracker = SequenceTracker()
+        for i in range(10):
+            tracker.track(1, i)
+
+        self.assertEqual((tracker.gaps, tracker.late, tracker.duplicates, tracker.lost), (0, 0, 0, 0))
+
+    def test_gaps_and_reordering(self):
+        tracker = SequenceTracker()
+        for i in (0, 1, 4, 2, 6, 6):
+            tracker.track(1, i)
+
+        # 2 and 3 skipped by 4, 5 skipped by 6; 2 arrived late; 6 twice
+        self.assertEqual(tracker.gaps, 3)
+        self.assertEqual(tracker.late, 1)
+        self.assertEqual(tracker.duplicates, 1)
+        self.assertEqual(tracker.lost, 2)
+
+    def test_senders_are_independent(self):
+        tracker = SequenceTracker()
+        tracker.track(1, 100)
+        tracker.track(2, 7)
+        tracker.track(1, 101)
+        tracker.track(2, 8)
+
+        self.assertEqual(tracker.gaps, 0)
+        self.assertEqual(len(tracker), 2)
+
+    def test_wrap_around(self):
+        tracker = SequenceTracker()
+        tracker.track(1, 0xFFFFFFFE)
+        tracker.track(1, 0xFFFFFFFF)
+        tracker.track(1, 1)
+
+        self.assertEqual(tracker.gaps, 1)
+        self.assertEqual(tracker.late, 0)
+
+    def test_max_senders(self):
+        tracker = SequenceTracker(max_senders=2)
+        for origin in range(3):
+            tracker.track(origin, 0)
+
+        self.assertEqual(len(tracker), 2)
+
+
+class Test_ChannelMetrics(unittest.TestCase):
+
+    def test_snapshot(self):
+        metrics = ChannelMetrics()
+        metrics.messages_sent += 2
+        metrics.sequences.track(1, 0)
+        metrics.sequences.track(1, 5)
+
+        stats = metrics.snapshot()
+        self.assertEqual(stats['messages_sent'], 2)
+        self.assertEqual(stats['kernel_drops'], 0)
+        self.assertEqual(stats['sequence_gaps'], 4)
+        self.assertEqual(stats['lost'], 4)
+        # a copy, not a live view
+        metrics.messages_sent += 1
+        self.assertEqual(stats['messages_sent'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import socket
+from multisock import mmsg
+
+
+@unittest.skipUnless(mmsg.HAVE_RECVMMSG, 'recvmmsg not available')
+class Test_MmsgReceiver(unittest.TestCase):
+    def setUp(self):
+        self.reader = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.reader.bind(('127.0.0.1', 0))
+        self.writer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.writer.bind(('127.0.0.1', 0))
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+
+    def test_recv_batch(self):
+        for i in range(5):
+            self.writer.sendto(b'datagram %d' % i, self.reader.getsockname())
+
+        receiver = mmsg.MmsgReceiver(8, 2048)
+        batch = receiver.recv(self.reader)
+
+        self.assertEqual([data for (data, addr) in batch], [b'datagram %d' % i for i in range(5)])
+        self.assertTrue(all(addr == self.writer.getsockname() for (data, addr) in batch))
+
+    def test_recv_limited_by_max_msgs(self):
+        for i in range(5):
+            self.writer.sendto(b'x' * i, self.reader.getsockname())
+
+        receiver = mmsg.MmsgReceiver(8, 2048)
+        self.assertEqual(len(receiver.recv(self.reader, 3)), 3)
+        self.assertEqual(len(receiver.recv(self.reader)), 2)
+
+    def test_recv_nothing_pending(self):
+        receiver = mmsg.MmsgReceiver(4, 2048)
+        self.assertEqual(receiver.recv(self.reader), [])
+
+    @unittest.skipUnless(mmsg.SO_RXQ_OVFL, 'SO_RXQ_OVFL not available')
+    def test_recv_drop_counter(self):
+        self.reader.setsockopt(socket.SOL_SOCKET, mmsg.SO_RXQ_OVFL, 1)
+        self.reader.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024)
+        for i in range(200):
+            self.writer.sendto(b'x' * 100, self.reader.getsockname())
+        receiver = mmsg.MmsgReceiver(256, 2048, drops=True)
+        queued = len(receiver.recv(self.reader))
+        # queued before any drop: no counter attached
+        self.assertIsNone(receiver.dropped)
+
+        self.writer.sendto(b'last', self.reader.getsockname())
+        self.assertEqual(receiver.recv(self.reader)[0][0], b'last')
+        self.assertEqual(receiver.dropped, 200 - queued)
+
+
+class Test_Ancillary(unittest.TestCase):
+
+    @unittest.skipUnless(mmsg.SO_TIMESTAMPNS, 'SO_TIMESTAMPNS not available')
+    def test_parse_timestamp(self):
+        ancdata = [(socket.SOL_SOCKET, mmsg.SO_TIMESTAMPNS, mmsg.TIMESPEC.pack(1700000000, 123))]
+
+        self.assertEqual(mmsg.parse_timestamp(ancdata), 1700000000000000123)
+        self.assertIsNone(mmsg.parse_timestamp([]))
+        self.assertIsNone(mmsg.parse_drops(ancdata))
+
+    @unittest.skipUnless(mmsg.SO_RXQ_OVFL, 'SO_RXQ_OVFL not available')
+    def test_parse_drops(self):
+        ancdata = [(socket.SOL_SOCKET, mmsg.SO_RXQ_OVFL, mmsg.DROPS.pack(7))]
+
+        self.assertEqual(mmsg.parse_drops(ancdata), 7)
+        self.assertIsNone(mmsg.parse_timestamp(ancdata))
+
+
+@unittest.skipUnless(mmsg.HAVE_SENDMMSG, 'sendmmsg not available')
+class Test_Sendmmsg(unittest.TestCase):
+    def setUp(self):
+        self.reader = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.reader.bind(('127.0.0.1', 0))
+        self.reader.settimeout(1)
+        self.writer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+
+    def test_sendmmsg(self):
+        datagrams = [b'datagram %d' % i for i in range(10)]
+        sent = mmsg.sendmmsg(self.writer, datagrams, self.reader.getsockname())
+
+        self.assertEqual(sent, 10)
+        self.assertEqual([self.reader.recv(2048) for i in range(10)], datagrams)
+
+    def test_is_uniform(self):
+        self.assertTrue(mmsg.is_uniform([b'aaa', b'bbb', b'cc']))
+        self.assertTrue(mmsg.is_uniform([b'aaa', b'bbb']))
+        self.assertFalse(mmsg.is_uniform([b'aaa']))
+        self.assertFalse(mmsg.is_uniform([b'aaa', b'bb', b'ccc']))
+        self.assertFalse(mmsg.is_uniform([b'aaa', b'bbbb']))
+        self.assertFalse(mmsg.is_uniform([b'', b'']))
+
+    @unittest.skipUnless(mmsg.HAVE_UDP_GSO, 'UDP GSO not available')
+    def test_send_segmented(self):
+        datagrams = [b'%04d' % i for i in range(100)] + [b'end']
+        try:
+            sent = mmsg.send_segmented(self.writer, datagrams, self.reader.getsockname())
+        except OSError:
+            self.skipTest('UDP_SEGMENT not supported by the kernel')
+
+        self.assertEqual(sent, 101)
+        self.assertEqual([self.reader.recv(2048) for i in range(101)], datagrams)
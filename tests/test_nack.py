@@ -0,0 +1,174 @@
+import socket
+import time
+import unittest
+import struct
+from multisock import frame, mmsg
+from multisock.crypter import Crypter, MODE_GCM
+from multisock.nack import (NackTracker, History, Repairer, encode_nack, decode_nack, encode_announcement,
+                            decode_announcement, is_nack, MAX_RANGES, MAX_ANNOUNCEMENTS, NACK_FILTER)
+from multisock.exceptions import InvalidFrameException
+
+
+class Test_Nack(unittest.TestCase):
+
+    def test_encode(self):
+        sequences = [7, 3, 4, 5, 0xFFFFFFFF, 0, 10]
+        (payload,) = encode_nack(1, 2, sequences)
+        # ranges: 0, 3-5, 7, 10, 0xFFFFFFFF
+        self.assertEqual(len(payload), 8 + 5 * 6)
+        self.assertEqual(decode_nack(payload), (1, 2, [0, 3, 4, 5, 7, 10, 0xFFFFFFFF]))
+        payloads = encode_nack(1, 2, range(0, 4 * MAX_RANGES, 2))
+        self.assertEqual(len(payloads), 2)
+        self.assertEqual(sum(len(decode_nack(payload)[2]) for payload in payloads), 2 * MAX_RANGES)
+        with self.assertRaises(InvalidFrameException):
+            decode_nack(payload[:-1])
+
+    def test_history(self):
+        history = History(4, holdoff=60)
+        for sequence in range(6):
+            history.store(sequence, b'message %d' % sequence)
+        self.assertEqual(history.repairs([1, 2, 5]), [b'message 2', b'message 5'])
+        # already retransmitted
+        self.assertEqual(history.repairs([2]), [])
+        self.assertEqual((history.retransmitted, history.expired), (2, 1))
+        with self.assertRaises(ValueError):
+            History(0)
+
+    def test_gaps(self):
+        nacks = []
+        tracker = NackTracker(lambda origin, sequences: nacks.append((origin, sequences)), delay=0, interval=60)
+        self.assertTrue(tracker.receive(1, 10))
+        self.assertTrue(tracker.receive(1, 13))
+        self.assertTrue(tracker.receive(2, 0xFFFFFFFF))
+        self.assertTrue(tracker.receive(2, 1))
+        self.assertEqual(len(tracker), 3)
+        time.sleep(0.1)
+        self.assertTrue(tracker.receive(1, 11))
+        self.assertFalse(tracker.receive(1, 11))
+        self.assertFalse(tracker.receive(1, 13))
+        tracker.close()
+
+        self.assertEqual(sorted(nacks), [(1, [11, 12]), (2, [0])])
+        self.assertEqual((tracker.sent, tracker.repaired, tracker.duplicates), (2, 1, 2))
+        self.assertEqual(len(tracker), 2)
+
+    def test_delivered(self):
+        tracker = NackTracker(lambda origin, sequences: None, delay=60, interval=60)
+        self.assertFalse(tracker.delivered(1, 10))
+        tracker.receive(1, 10)
+        tracker.receive(1, 13)
+        self.assertEqual([tracker.delivered(1, sequence) for sequence in (9, 10, 11, 13, 14, 1 << 20)],
+                         [True, True, False, True, False, False])
+        # not tracked: still missing
+        self.assertEqual(len(tracker), 2)
+        self.assertEqual((tracker.duplicates, tracker.repaired), (3, 0))
+        tracker.close()
+
+    def test_retries(self):
+        nacks = []
+        tracker = NackTracker(lambda origin, sequences: nacks.append(sequences), delay=0, interval=0.01, retries=3)
+        tracker.receive(1, 0)
+        tracker.receive(1, 2)
+        time.sleep(0.2)
+        tracker.close()
+
+        self.assertEqual(nacks, [[1]] * 3)
+        self.assertEqual((len(tracker), tracker.unrecovered), (0, 1))
+
+    def test_suppression(self):
+        nacks = []
+        tracker = NackTracker(lambda origin, sequences: nacks.append(sequences), delay=0.05, interval=60)
+        tracker.receive(1, 0)
+        tracker.receive(1, 3)
+        # another receiver asked for 1 and 2 already
+        tracker.overheard(1, [1, 2])
+        tracker.overheard(2, [1])
+        time.sleep(0.1)
+        tracker.close()
+
+        self.assertEqual(nacks, [])
+        self.assertEqual(tracker.suppressed, 2)
+
+    def test_announced(self):
+        nacks = []
+        tracker = NackTracker(lambda origin, sequences: nacks.append((origin, sequences)), delay=0, interval=60)
+        # nothing received yet from the sender
+        tracker.announced(*decode_announcement(encode_announcement(1, 5)))
+        tracker.receive(1, 0)
+        tracker.announced(1, 3)
+        # already known
+        tracker.announced(1, 2)
+        tracker.announced(1, 0)
+        time.sleep(0.1)
+        self.assertTrue(tracker.receive(1, 3))
+        tracker.close()
+
+        self.assertEqual(nacks, [(1, [1, 2, 3])])
+        self.assertEqual((len(tracker), tracker.repaired), (2, 1))
+        with self.assertRaises(InvalidFrameException):
+            decode_announcement(encode_announcement(1, 5)[:-1])
+
+    def test_heartbeat(self):
+        history = History()
+        announced = []
+        repairer = Repairer(socket.socket(socket.AF_INET, socket.SOCK_DGRAM), 1, history, None,
+                            announce=announced.append, idle=0.02)
+        time.sleep(0.05)
+        history.store(5, b'five')
+        time.sleep(0.3)
+        # on flush
+        repairer.announce()
+        repairer.close()
+
+        self.assertEqual(announced, [5] * (MAX_ANNOUNCEMENTS + 1))
+        self.assertEqual(repairer.announcements, MAX_ANNOUNCEMENTS + 1)
+
+    def test_repairer(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_GCM)
+        history = History()
+        history.store(5, b'five')
+        retransmitted = []
+        repairer = Repairer(socket.socket(socket.AF_INET, socket.SOCK_DGRAM), 1, history, retransmitted.extend, crypto)
+        (payload,) = encode_nack(1, 2, [5, 6])
+        self.assertEqual(repairer.handle(frame.encode(frame.CODEC_RAW, payload, crypto, frame.FLAG_NACK)), 1)
+        (payload,) = encode_nack(3, 2, [5])
+        self.assertEqual(repairer.handle(frame.encode(frame.CODEC_RAW, payload, crypto, frame.FLAG_NACK)), 0)
+        # not NACKs, or forged
+        self.assertEqual(repairer.handle(frame.encode(frame.CODEC_RAW, b'data', crypto)), 0)
+        self.assertEqual(repairer.handle(frame.encode(frame.CODEC_RAW, payload, flags=frame.FLAG_NACK)), 0)
+        repairer.close()
+
+        self.assertEqual(retransmitted, [b'five'])
+        self.assertEqual(history.expired, 1)
+
+    def test_is_nack(self):
+        (payload,) = encode_nack(1, 2, [5])
+        self.assertTrue(is_nack(frame.encode(frame.CODEC_RAW, payload, flags=frame.FLAG_NACK)))
+        self.assertFalse(is_nack(frame.encode(frame.CODEC_RAW, payload, flags=frame.FLAG_BATCH)))
+        self.assertFalse(is_nack(b'\x01\x00' * 8))
+
+    @unittest.skipUnless(mmsg.SO_ATTACH_FILTER is not None, 'socket filters not available')
+    def test_nack_filter(self):
+        reader = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        reader.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        reader.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                          struct.pack("4sI", socket.inet_aton('224.1.1.1'), socket.INADDR_ANY))
+        reader.bind(('0.0.0.0', 1258))
+        self.assertTrue(mmsg.attach_filter(reader, NACK_FILTER))
+        reader.settimeout(0.5)
+        writer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        (payload,) = encode_nack(1, 2, [5])
+        nack = frame.encode(frame.CODEC_RAW, payload, flags=frame.FLAG_NACK)
+        for data in (b'legacy', frame.encode(frame.CODEC_RAW, b'data', flags=frame.FLAG_SEQUENCE), b'\xd5', nack):
+            writer.sendto(data, ('224.1.1.1', 1258))
+        received = [reader.recv(2048)]
+        with self.assertRaises(socket.timeout):
+            received.append(reader.recv(2048))
+        writer.close()
+        reader.close()
+
+        self.assertEqual(received, [nack])
+
+
+if __name__ == '__main__':
+    unittest.main()
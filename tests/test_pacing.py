@@ -0,0 +1,79 @@
+import socket
+import time
+import unittest
+from multisock.pacing import TokenBucket, Pacer, PACING_SLEEP, PACING_TXTIME, PACING_MAX_RATE
+
+
+class Test_TokenBucket(unittest.TestCase):
+
+    def test_reserve(self):
+        bucket = TokenBucket(rate=1000, burst=3000)
+        now = bucket.updated
+        # the burst leaves at once
+        self.assertEqual(bucket.reserve(3000, now), now)
+        self.assertAlmostEqual(bucket.reserve(500, now), now + 0.5)
+        self.assertAlmostEqual(bucket.reserve(500, now), now + 1.0)
+        # the refill pays back the debt first
+        self.assertAlmostEqual(bucket.reserve(1000, now + 1.0), now + 2.0)
+        # never more than the burst
+        self.assertEqual(bucket.reserve(3000, now + 100), now + 100)
+        with self.assertRaises(ValueError):
+            TokenBucket(0, 10)
+
+
+class Test_Pacer(unittest.TestCase):
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Pacer()
+        with self.assertRaises(ValueError):
+            Pacer(1000, mode='fast')
+        with self.assertRaises(ValueError):
+            Pacer(packets_per_sec=1000, mode=PACING_MAX_RATE)
+
+    def test_sleep(self):
+        pacer = Pacer(packets_per_sec=1000, burst_packets=5, mode=PACING_SLEEP)
+        begin = time.monotonic()
+        departures = [pacer.schedule(100) for _ in range(25)]
+        elapsed = time.monotonic() - begin
+
+        self.assertEqual(departures, [None] * 25)
+        self.assertGreaterEqual(elapsed, 0.019)
+        self.assertGreater(pacer.delayed, 0)
+        self.assertGreater(pacer.waited, 0)
+
+    def test_bytes_and_packets(self):
+        # the byte rate is the tighter limit
+        pacer = Pacer(bytes_per_sec=100000, packets_per_sec=10000, burst_bytes=1000, burst_packets=1,
+                      mode=PACING_SLEEP)
+        begin = time.monotonic()
+        for _ in range(11):
+            pacer.schedule(1000)
+        self.assertGreaterEqual(time.monotonic() - begin, 0.099)
+
+    def test_txtime(self):
+        pacer = Pacer(packets_per_sec=1000, burst_packets=1, mode=PACING_TXTIME)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            mode = pacer.attach(sock)
+        finally:
+            sock.close()
+        if mode != PACING_TXTIME:
+            self.skipTest('SO_TXTIME not supported')
+        begin = time.monotonic_ns()
+        departures = [pacer.schedule(100) for _ in range(5)]
+        # queued in the kernel ahead of time: no sleep within the horizon
+        self.assertLess(time.monotonic_ns() - begin, 5000000)
+        self.assertEqual(pacer.waited, 0)
+        self.assertAlmostEqual((departures[-1] - departures[0]) / 1e9, 0.004, places=4)
+
+    def test_fallback(self):
+        pacer = Pacer(bytes_per_sec=1000, mode=PACING_MAX_RATE)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.close()
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(pacer.attach(sock), PACING_SLEEP)
+
+
+if __name__ == '__main__':
+    unittest.main()
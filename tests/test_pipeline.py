@@ -0,0 +1,125 @@
+import unittest
+import queue
+import time
+import concurrent.futures
+from unittest.mock import patch
+from multisock import frame
+from multisock.channel import Channel
+from multisock.crypter import Crypter, MODE_GCM, MODE_CHACHA20
+from multisock.pipeline import DecodePipeline, EXECUTOR_PROCESS
+
+
+class Test_DecodePipeline(unittest.TestCase):
+
+    def exchange(self, port, count, **kwargs):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_GCM)
+        sender = Channel('224.1.1.1', port, 2048, '0.0.0.0', crypto)
+        receiver = Channel('224.1.1.1', port, 2048, '0.0.0.0', crypto)
+        received = []
+        try:
+            with DecodePipeline(receiver, **kwargs) as pipeline:
+                sender.send_objects_many({'index': i} for i in range(count))
+                for i in range(count):
+                    received.append(pipeline.get(timeout=5))
+                with self.assertRaises(queue.Empty):
+                    pipeline.get_nowait()
+        finally:
+            sender.close()
+            receiver.close()
+        return received
+
+    def test_thread_pool_keeps_sender_order(self):
+        received = self.exchange(1250, 200, workers=4)
+        self.assertEqual([obj for (obj, addr) in received], [{'index': i} for i in range(200)])
+
+    def test_process_pool(self):
+        received = self.exchange(1251, 20, workers=2, executor=EXECUTOR_PROCESS)
+        self.assertEqual([obj for (obj, addr) in received], [{'index': i} for i in range(20)])
+
+    def test_external_executor_and_raw_data(self):
+        sender = Channel('224.1.1.1', 1252, 2048, '0.0.0.0', framed=True)
+        receiver = Channel('224.1.1.1', 1252, 2048, '0.0.0.0')
+        executor = concurrent.futures.ThreadPoolExecutor(2)
+        try:
+            with DecodePipeline(receiver, executor=executor, objects=False, max_pending=4) as pipeline:
+                sender.send('Hello World')
+                sender.send_object('not text')
+                (data, addr) = pipeline.get(timeout=5)
+                (raw, addr) = pipeline.get(timeout=5)
+            # the external executor is left running
+            self.assertEqual(executor.submit(len, 'abc').result(), 3)
+        finally:
+            executor.shutdown()
+            sender.close()
+            receiver.close()
+
+        self.assertEqual(data, 'Hello World')
+        self.assertTrue(isinstance(raw, bytes))
+
+    def test_decoding_errors_are_counted(self):
+        sender = Channel('224.1.1.1', 1253, 2048, '0.0.0.0')
+        receiver = Channel('224.1.1.1', 1253, 2048, '0.0.0.0')
+        try:
+            with DecodePipeline(receiver, workers=2) as pipeline:
+                sender.send(b'not a pickle')
+                sender.send_object('valid')
+                (obj, addr) = pipeline.get(timeout=5)
+        finally:
+            sender.close()
+            receiver.close()
+
+        self.assertEqual(obj, 'valid')
+        self.assertEqual(pipeline.errors, 1)
+
+    def test_invalid_datagrams_are_skipped(self):
+        sender = Channel('224.1.1.1', 1254, 2048, '0.0.0.0', socket_mode='send-only')
+        receiver = Channel('224.1.1.1', 1254, 2048, '0.0.0.0', framed=True)
+        try:
+            with DecodePipeline(receiver, workers=2) as pipeline:
+                # a frame with an unknown version
+                sender.writer.sendto(frame.HEADER.pack(frame.MAGIC, 9, 0, 0, 0).ljust(16, b'\0'), ('224.1.1.1', 1254))
+                time.sleep(0.2)
+                sender.send_object('valid')
+                (obj, addr) = pipeline.get(timeout=5)
+                # the receive thread stops on a socket error: so does the iteration
+                receiver.reader.close()
+                self.assertEqual(list(pipeline), [])
+        finally:
+            sender.close()
+            receiver.close()
+
+        self.assertEqual(obj, 'valid')
+        # discarded by the channel
+        self.assertEqual(pipeline.errors, 0)
+        self.assertEqual(receiver.stats()['invalid_frames'], 1)
+
+    def test_duplicates_authenticated_by_the_workers(self):
+        crypto = Crypter('pwd', 'passphrase', mode=MODE_CHACHA20)
+        # redundant hubs relaying the same stream
+        hubs = [Channel('224.1.1.1', 1269, 2048, '0.0.0.0', crypto, socket_mode='send-only', dedup=True,
+                        origin=0x1234) for _ in range(2)]
+        receiver = Channel('224.1.1.1', 1269, 2048, '0.0.0.0', crypto, socket_mode='single', dedup=True)
+        try:
+            with patch.object(receiver, '_authentic', wraps=receiver._authentic) as authentic:
+                with DecodePipeline(receiver, workers=2, executor=EXECUTOR_PROCESS) as pipeline:
+                    for i in range(10):
+                        for hub in hubs:
+                            hub.send_object(i)
+                    received = [pipeline.get(timeout=5)[0] for _ in range(10)]
+                    time.sleep(0.2)
+                    with self.assertRaises(queue.Empty):
+                        pipeline.get_nowait()
+        finally:
+            for hub in hubs:
+                hub.close()
+            receiver.close()
+
+        self.assertEqual(received, list(range(10)))
+        self.assertEqual(receiver.stats()['dedup_dropped'], 10)
+        # not on the receive thread
+        authentic.assert_not_called()
+        self.assertFalse(receiver._deferred)
+
+    def test_invalid_executor(self):
+        with self.assertRaises(ValueError):
+            DecodePipeline(None, executor='gpu')
@@ -0,0 +1,96 @@
+import socket
+import threading
+import time
+import unittest
+from multisock.ring import (RingBuffer, BackgroundReader, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST,
+                            OVERFLOW_BLOCK)
+
+ADDR = ('10.0.0.1', 1234)
+
+
+def fill(ring, count, first=0):
+    results = []
+    for i in range(first, first + count):
+        slot, view = ring.acquire()
+        data = b'datagram %d' % i
+        view[:len(data)] = data
+        view.release()
+        results.append(ring.put(slot, len(data), ADDR, i))
+    return results
+
+
+class Test_RingBuffer(unittest.TestCase):
+
+    def test_fifo(self):
+        ring = RingBuffer(8, 64)
+        fill(ring, 3)
+        self.assertEqual(ring.get(), (b'datagram 0', ADDR, 0))
+        fill(ring, 3, 3)
+        self.assertEqual([data for (data, addr, arrival) in ring.get_many(10)],
+                         [b'datagram %d' % i for i in range(1, 6)])
+        self.assertEqual((len(ring), ring.received, ring.high_water, ring.overflows), (0, 6, 5, 0))
+        self.assertIsNone(ring.get(timeout=0.01))
+        self.assertEqual(ring.get_many(10, timeout=0), [])
+
+    def test_drop_oldest(self):
+        ring = RingBuffer(4, 64, OVERFLOW_DROP_OLDEST)
+        self.assertEqual(fill(ring, 6), [True] * 6)
+        self.assertEqual([arrival for (data, addr, arrival) in ring.get_many(10)], [2, 3, 4, 5])
+        self.assertEqual(ring.overflows, 2)
+
+    def test_drop_newest(self):
+        ring = RingBuffer(4, 64, OVERFLOW_DROP_NEWEST)
+        self.assertEqual(fill(ring, 6), [True] * 4 + [False] * 2)
+        self.assertEqual([arrival for (data, addr, arrival) in ring.get_many(10)], [0, 1, 2, 3])
+        self.assertEqual(ring.overflows, 2)
+
+    def test_block(self):
+        ring = RingBuffer(2, 64, OVERFLOW_BLOCK)
+        producer = threading.Thread(target=fill, args=(ring, 5))
+        producer.start()
+        time.sleep(0.05)
+        self.assertEqual(len(ring), 2)
+        received = [ring.get(timeout=1)[2] for _ in range(5)]
+        producer.join()
+        self.assertEqual(received, [0, 1, 2, 3, 4])
+        self.assertEqual(ring.overflows, 0)
+
+    def test_close(self):
+        ring = RingBuffer(2, 64, OVERFLOW_BLOCK)
+        fill(ring, 2)
+        results = []
+        producer = threading.Thread(target=lambda: results.extend(fill(ring, 1)))
+        producer.start()
+        ring.close()
+        producer.join()
+        self.assertEqual(results, [False])
+        # the datagrams queued are still returned
+        self.assertEqual(len(ring.get_many(10)), 2)
+        self.assertIsNone(ring.get())
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            RingBuffer(0)
+        with self.assertRaises(ValueError):
+            RingBuffer(8, overflow='drop-all')
+
+
+class Test_BackgroundReader(unittest.TestCase):
+
+    def test_drain(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        reader = BackgroundReader(receiver, RingBuffer(16, 64))
+        for i in range(10):
+            sender.sendto(b'datagram %d' % i, receiver.getsockname())
+        received = [reader.ring.get(timeout=1)[0] for _ in range(10)]
+        reader.close()
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(received, [b'datagram %d' % i for i in range(10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from collections import namedtuple
+from multisock import frame
+from multisock.serialization import Codec, SchemaCodec, get_codec, register_codec, unregister_codec
+from multisock.exceptions import CodecException
+
+Reading = namedtuple('Reading', ['id', 'temperature'])
+
+
+class Test_Serialization(unittest.TestCase):
+
+    def test_builtin_codecs(self):
+        obj = {'key': 'value', 'list': [1, 2.5, None], 'bool': True}
+        for name in ('pickle', 'marshal', 'json'):
+            codec = get_codec(name)
+            self.assertEqual(codec.decode(codec.encode(obj)), obj)
+        self.assertEqual(get_codec('text').decode(get_codec('text').encode('Hello')), 'Hello')
+        self.assertEqual(get_codec('raw').decode(memoryview(b'Hello')), b'Hello')
+
+    def test_get_codec_by_id_name_instance(self):
+        codec = get_codec('json')
+        self.assertIs(get_codec(frame.CODEC_JSON), codec)
+        self.assertIs(get_codec(codec), codec)
+        with self.assertRaises(CodecException):
+            get_codec('unknown')
+        with self.assertRaises(CodecException):
+            get_codec(200)
+
+    def test_invalid_codec_id(self):
+        with self.assertRaises(CodecException):
+            Codec(256, 'invalid')
+
+    def test_register_conflicts(self):
+        codec = SchemaCodec(100, 'test_conflicts', [('id', 'I')])
+        register_codec(codec)
+        try:
+            # registering the same codec twice is harmless
+            register_codec(codec)
+            with self.assertRaises(CodecException):
+                register_codec(SchemaCodec(100, 'another', [('id', 'I')]))
+            with self.assertRaises(CodecException):
+                register_codec(SchemaCodec(101, 'test_conflicts', [('id', 'I')]))
+            replacement = register_codec(SchemaCodec(100, 'another', [('id', 'H')]), replace=True)
+            self.assertIs(get_codec(100), replacement)
+            with self.assertRaises(CodecException):
+                get_codec('test_conflicts')
+        finally:
+            unregister_codec(100)
+        with self.assertRaises(CodecException):
+            register_codec('json')
+
+    def test_schema_codec(self):
+        codec = SchemaCodec(101, 'reading', [('id', 'I'), ('temperature', 'd')])
+
+        data = codec.encode({'id': 7, 'temperature': 21.5})
+        self.assertEqual(len(data), codec.size)
+        self.assertEqual(codec.decode(data), {'id': 7, 'temperature': 21.5})
+        # objects are encoded by attributes
+        self.assertEqual(codec.encode(Reading(7, 21.5)), data)
+
+    def test_schema_codec_factory_and_single_field(self):
+        codec = SchemaCodec(102, 'reading', [('id', 'I'), ('temperature', 'd')], factory=Reading)
+        self.assertEqual(codec.decode(codec.encode(Reading(1, 2.0))), Reading(1, 2.0))
+
+        single = SchemaCodec(103, 'counter', [('value', 'Q')])
+        self.assertEqual(single.decode(single.encode({'value': 42})), {'value': 42})
+
+    def test_schema_codec_invalid_schema(self):
+        with self.assertRaises(CodecException):
+            SchemaCodec(104, 'empty', [])
+        with self.assertRaises(CodecException):
+            SchemaCodec(104, 'invalid', [('id', 'Z')])
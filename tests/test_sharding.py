@@ -0,0 +1,100 @@
+import unittest
+from multisock.sharding import HashRing, ShardedChannel
+from multisock.crypter import Crypter
+
+SHARDS = ['239.1.1.1', '239.1.1.2', '239.1.1.3', '239.1.1.4']
+KEYS = ['/sensors/%d' % i for i in range(2000)]
+
+
+class Test_HashRing(unittest.TestCase):
+
+    def test_lookup_is_stable_and_balanced(self):
+        ring = HashRing(SHARDS)
+        owners = [ring.lookup(key) for key in KEYS]
+
+        other = HashRing(SHARDS)
+        self.assertEqual(owners, [other.lookup(key) for key in KEYS])
+        for shard in SHARDS:
+            self.assertGreater(owners.count(shard), len(KEYS) / len(SHARDS) / 2)
+
+    def test_adding_a_node_moves_only_its_keys(self):
+        ring = HashRing(SHARDS)
+        before = {key: ring.lookup(key) for key in KEYS}
+        ring.add('239.1.1.5')
+        after = {key: ring.lookup(key) for key in KEYS}
+
+        moved = [key for key in KEYS if before[key] != after[key]]
+        self.assertTrue(all(after[key] == '239.1.1.5' for key in moved))
+        self.assertLess(len(moved), len(KEYS) / 3)
+
+        ring.remove('239.1.1.5')
+        self.assertEqual({key: ring.lookup(key) for key in KEYS}, before)
+
+    def test_weights(self):
+        ring = HashRing({'239.1.1.1': 3, '239.1.1.2': 1})
+        owners = [ring.lookup(key) for key in KEYS]
+
+        self.assertGreater(owners.count('239.1.1.1'), 2 * owners.count('239.1.1.2'))
+
+    def test_invalid_operations(self):
+        ring = HashRing()
+        with self.assertRaises(ValueError):
+            ring.lookup('key')
+        ring.add('239.1.1.1')
+        with self.assertRaises(ValueError):
+            ring.add('239.1.1.1')
+        with self.assertRaises(KeyError):
+            ring.remove('239.1.1.2')
+
+
+class Test_ShardedChannel(unittest.TestCase):
+
+    def test_receivers_get_only_joined_shards(self):
+        crypto = Crypter('pwd', 'passphrase')
+        sender = ShardedChannel(SHARDS, 1261, 2048, '0.0.0.0', crypto)
+        kitchen = ShardedChannel(SHARDS, 1261, 2048, '0.0.0.0', crypto)
+        kitchen.join('/lights/kitchen')
+        # a topic of another shard
+        other = next(key for key in KEYS if sender.shard(key) != sender.shard('/lights/kitchen'))
+
+        sender.send('foreign', topic=other)
+        sender.send_object({'on': True}, topic='/lights/kitchen')
+        sender.send_objects_many([1, 2], key='/lights/kitchen')
+        (obj, addr) = kitchen.recv_object()
+        received = kitchen.recv_objects_many(timeout=0.5)
+
+        sender.close()
+        kitchen.close()
+
+        self.assertEqual(kitchen.joined, {kitchen.shard('/lights/kitchen')})
+        self.assertEqual(obj, {'on': True})
+        self.assertEqual([obj for (obj, addr) in received], [1, 2])
+
+    def test_send_requires_a_key(self):
+        chan = ShardedChannel(SHARDS, 1261, 2048, '0.0.0.0')
+        with self.assertRaises(ValueError):
+            chan.send(b'Hello World')
+        with self.assertRaises(ValueError):
+            chan.join_shard('239.9.9.9')
+        chan.close()
+
+    def test_unsupported_options(self):
+        with self.assertRaises(ValueError):
+            ShardedChannel(SHARDS, 1261, 2048, '0.0.0.0', shared=True)
+        with self.assertRaises(ValueError):
+            ShardedChannel(SHARDS, 1261, 2048, '0.0.0.0', reliable=True)
+
+    def test_remove_shard(self):
+        chan = ShardedChannel(SHARDS, 1261, 2048, '0.0.0.0', socket_mode='single')
+        chan.join_shard('239.1.1.2')
+        chan.remove_shard('239.1.1.2')
+
+        self.assertEqual(chan.joined, set())
+        self.assertNotIn('239.1.1.2', [chan.shard(key) for key in KEYS])
+        self.assertIs(chan.writer, chan.reader)
+        self.assertEqual(str(chan), 'ShardedMulticastCh<3 shards:1261>')
+        chan.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import socket
+import time
+import unittest
+from multisock import shared
+from multisock.ring import RingBuffer
+
+GROUP = ('224.1.1.1', 1265)
+KEY = ('224.1.1.1', 1265, '0.0.0.0')
+
+
+class Test_SharedSocket(unittest.TestCase):
+
+    def setUp(self):
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+
+    def tearDown(self):
+        self.sender.close()
+
+    def test_reference_count(self):
+        first = shared.open_reader(*KEY)
+        second = shared.open_reader(*KEY)
+        self.assertIs(first.shared, second.shared)
+        self.assertEqual(shared.shared_sockets()[KEY], 2)
+        sock = first.shared.sock
+
+        first.close()
+        first.close()
+        self.assertEqual(shared.shared_sockets()[KEY], 1)
+        self.assertNotEqual(sock.fileno(), -1)
+        second.close()
+        self.assertNotIn(KEY, shared.shared_sockets())
+        self.assertEqual(sock.fileno(), -1)
+
+        # a new socket once the last one is closed
+        third = shared.open_reader(*KEY)
+        self.assertIsNot(third.shared, first.shared)
+        third.close()
+
+    def test_fan_out(self):
+        readers = [shared.open_reader(*KEY) for _ in range(3)]
+        rings = [RingBuffer(8, 64), RingBuffer(8, 64), RingBuffer(8, 4)]
+        for (reader, ring) in zip(readers, rings):
+            reader.attach(ring)
+        # not attached: gets nothing
+        idle = shared.open_reader(*KEY)
+
+        for i in range(5):
+            self.sender.sendto(b'datagram %d' % i, GROUP)
+        results = [[], [], []]
+        deadline = time.monotonic() + 5
+        while any(len(result) < 5 for result in results) and time.monotonic() < deadline:
+            for (result, ring) in zip(results, rings):
+                result.extend(data for (data, addr, arrival) in ring.get_many(10, timeout=0.1))
+
+        for reader in readers:
+            reader.close()
+        idle.close()
+        # the thread is stopped once the last reader is closed
+        stats = (idle.shared.received, idle.shared.delivered)
+
+        expected = [b'datagram %d' % i for i in range(5)]
+        self.assertEqual(results[0], expected)
+        self.assertEqual(results[1], expected)
+        # truncated to the slots of the ring
+        self.assertEqual(results[2], [b'data'] * 5)
+        self.assertEqual(stats, (5, 15))
+        # closed by the release
+        self.assertTrue(all(ring.closed for ring in rings))
+
+    def test_timeouts(self):
+        first = shared.open_reader(*KEY)
+        second = shared.open_reader(*KEY)
+        self.assertIsNone(first.gettimeout())
+        first.settimeout(2.5)
+        second.setblocking(False)
+        self.assertEqual((first.gettimeout(), second.gettimeout()), (2.5, 0.0))
+        self.assertFalse(second.getblocking())
+        # the socket options are the ones of the shared socket
+        first.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 16)
+        self.assertEqual(second.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+                         first.shared.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+        self.assertEqual(first.getsockname()[1], 1265)
+        first.close()
+        second.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from multisock.channel import Channel
+from multisock.state import StatePublisher, StateSubscriber, KEYFRAME, DELTA
+
+
+class FakeChannel:
+
+    def __init__(self):
+        self.sent = []
+
+    def send_object(self, obj, topic=None):
+        self.sent.append(obj)
+
+
+class Test_StatePublisher(unittest.TestCase):
+
+    def test_deltas(self):
+        channel = FakeChannel()
+        publisher = StatePublisher(channel, keyframe_interval=3, keyframe_period=60)
+        state = {'name': 'hall', 'temperature': 21.5, 'mode': 'heat', 'fan': 1}
+
+        self.assertTrue(publisher.publish('t1', state))
+        self.assertFalse(publisher.publish('t1', dict(state)))
+        del state['fan']
+        state['temperature'] = 22.0
+        self.assertTrue(publisher.publish('t1', state))
+        self.assertTrue(publisher.publish('t1', dict(state, temperature=22.5)))
+        self.assertTrue(publisher.publish('t1', dict(state, temperature=22.5, mode='cool')))
+        # third update since the keyframe
+        self.assertTrue(publisher.publish('t1', dict(state, temperature=23.0, mode='cool')))
+
+        kinds = [message[0] for message in channel.sent]
+        self.assertEqual(kinds, [KEYFRAME, DELTA, DELTA, DELTA, KEYFRAME])
+        self.assertEqual(channel.sent[0][1:], ('t1', publisher.epoch, 1,
+                                               {'name': 'hall', 'temperature': 21.5, 'mode': 'heat', 'fan': 1}, []))
+        self.assertEqual(channel.sent[1][3:], (2, {'temperature': 22.0}, ['fan']))
+        self.assertEqual(channel.sent[3][3:], (4, {'mode': 'cool'}, []))
+        self.assertEqual(channel.sent[4][3:], (5, {'name': 'hall', 'temperature': 23.0, 'mode': 'cool'}, []))
+        self.assertEqual((publisher.keyframes, publisher.deltas), (2, 3))
+
+    def test_keyframe_period(self):
+        channel = FakeChannel()
+        publisher = StatePublisher(channel, keyframe_period=0)
+
+        publisher.publish('t1', {'temperature': 21.5, 'mode': 'heat'})
+        publisher.publish('t1', {'temperature': 21.5, 'mode': 'heat'})
+        publisher.keyframe()
+        self.assertEqual([message[0] for message in channel.sent], [KEYFRAME] * 3)
+
+    def test_large_delta(self):
+        channel = FakeChannel()
+        publisher = StatePublisher(channel)
+
+        publisher.publish('t1', {'temperature': 21.5, 'mode': 'heat'})
+        publisher.publish('t1', {'temperature': 22.5, 'mode': 'cool'})
+        self.assertEqual([message[0] for message in channel.sent], [KEYFRAME, KEYFRAME])
+
+
+class Test_StateSubscriber(unittest.TestCase):
+
+    def setUp(self):
+        self.channel = FakeChannel()
+        self.publisher = StatePublisher(self.channel, keyframe_interval=4, keyframe_period=60)
+        self.subscriber = StateSubscriber(None)
+        for temperature in range(20, 26):
+            self.publisher.publish('t1', {'temperature': temperature, 'mode': 'heat', 'fan': 1})
+
+    def test_rebuild(self):
+        for message in self.channel.sent:
+            self.assertEqual(self.subscriber.apply(message), 't1')
+
+        self.assertEqual(self.subscriber.get('t1'), {'temperature': 25, 'mode': 'heat', 'fan': 1})
+        self.assertEqual(self.subscriber.gaps, 0)
+        # reordered messages are discarded
+        self.assertIsNone(self.subscriber.apply(self.channel.sent[2]))
+        self.assertIsNone(self.subscriber.apply(self.channel.sent[0]))
+        self.assertEqual(self.subscriber.get('t1')['temperature'], 25)
+
+    def test_gap(self):
+        sent = self.channel.sent
+        self.assertEqual([message[0] for message in sent], [KEYFRAME, DELTA, DELTA, DELTA, DELTA, KEYFRAME])
+        self.subscriber.apply(sent[0])
+        self.subscriber.apply(sent[1])
+        # sent[2] is lost
+        self.assertIsNone(self.subscriber.apply(sent[3]))
+        self.assertTrue(self.subscriber.is_stale('t1'))
+        self.assertEqual(self.subscriber.gaps, 1)
+        self.assertIsNone(self.subscriber.apply(sent[4]))
+        self.assertEqual(self.subscriber.get('t1')['temperature'], 21)
+        self.assertEqual(self.subscriber.apply(sent[5]), 't1')
+        self.assertFalse(self.subscriber.is_stale('t1'))
+        self.assertEqual(self.subscriber.get('t1')['temperature'], 25)
+
+    def test_joining_late_and_restarts(self):
+        # deltas before the first keyframe are not applicable
+        self.assertIsNone(self.subscriber.apply(self.channel.sent[1]))
+        self.assertEqual(len(self.subscriber), 0)
+        self.subscriber.apply(self.channel.sent[5])
+
+        restarted = StatePublisher(self.channel)
+        restarted.publish('t1', {'temperature': 18, 'mode': 'off', 'fan': 0})
+        self.assertEqual(self.subscriber.apply(self.channel.sent[-1]), 't1')
+        self.assertEqual(self.subscriber.get('t1')['mode'], 'off')
+
+    def test_ignored(self):
+        self.assertIsNone(self.subscriber.apply({'on': True}))
+        self.assertIsNone(self.subscriber.apply(('X', 't1', 1, 1, {}, [])))
+        self.assertEqual(self.subscriber.ignored, 2)
+
+    def test_exchange(self):
+        sender = Channel('224.1.1.1', 1277, 2048, '0.0.0.0', socket_mode='send-only', codec='json')
+        receiver = Channel('224.1.1.1', 1277, 2048, '0.0.0.0', socket_mode='single')
+        receiver.reader.settimeout(5)
+        publisher = StatePublisher(sender)
+        subscriber = StateSubscriber(receiver)
+
+        publisher.publish('t1', {'temperature': 21.5, 'mode': 'heat', 'fan': 1})
+        first = subscriber.recv()
+        publisher.publish('t1', {'temperature': 22.0, 'mode': 'heat', 'fan': 1})
+        second = subscriber.recv()
+
+        sender.close()
+        receiver.close()
+
+        self.assertEqual(first[:2], ('t1', {'temperature': 22.0, 'mode': 'heat', 'fan': 1}))
+        self.assertIs(first[1], second[1])
+        self.assertEqual(publisher.deltas, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
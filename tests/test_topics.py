@@ -0,0 +1,58 @@
+import unittest
+from multisock.topics import TopicIndex, validate_pattern
+
+
+class Test_TopicIndex(unittest.TestCase):
+
+    def test_exact_match(self):
+        index = TopicIndex()
+        index.add('/lights/kitchen', 'a')
+
+        self.assertEqual(index.match('/lights/kitchen'), ('a',))
+        self.assertEqual(index.match('/lights/garage'), ())
+        self.assertEqual(index.match('/lights'), ())
+
+    def test_single_level_wildcard(self):
+        index = TopicIndex()
+        index.add('/lights/+', 'a')
+        index.add('/+/kitchen', 'b')
+
+        self.assertEqual(sorted(index.match('/lights/kitchen')), ['a', 'b'])
+        self.assertEqual(index.match('/lights/garage'), ('a',))
+        self.assertEqual(index.match('/lights/kitchen/ceiling'), ())
+
+    def test_multi_level_wildcard(self):
+        index = TopicIndex()
+        index.add('/lights/#', 'a')
+        index.add('#', 'all')
+
+        self.assertEqual(sorted(index.match('/lights')), ['a', 'all'])
+        self.assertEqual(sorted(index.match('/lights/kitchen/ceiling')), ['a', 'all'])
+        self.assertEqual(index.match('/doors/front'), ('all',))
+
+    def test_remove(self):
+        index = TopicIndex()
+        index.add('/lights/+', 'a')
+        index.add('/lights/+', 'b')
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.match('/lights/kitchen'), ('a', 'b'))
+
+        index.remove('/lights/+', 'a')
+        self.assertEqual(index.match('/lights/kitchen'), ('b',))
+        index.remove('/lights/+', 'b')
+        self.assertEqual(index.match('/lights/kitchen'), ())
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index._root.children, {})
+        with self.assertRaises(KeyError):
+            index.remove('/lights/+', 'b')
+
+    def test_invalid_patterns(self):
+        for pattern in ('/lights/#/kitchen', '/lights/kitchen#', '/lights/kit+'):
+            with self.assertRaises(ValueError):
+                validate_pattern(pattern)
+            with self.assertRaises(ValueError):
+                TopicIndex().add(pattern, 'a')
+
+
+if __name__ == '__main__':
+    unittest.main()